@@ -0,0 +1,905 @@
+"""
+Benchmarks for the heavy parts of the tool (loading, preprocessing, ...)
+Uses synthetic fixations, so the benchmarks can run without the real dataset
+
+Run with: python Benchmarks.py <name of benchmark>
+
+:author: Yuri Maas
+"""
+import os
+import shutil
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from Storage import Data
+
+stimulifolder = 'MetroMapsEyeTracking/stimuli/'
+
+
+def synthetic_resolutions():
+    '''
+    Creates a resolution table in the same format as resolution.xlsx
+
+    :author: Yuri Maas
+    :return: DataFrame with the columns 'Place', 'x' and 'y' for the 24 maps
+    '''
+    rng = np.random.RandomState(0)
+    return pd.DataFrame({
+        'Place': ['Map {}'.format(i + 1) for i in range(24)],
+        'x': rng.randint(1200, 1921, 24),
+        'y': rng.randint(900, 1201, 24),
+    })
+
+
+def synthetic_fixations(rows, resolutions, users=40, path_length=60, seed=0):
+    '''
+    Creates a fixation dataset in the same format as all_fixation_data_cleaned_up.csv
+    Every user looks at the puzzles in turn, a scanpath has on average 'path_length' fixations.
+    About 1% of the fixations is outside the map and some stimuli names are misspelled like in the real data.
+
+    :author: Yuri Maas
+    :param rows: The amount of fixations to create
+    :param resolutions: The resolutions of the maps (see synthetic_resolutions)
+    :param users: The amount of different users
+    :param path_length: The average amount of fixations in a scanpath
+    :param seed: Seed for the random generator
+    :return: DataFrame with the fixations
+    '''
+    rng = np.random.RandomState(seed)
+    stimuli = sorted(name for name in os.listdir(stimulifolder) if name[:2].isdigit())
+    # The misspelled names are the names as they are read with the wrong encoding
+    stimuli = [name.encode('utf-8').decode('ISO-8859-1') for name in stimuli]
+
+    # Cut the rows into scanpaths and give every scanpath a user and a puzzle
+    paths = max(rows // path_length, 1)
+    boundaries = np.sort(rng.choice(np.arange(1, rows), paths - 1, replace=False)) if paths > 1 else []
+    path_ids = np.zeros(rows, dtype=int)
+    path_ids[boundaries] = 1
+    path_ids = np.cumsum(path_ids)
+    path_stimuli = rng.randint(0, len(stimuli), paths)
+    path_users = rng.randint(1, users + 1, paths)
+
+    stimulus = np.array(stimuli, dtype=object)[path_stimuli[path_ids]]
+    map_ids = np.array([int(name[:2]) - 1 for name in stimuli])[path_stimuli[path_ids]]
+    res_x = np.asarray(resolutions['x'])[map_ids]
+    res_y = np.asarray(resolutions['y'])[map_ids]
+    # 1% of the fixations is placed outside the map
+    x = (rng.uniform(-0.005, 1.005, rows) * res_x).astype(int)
+    y = (rng.uniform(-0.005, 1.005, rows) * res_y).astype(int)
+
+    return pd.DataFrame({
+        'Timestamp': np.arange(rows) * 10,
+        'StimuliName': stimulus,
+        'FixationIndex': np.arange(rows) - np.searchsorted(path_ids, path_ids),
+        'FixationDuration': rng.randint(50, 1000, rows),
+        'MappedFixationPointX': x,
+        'MappedFixationPointY': y,
+        'user': np.array(['p{}'.format(i) for i in range(users + 1)], dtype=object)[path_users[path_ids]],
+        'description': 'color',
+    })
+
+
+def synthetic_dataset(rows, users=40, path_length=60):
+    '''
+    Creates a Data object from synthetic fixations, written to a temporary folder in the format of the real files
+
+    :author: Yuri Maas
+    :param rows: The amount of fixations
+    :param users: The amount of different users
+    :param path_length: The average amount of fixations in a scanpath
+    :return: Data object
+    '''
+    import tempfile
+    import Storage
+
+    folder = tempfile.mkdtemp()
+    resolutions = synthetic_resolutions()
+    file = os.path.join(folder, 'fixations.csv')
+    synthetic_fixations(rows, resolutions, users, path_length).to_csv(file, sep='\t', index=False, encoding='ISO-8859-1')
+    resolutionfile = Storage.resolutionfile
+    Storage.resolutionfile = os.path.join(folder, 'resolution.xlsx')
+    try:
+        resolutions.to_excel(Storage.resolutionfile, header=False, index=False)
+        return Data(file, cache=False, uploads=None)
+    finally:
+        Storage.resolutionfile = resolutionfile
+
+
+def benchmark_preprocessing(sizes=(10000, 100000, 1000000, 10000000)):
+    '''
+    Measures the time of the cleaning pipeline (Data.preprocess) against the amount of fixations
+
+    :author: Yuri Maas
+    :param sizes: The amounts of fixations to measure
+    '''
+    resolutions = synthetic_resolutions()
+    print('{:>10} {:>10} {:>12} {:>14}'.format('rows', 'kept', 'seconds', 'rows/second'))
+    for rows in sizes:
+        data = synthetic_fixations(rows, resolutions)
+        start = time.perf_counter()
+        clean = Data.preprocess(data, resolutions, 0)
+        seconds = time.perf_counter() - start
+        print('{:>10} {:>10} {:>12.3f} {:>14.0f}'.format(rows, len(clean), seconds, rows / seconds))
+
+
+def benchmark_loading(sizes=(1000000, 10000000)):
+    '''
+    Measures the peak memory (RSS) of loading the dataset without cache, every load runs in its own process.
+    'whole file' reads the whole csv with default types and cleans it at once (like the loader before chunking),
+    'chunked' is Data.load_data. 'modules' is the memory of only importing the modules
+
+    :author: Yuri Maas
+    :param sizes: The amounts of fixations to measure
+    '''
+    import subprocess
+    import tempfile
+
+    loaders = {
+        'modules': 'import Storage',
+        'whole file': 'import Storage; import pandas as pd; '
+                      'data = pd.read_csv(file, sep="\\t", encoding="ISO-8859-1"); '
+                      'resolutions = pd.read_excel(Storage.resolutionfile, header=None, names=["Place", "x", "y"])[:24]; '
+                      'data = Storage.Data.sort_scanpaths(Storage.Data.preprocess(data, resolutions))',
+        'chunked': 'import Storage; data = Storage.Data(file, cache=False, uploads=None)',
+    }
+    # VmHWM is the peak RSS of the process itself (ru_maxrss would include the peak of this process before exec)
+    measure = ('import sys, time; file, resolutions = sys.argv[1:]; start = time.perf_counter(); '
+               'import Storage; Storage.resolutionfile = resolutions; {}; '
+               'peak = [line.split()[1] for line in open("/proc/self/status") if line.startswith("VmHWM")][0]; '
+               'print(time.perf_counter() - start, peak)')
+
+    print('{:>10} {:>14} {:>12} {:>10} {:>12}'.format('rows', 'loader', 'csv (MB)', 'seconds', 'peak (MB)'))
+    for rows in sizes:
+        folder = tempfile.mkdtemp()
+        file = os.path.join(folder, 'fixations.csv')
+        resolutionfile = os.path.join(folder, 'resolution.xlsx')
+        resolutions = synthetic_resolutions()
+        resolutions.to_excel(resolutionfile, header=False, index=False)
+        # Written in parts, so the benchmark itself doesn't need the memory of the whole file
+        for part in range(0, rows, 1000000):
+            synthetic_fixations(min(1000000, rows - part), resolutions, seed=part).to_csv(
+                file, sep='\t', index=False, encoding='ISO-8859-1', mode='a', header=part == 0)
+        for name, loader in loaders.items():
+            output = subprocess.check_output([sys.executable, '-c', measure.format(loader), file, resolutionfile],
+                                             cwd=os.path.dirname(os.path.abspath(__file__)))
+            seconds, peak = output.split()[-2:]
+            print('{:>10} {:>14} {:>12.0f} {:>10.2f} {:>12.0f}'.format(
+                rows, name, os.path.getsize(file) / 2**20, float(seconds), int(peak) / 1024))
+        shutil.rmtree(folder)
+
+
+
+def benchmark_segmentation(sizes=(1000000, 5000000, 10000000)):
+    '''
+    Measures splitting all the fixations of the dataset into scanpaths,
+    as offsets (Functions.get_scanpath_offsets)
+    and as Scanpaths with views on the columns of the data (Functions.get_scanpaths)
+
+    :author: Yuri Maas
+    :param sizes: The amounts of fixations to measure
+    '''
+    import Functions
+
+    resolutions = synthetic_resolutions()
+    print('{:>10} {:>10} {:>14} {:>14}'.format('rows', 'scanpaths', 'offsets (s)', 'scanpaths (s)'))
+    for rows in sizes:
+        data = Data.sort_scanpaths(Data.compact(Data.preprocess(synthetic_fixations(rows, resolutions), resolutions)))
+        start = time.perf_counter()
+        starts, ends = Functions.get_scanpath_offsets(data)
+        offsets = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scanpaths = Functions.get_scanpaths(data)
+        split = time.perf_counter() - start
+        assert len(scanpaths) == len(starts)
+        # Every scanpath is a view on the same float32 column, not a copy
+        assert all(scanpath.x.base is scanpaths[0].x.base for scanpath in scanpaths)
+        print('{:>10} {:>10} {:>14.3f} {:>14.3f}'.format(rows, len(starts), offsets, split))
+
+
+
+def synthetic_scanpaths(paths, length, seed=0):
+    '''
+    Creates scanpaths on a 1920x1200 map, every fixation is close to the one before
+
+    :author: Yuri Maas
+    :param paths: The amount of scanpaths
+    :param length: The amount of fixations in a scanpath
+    :param seed: Seed for the random generator
+    :return: List of Scanpaths, like Data.get_puzzle_scanpaths
+    '''
+    from Storage import Scanpath
+
+    rng = np.random.RandomState(seed)
+    scanpaths = []
+    for i in range(paths):
+        steps = rng.normal(0, 80, (length, 2))
+        steps[0] = rng.uniform(0, 1, 2) * [1920, 1200]
+        points = np.clip(np.cumsum(steps, axis=0), 0, [1920, 1200]).astype(int)
+        scanpaths.append(Scanpath(points[:, 0], points[:, 1], rng.randint(50, 1000, length), np.arange(length),
+                                  'p{}'.format(i + 1), 'synthetic.jpg'))
+    return scanpaths
+
+
+def time_similarity(method, cases):
+    '''
+    Compares the pair by pair comparison (Graphs.compare) with the batched comparison (Graphs.compare_all)
+    For big cases the pair by pair time is estimated from the first rows of the matrix
+
+    :author: Yuri Maas
+    :param method: The comparison method
+    :param cases: List of (name, all_paths, amount of rows to time pair by pair or None for all)
+    '''
+    from Templates import Graphs
+
+    print('{:>18} {:>8} {:>16} {:>14}'.format('case', 'N', 'pairwise (s)', 'batched (s)'))
+    for name, all_paths, rows in cases:
+        length = len(all_paths)
+        rows = length if rows is None else rows
+        start = time.perf_counter()
+        for i in range(rows):
+            for j in range(i, length):
+                Graphs.compare(method, all_paths[i], all_paths[j])
+        # Cells done / cells of the upper triangle
+        pairwise = (time.perf_counter() - start) * (length * (length + 1) / 2) / sum(length - i for i in range(rows))
+
+        start = time.perf_counter()
+        Graphs.compare_all(method, all_paths)
+        batched = time.perf_counter() - start
+        print('{:>18} {:>8} {:>16.3f} {:>14.3f}'.format(name, length, pairwise, batched))
+
+
+def benchmark_bounding_box():
+    '''
+    Bounding box similarity for a puzzle with 40 users and for the ~10k subscanpaths of a scanpath with 141 fixations
+
+    :author: Yuri Maas
+    '''
+    from Storage import Subscanpaths
+
+    time_similarity('Bounding Box', [
+        ('40 users', synthetic_scanpaths(40, 60), None),
+        ('10k subscanpaths', Subscanpaths(synthetic_scanpaths(1, 141)[0]), 100),
+    ])
+
+
+def benchmark_euclidean():
+    '''
+    Euclidean distance similarity for a puzzle with 40 users and for the subscanpaths of scanpaths with 60 and 141 fixations
+
+    :author: Yuri Maas
+    '''
+    from Storage import Subscanpaths
+
+    time_similarity('the Euclidean Distance', [
+        ('40 users', synthetic_scanpaths(40, 60), None),
+        ('1.8k subscanpaths', Subscanpaths(synthetic_scanpaths(1, 60)[0]), 20),
+        ('10k subscanpaths', Subscanpaths(synthetic_scanpaths(1, 141)[0]), 5),
+    ])
+
+
+def benchmark_jaccard():
+    '''
+    Jaccard similarity for a puzzle with 40 users and for the subscanpaths of scanpaths with 60 and 141 fixations
+
+    :author: Yuri Maas
+    '''
+    from Storage import Subscanpaths
+
+    time_similarity('the Jaccard Similarity', [
+        ('40 users', synthetic_scanpaths(40, 60), None),
+        ('1.8k subscanpaths', Subscanpaths(synthetic_scanpaths(1, 60)[0]), 20),
+        ('10k subscanpaths', Subscanpaths(synthetic_scanpaths(1, 141)[0]), 5),
+    ])
+
+
+def benchmark_scanpaths(rows=1000000, pairs=20000):
+    '''
+    Compares the scanpaths of a puzzle as DataFrames (Data.get_puzzle_data) and as Scanpaths (Data.get_puzzle_scanpaths):
+    the time and memory to make them for every puzzle and the time of pair by pair comparisons (Graphs.compare)
+
+    :author: Yuri Maas
+    :param rows: The amount of fixations in the dataset
+    :param pairs: The amount of pairs to compare with every method
+    '''
+    import tracemalloc
+    from Templates import Graphs
+
+    dataset = synthetic_dataset(rows)
+    puzzles = [puzzle['value'] for puzzle in dataset.get_puzzlenames()]
+    print('{:>12} {:>8} {:>12} {:>12} {:>14} {:>14}'.format(
+        'paths', 'amount', 'create (s)', 'memory (MB)', 'euclidean (s)', 'jaccard (s)'))
+    for name, get in [('DataFrames', dataset.get_puzzle_data), ('Scanpaths', dataset.get_puzzle_scanpaths)]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        all_paths = [get(puzzle) for puzzle in puzzles]
+        create = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0] / 2 ** 20
+        tracemalloc.stop()
+
+        paths = all_paths[0]
+        times = []
+        for method in ['the Euclidean Distance', 'the Jaccard Similarity']:
+            start = time.perf_counter()
+            for number in range(pairs):
+                Graphs.compare(method, paths[number % len(paths)], paths[(number // len(paths)) % len(paths)])
+            times.append(time.perf_counter() - start)
+        print('{:>12} {:>8} {:>12.3f} {:>12.1f} {:>14.3f} {:>14.3f}'.format(
+            name, sum(len(paths) for paths in all_paths), create, memory, *times))
+
+
+def benchmark_workers(counts=(1, 2, 4, 8, 16)):
+    '''
+    Measures how the computation of the adjacency matrix scales with the amount of worker processes,
+    for the ~10k subscanpaths of a scanpath with 141 fixations. Checks that the result equals the serial result
+
+    :author: Yuri Maas
+    :param counts: The amounts of workers to measure
+    '''
+    from Storage import Subscanpaths
+    from Templates import Graphs
+
+    all_paths = Subscanpaths(synthetic_scanpaths(1, 141)[0])
+    print('{:>24} {:>8} {:>12} {:>10} {:>10}'.format('method', 'workers', 'seconds', 'speedup', 'identical'))
+    for method in ['Bounding Box', 'the Euclidean Distance']:
+        serial = None
+        for workers in counts:
+            start = time.perf_counter()
+            matrix = Graphs.compare_all(method, all_paths, workers= workers)
+            seconds = time.perf_counter() - start
+            if serial is None:
+                serial = (Graphs.compare_all(method, all_paths), seconds)
+            print('{:>24} {:>8} {:>12.3f} {:>10.2f} {:>10}'.format(
+                method, workers, seconds, serial[1] / seconds, str(np.array_equal(matrix, serial[0]))))
+
+
+def figure_size(figure):
+    '''
+    Serializes a figure the way Dash sends it to the browser
+
+    :author: Yuri Maas
+    :param figure: The figure of a dcc.Graph
+    :return: (amount of bytes, seconds it took)
+    '''
+    import json
+    import plotly
+
+    start = time.perf_counter()
+    payload = json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder)
+    return len(payload.encode('utf-8')), time.perf_counter() - start
+
+
+def benchmark_heatmap(sizes=(100000, 1000000, 5000000), bin_size=20):
+    '''
+    Compares the payload of the heatmap when the browser bins the raw fixations (go.Histogram2d, the old way)
+    with binning on the server (go.Heatmap). Time is building + serializing the figure,
+    the browser has to bin the raw fixations itself on top of that
+
+    :author: Yuri Maas
+    :param sizes: The amounts of fixations in the dataset (a puzzle has about 1/48 of them)
+    :param bin_size: The amount of bins on both axes
+    '''
+    import plotly.graph_objs as go
+    from Templates import Graphs
+
+    print('{:>10} {:>10} {:>14} {:>10} {:>14} {:>10}'.format(
+        'rows', 'puzzle', 'raw (bytes)', 'raw (s)', 'binned (bytes)', 'binned (s)'))
+    for rows in sizes:
+        dataset = synthetic_dataset(rows)
+        puzzle = dataset.get_puzzlenames()[0]['value']
+        width, height = dataset.get_resolution_X(puzzle), dataset.get_resolution_Y(puzzle)
+
+        start = time.perf_counter()
+        fixations = dataset.get_puzzle_fixations(puzzle)
+        raw = {'data': [go.Histogram2d(
+            x=fixations['MappedFixationPointX'].values,
+            y=height - fixations['MappedFixationPointY'].values,
+            xbins=dict(start=0, end=width, size=width / bin_size),
+            ybins=dict(start=0, end=height, size=height / bin_size),
+            zsmooth='fast', zmax=200, opacity=0.6)]}
+        raw_bytes = figure_size(raw)[0]
+        raw_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        binned = Graphs.visual_heatmap(dataset, puzzle, 'def', bin_size).figure
+        binned_bytes = figure_size({'data': binned['data']})[0]
+        binned_seconds = time.perf_counter() - start
+        print('{:>10} {:>10} {:>14} {:>10.3f} {:>14} {:>10.3f}'.format(
+            rows, len(fixations), raw_bytes, raw_seconds, binned_bytes, binned_seconds))
+
+
+def benchmark_hovertext(sizes=(100, 500)):
+    '''
+    Compares the figure of an adjacency matrix of N subscanpaths with a hovertext for every cell (the old way)
+    with the hovertemplate of Graphs.adjacency_figure. Time is building + serializing the figure.
+    The old loop appended every row N times, so its text had N^2 rows of N texts:
+    the size and time of that are the ones of its N distinct rows times N, it doesn't fit in memory for N=500
+
+    :author: Yuri Maas
+    :param sizes: The amounts of rows and columns of the matrix
+    '''
+    import json
+    import plotly
+    from Templates import Graphs
+
+    print('{:>6} {:>16} {:>10} {:>16} {:>14}'.format('N', 'text (bytes)', 'text (s)', 'template (bytes)', 'template (s)'))
+    rng = np.random.RandomState(0)
+    for length in sizes:
+        labels = ['Length: {} from {}'.format(rng.randint(1, 100), i) for i in range(length)]
+        matrix = np.round(rng.uniform(0, 1, (length, length)), 4)
+
+        start = time.perf_counter()
+        figure = Graphs.adjacency_figure(labels, matrix, 'user', 'def', 'Adjacency Matrix')
+        template_bytes = figure_size(figure)[0]
+        template_seconds = time.perf_counter() - start
+
+        # The old hovertext loop
+        start = time.perf_counter()
+        text = []
+        for x in range(length):
+            midterm = []
+            for y in range(length):
+                midterm.append('Similarity of scanpath with {} and scanpath with {} = {}'.format(
+                    labels[x], labels[y], matrix[x, y]))
+                text.append(midterm)
+        build_seconds = time.perf_counter() - start
+        del figure['data'][0]['hovertemplate']
+        text_bytes, text_seconds = figure_size(figure)
+        start = time.perf_counter()
+        # ', ' between the rows
+        row_bytes = sum(len(json.dumps(midterm, cls=plotly.utils.PlotlyJSONEncoder).encode('utf-8')) + 2
+                        for midterm in text[::length])
+        text_bytes += length * row_bytes
+        text_seconds += build_seconds + length * (time.perf_counter() - start)
+        print('{:>6} {:>16} {:>10.3f} {:>16} {:>14.3f}'.format(
+            length, text_bytes, text_seconds, template_bytes, template_seconds))
+
+
+def benchmark_ordering(size=5000, groups=12):
+    '''
+    Times the orderings of Ordering on a size x size similarity matrix of paths in groups,
+    'alphabet (old)' is the sort index comprehension and permutation matrix multiplication it replaced.
+    'group changes' counts the neighbours in the new order that are in different groups (groups - 1 is perfect)
+
+    :author: Yuri Maas
+    :param size: The amount of rows and columns of the matrix
+    :param groups: The amount of groups of similar paths
+    '''
+    from Ordering import Ordering, orderings
+
+    rng = np.random.RandomState(0)
+    group = rng.randint(0, groups, size)
+    matrix = np.where(group[:, None] == group, 0.7, 0.3) + rng.uniform(-0.2, 0.2, (size, size))
+    matrix = np.round((matrix + matrix.T) / 2, 4)
+    labels = ['p{}'.format(i + 1) for i in rng.permutation(size)]
+    group_of = dict(zip(labels, group))
+
+    print('{:>16} {:>10} {:>14}'.format('ordering', 'time (s)', 'group changes'))
+    start = time.perf_counter()
+    user_sort_index = sorted(labels, key=lambda element: int(element.strip('p')))
+    sort_index = [index for user in user_sort_index for index in range(len(user_sort_index)) if user == labels[index]]
+    sort_matrix = np.zeros((size, size))
+    for i in range(size):
+        sort_matrix[sort_index[i], i] = 1
+    np.matmul(matrix[sort_index], sort_matrix)
+    print('{:>16} {:>10.3f} {:>14}'.format('alphabet (old)', time.perf_counter() - start, '-'))
+
+    for ordering in orderings:
+        if ordering == 'no' or ordering not in [option['value'] for option in Ordering.options()]:
+            continue
+        start = time.perf_counter()
+        new_labels, new_matrix = Ordering.reorder(ordering, labels, matrix, 'puzzle')
+        seconds = time.perf_counter() - start
+        new_group = np.array([group_of[label] for label in new_labels])
+        changes = np.count_nonzero(new_group[1:] != new_group[:-1])
+        print('{:>16} {:>10.3f} {:>14}'.format(ordering, seconds, changes))
+
+
+def benchmark_detail(fixations=(60, 141), zoom=300):
+    '''
+    Compares sending the whole adjacency matrix of all subscanpaths of a scanpath (Graphs.adjacency_figure)
+    with the overview of blocks (Graphs.detail_graph) and the part of zoom x zoom cells after zooming in
+    (Graphs.adjacency_detail, the matrix is taken from a Matrix_Cache). Time is building + serializing the figure.
+    The whole matrix is estimated from its first 1000 rows for big matrices
+
+    :author: Yuri Maas
+    :param fixations: The amounts of fixations of the scanpath
+    :param zoom: The amount of rows and columns the user zooms to
+    '''
+    import tempfile
+    from Storage import Matrix_Cache, Subscanpaths
+    from Templates import Graphs
+
+    cache = Matrix_Cache(tempfile.mkdtemp())
+    print('{:>10} {:>8} {:>14} {:>10} {:>16} {:>12} {:>12} {:>10}'.format(
+        'fixations', 'N', 'whole (bytes)', 'whole (s)', 'overview (bytes)', 'overview (s)', 'zoom (bytes)', 'zoom (s)'))
+    for amount in fixations:
+        all_paths = Subscanpaths(synthetic_scanpaths(1, amount)[0])
+        labels = ['Length: {} from {}'.format(len(scan), scan.index[0]) for scan in all_paths]
+        matrix = np.round(Graphs.compare_all('Bounding Box', all_paths), 4)
+        length = len(labels)
+        view = {'aggregate': 'mean', 'colortype': 'def', 'title': 'Adjacency Matrix', 'length': length,
+                'key': Matrix_Cache.key('synthetic', 'user', 'Bounding Box', 'p1', str(amount), 'no')}
+        cache.set(view['key'], labels, matrix)
+
+        start = time.perf_counter()
+        rows = min(length, 1000)
+        whole_bytes = figure_size(Graphs.adjacency_figure(labels[:rows], matrix[:rows], 'user', 'def', 'Adjacency Matrix'))[0]
+        whole_bytes, whole_seconds = whole_bytes * length / rows, (time.perf_counter() - start) * length / rows
+
+        start = time.perf_counter()
+        overview_bytes = figure_size(Graphs.detail_graph(view, labels, matrix).children[0].figure)[0]
+        overview_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        middle = length // 2
+        relayout = {'xaxis.range[0]': middle - 0.5, 'xaxis.range[1]': middle + zoom - 0.5,
+                    'yaxis.range[0]': middle + zoom - 0.5, 'yaxis.range[1]': middle - 0.5}
+        zoom_bytes = figure_size(Graphs.adjacency_detail(None, view, relayout, cache= cache))[0]
+        zoom_seconds = time.perf_counter() - start
+        print('{:>10} {:>8} {:>14.0f} {:>10.3f} {:>16} {:>12.3f} {:>12} {:>10.3f}'.format(
+            amount, length, whole_bytes, whole_seconds, overview_bytes, overview_seconds, zoom_bytes, zoom_seconds))
+
+
+def benchmark_gaze(sizes=(1000000, 5000000), users=100, min_duration=200):
+    '''
+    Compares the gaze plot with SVG traces (Graphs.visual_gaze_plot) with the WebGL gaze plot
+    (Graphs.visual_gaze_plot_fast) with all fixations and without the fixations shorter than min_duration.
+    Build is creating the figure on the server, serialize is turning it into the json that is sent.
+    The time the browser needs to draw it can't be measured here: SVG makes an element per marker, WebGL doesn't
+
+    :author: Yuri Maas
+    :param sizes: The amounts of fixations in the dataset (a puzzle has about 1/48 of them)
+    :param users: The amount of different users
+    :param min_duration: The shortest fixation (in ms) of the decimated plot
+    '''
+    from Templates import Graphs
+
+    print('{:>10} {:>16} {:>8} {:>10} {:>10} {:>14} {:>14}'.format(
+        'rows', 'plot', 'traces', 'points', 'build (s)', 'serialize (s)', 'bytes'))
+    for rows in sizes:
+        dataset = synthetic_dataset(rows, users=users)
+        puzzle = dataset.get_puzzlenames()[0]['value']
+        for name, create in [('svg', lambda: Graphs.visual_gaze_plot(dataset, puzzle)),
+                             ('webgl', lambda: Graphs.visual_gaze_plot_fast(dataset, puzzle)),
+                             ('webgl >= {} ms'.format(min_duration),
+                              lambda: Graphs.visual_gaze_plot_fast(dataset, puzzle, min_duration))]:
+            start = time.perf_counter()
+            figure = create().figure
+            build = time.perf_counter() - start
+            size, serialize = figure_size(figure)
+            print('{:>10} {:>16} {:>8} {:>10} {:>10.3f} {:>14.3f} {:>14}'.format(
+                rows, name, len(figure['data']), sum(len(trace.x) for trace in figure['data']), build, serialize, size))
+
+
+def benchmark_jobs(fixations=100, duplicates=8, small=40):
+    '''
+    Compares computing the adjacency matrix of all subscanpaths of a scanpath in the request itself
+    with submitting it to a Job_Queue: how long the request takes, how often the matrix is computed when
+    'duplicates' requests for it come in at the same time, how long asking for the status takes
+    and how long a small matrix ('small' paths) takes while the big one is computed in the background
+
+    :author: Yuri Maas
+    :param fixations: The amount of fixations of the scanpath
+    :param duplicates: The amount of requests for the same matrix at the same time
+    :param small: The amount of paths of the small matrix
+    '''
+    import tempfile
+    import threading
+    from Jobs import Job_Queue
+    from Storage import Subscanpaths
+    from Templates import Graphs
+
+    all_paths = Subscanpaths(synthetic_scanpaths(1, fixations)[0])
+    small_paths = synthetic_scanpaths(small, 60)
+    method = 'the Euclidean Distance'
+
+    start = time.perf_counter()
+    Graphs.compare_all(method, small_paths)
+    small_idle = time.perf_counter() - start
+    start = time.perf_counter()
+    Graphs.compare_all(method, all_paths)
+    synchronous = time.perf_counter() - start
+
+    computed = []
+    def job(progress):
+        computed.append(len(all_paths))
+        Graphs.compare_all(method, all_paths, progress= progress)
+
+    jobs = Job_Queue(folder= tempfile.mkdtemp())
+    start = time.perf_counter()
+    jobs.submit('matrix', job, 'benchmark')
+    submit = time.perf_counter() - start
+    threads = [threading.Thread(target= jobs.submit, args= ('matrix', job, 'benchmark')) for i in range(duplicates - 1)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    start = time.perf_counter()
+    for i in range(100):
+        jobs.status('matrix')
+    status = (time.perf_counter() - start) / 100
+    start = time.perf_counter()
+    Graphs.compare_all(method, small_paths)
+    small_busy = time.perf_counter() - start
+    while jobs.status('matrix')['state'] in ['queued', 'running']:
+        time.sleep(0.01)
+
+    # Queues on the same folder stand for the processes of the server, they submit the same job at the same time
+    folder = tempfile.mkdtemp()
+    queues = [Job_Queue(threads= 1, folder= folder) for i in range(duplicates)]
+    started = []
+    barrier = threading.Barrier(duplicates)
+    def race(queue):
+        barrier.wait()
+        queue.submit('race', lambda progress: started.append(queue), 'benchmark')
+    threads = [threading.Thread(target= race, args= (queue,)) for queue in queues]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    while any(queue.status('race')['state'] in ['queued', 'running'] for queue in queues if queue.status('race')):
+        time.sleep(0.01)
+    assert len(started) == 1
+
+    print('{:>28} {:>12}'.format('subscanpaths', len(all_paths)))
+    print('{:>28} {:>12.3f}'.format('synchronous request (s)', synchronous))
+    print('{:>28} {:>12.4f}'.format('submit request (s)', submit))
+    print('{:>28} {:>12}'.format('computed for {} requests'.format(duplicates), len(computed)))
+    print('{:>28} {:>12}'.format('started by {} processes'.format(duplicates), len(started)))
+    print('{:>28} {:>12.6f}'.format('status request (s)', status))
+    print('{:>28} {:>12.3f}'.format('small matrix idle (s)', small_idle))
+    print('{:>28} {:>12.3f}'.format('small matrix busy (s)', small_busy))
+
+
+def callback_payload(output, inputs, state=()):
+    '''
+    Creates the request body Dash sends to /_dash-update-component when a callback is triggered
+
+    :author: Yuri Maas
+    :param output: (id, property) of the output
+    :param inputs: List of (id, property, value), the first input is the one that triggered the callback
+    :param state: List of (id, property, value)
+    :return: The body as bytes
+    '''
+    import json
+
+    return json.dumps({
+        'output': '{}.{}'.format(*output),
+        'outputs': {'id': output[0], 'property': output[1]},
+        'inputs': [{'id': i, 'property': prop, 'value': value} for i, prop, value in inputs],
+        'state': [{'id': i, 'property': prop, 'value': value} for i, prop, value in state],
+        'changedPropIds': ['{}.{}'.format(inputs[0][0], inputs[0][1])],
+    }).encode('utf-8')
+
+
+def visualization_payload(puzzle, vis_type, metro_map=None, compare_method=None, adjacency_type=None):
+    '''
+    Creates the request body of the callback of the first panel in Dash.py (the Submit button)
+
+    :author: Yuri Maas
+    :param puzzle: The puzzle to visualize
+    :param vis_type: 'puzzle', 'adj' or 'mm'
+    :param metro_map: 'gaze' or 'attention' in case of 'mm'
+    :param compare_method: The comparison method in case of 'adj'
+    :param adjacency_type: 'puzzle' or 'user' in case of 'adj'
+    :return: The body as bytes
+    '''
+    return callback_payload(('graph1', 'children'), [('Submit', 'n_clicks', 1), ('Input-panels-dropdown', 'value', 1)], [
+        ('Input-add_options-puzzle_dropdown', 'value', puzzle),
+        ('Input-panels-panels', 'value', 0),
+        ('Input-vis_types-types', 'value', vis_type),
+        ('Input-add_options-adjacency', 'value', compare_method),
+        ('Input-add_options-adjacency_color', 'value', 'def'),
+        ('Input-add_options-adjacency_order', 'value', 'no'),
+        ('Input-add_options-adjacency-type', 'value', adjacency_type),
+        ('Input-select_user-dropdown', 'value', None),
+        ('Input-add_options-metro_map', 'value', metro_map),
+        ('Input-add_options-gaze_color', 'value', 'def'),
+        ('Input-add_options-heatbin', 'value', 20),
+        ('Input-add_options-heatweight', 'value', 'count'),
+    ])
+
+
+def benchmark_server(url='http://127.0.0.1:8050', requests=200, concurrency=8, puzzle='03_Bordeaux_S1.jpg'):
+    '''
+    Load test of a running tool (python Server.py or python Dash.py),
+    measures the requests per second of the main callbacks with 'concurrency' clients at the same time
+
+    :author: Yuri Maas
+    :param url: The address of the running tool
+    :param requests: The amount of requests per callback
+    :param concurrency: The amount of clients sending requests at the same time
+    :param puzzle: The puzzle to visualize, has to be in the dataset of the tool
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+    from urllib.request import Request, urlopen
+
+    callbacks = [
+        ('options', callback_payload(('Input-add_options', 'children'), [('Input-vis_types-types', 'value', 'adj')])),
+        ('select user', callback_payload(('Input-select_user', 'children'), [
+            ('Input-add_options-adjacency-type', 'value', 'user'),
+            ('Input-add_options-puzzle_dropdown', 'value', puzzle)])),
+        ('puzzle', visualization_payload(puzzle, 'puzzle')),
+        ('gaze plot', visualization_payload(puzzle, 'mm', metro_map= 'gaze')),
+        ('heatmap', visualization_payload(puzzle, 'mm', metro_map= 'attention')),
+        ('adjacency', visualization_payload(puzzle, 'adj', compare_method= 'Bounding Box', adjacency_type= 'puzzle')),
+    ]
+
+    def send(body):
+        request = Request(url + '/_dash-update-component', data= body, headers= {'Content-Type': 'application/json'})
+        with urlopen(request) as response:
+            return len(response.read())
+
+    print('{:>14} {:>10} {:>14} {:>16}'.format('callback', 'requests', 'requests/s', 'response (bytes)'))
+    with ThreadPoolExecutor(concurrency) as clients:
+        for name, body in callbacks:
+            send(body)
+            start = time.perf_counter()
+            sizes = list(clients.map(send, [body] * requests))
+            seconds = time.perf_counter() - start
+            print('{:>14} {:>10} {:>14.1f} {:>16}'.format(name, requests, requests / seconds, sizes[0]))
+
+
+def benchmark_images(panels=4, switches=10):
+    '''
+    Measures the bytes the image route sends during a scripted session, for a browser without a cache and
+    for a browser that keeps immutable images and revalidates the others with If-None-Match.
+    The session picks a puzzle (thumbnail under the dropdown) and fills all panels with a plot of it, 'switches' times,
+    going back and forth between two puzzles. The first row is the original route (full size JPEGs)
+
+    :author: Yuri Maas
+    :param panels: The amount of panels that are filled with every switch
+    :param switches: The amount of times the puzzle is changed
+    '''
+    import flask
+    from Images import Images
+
+    app = flask.Flask(__name__)
+    app.add_url_rule('/MetroMapsEyeTracking/stimuli/<image_path>.jpg', 'image',
+                     lambda image_path: Images.send('{}.jpg'.format(image_path), flask.request))
+    client = app.test_client()
+    headers = {'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8'}
+
+    puzzles = ['03_Bordeaux_S1.jpg', '01_Antwerpen_S1.jpg']
+    session = []
+    for switch in range(switches):
+        puzzle = puzzles[switch % len(puzzles)]
+        session += [(puzzle, 'thumb')] + [(puzzle, 'panel')] * panels
+
+    def run(urls, browser_cache):
+        '''Returns (requests sent, 304 answers, bytes received)'''
+        cached = {}
+        sent, not_modified, received = 0, 0, 0
+        for url in urls:
+            if url in cached and cached[url][0]:
+                continue
+            request_headers = dict(headers)
+            if url in cached:
+                request_headers['If-None-Match'] = cached[url][1]
+            response = client.get(url, headers= request_headers)
+            sent += 1
+            not_modified += response.status_code == 304
+            received += len(response.data)
+            if browser_cache and response.status_code == 200:
+                cached[url] = ('immutable' in response.headers.get('Cache-Control', ''), response.headers.get('ETag'))
+        return sent, not_modified, received
+
+    original = ['/MetroMapsEyeTracking/stimuli/{}?size=full'.format(puzzle) for puzzle, tier in session]
+    unversioned = ['/MetroMapsEyeTracking/stimuli/{}?size={}'.format(puzzle, tier) for puzzle, tier in session]
+    versioned = [Images.url(puzzle, tier) for puzzle, tier in session]
+    # Create the variants before measuring
+    run(versioned, False)
+
+    # The original route sent the JPEG without headers, so it is measured from the file itself
+    original_bytes = sum(os.path.getsize(os.path.join(stimulifolder, puzzle)) for puzzle, tier in session)
+    print('{:>36} {:>10} {:>10} {:>14}'.format('', 'requests', '304', 'bytes'))
+    print('{:>36} {:>10} {:>10} {:>14}'.format('original route, no browser cache', len(session), 0, original_bytes))
+    for name, urls, browser_cache in [('full size, no browser cache', original, False),
+                                      ('tiers, no browser cache', versioned, False),
+                                      ('tiers, revalidating (no version)', unversioned, True),
+                                      ('tiers, versioned (immutable)', versioned, True)]:
+        print('{:>36} {:>10} {:>10} {:>14}'.format(name, *run(urls, browser_cache)))
+
+    # A stimulus without an image (like an uploaded one) gets a plain url that the route answers with 404
+    missing = Images.url('25_Nowhere_S1.jpg', 'panel')
+    assert missing == '/MetroMapsEyeTracking/stimuli/25_Nowhere_S1.jpg?size=panel'
+    assert client.get(missing, headers= headers).status_code == 404
+
+
+def benchmark_upload(sizes=(1000000, 5000000), upload=10000):
+    '''
+    Compares adding an uploaded file with fixations of one puzzle (Data.add_fixations, which inserts the new rows
+    and only indexes that puzzle again) with putting the data and the new rows together and sorting them again
+    followed by indexing the whole data (the way it was done before)
+
+    :author: Yuri Maas
+    :param sizes: The amounts of fixations in the dataset
+    :param upload: The amount of fixations in the uploaded file
+    '''
+    import io
+
+    print('{:>10} {:>10} {:>14} {:>14} {:>16}'.format('rows', 'upload', 'sort all (s)', 'insert (s)', 'puzzles changed'))
+    for rows in sizes:
+        dataset = synthetic_dataset(rows)
+        puzzles = [puzzle['value'] for puzzle in dataset.get_puzzlenames()]
+        fixations = dataset.get_puzzle_fixations(puzzles[0])
+        fixations = fixations.iloc[np.arange(upload) % len(fixations)].reset_index(drop=True)
+        contents = fixations.drop(columns=['index']).to_csv(sep='\t', index=False).encode('ISO-8859-1')
+        before = {puzzle: dataset.get_fingerprint(puzzle) for puzzle in puzzles}
+
+        # The whole data, in the order of the puzzles
+        data = pd.concat([dataset.get_puzzle_fixations(puzzle) for puzzle in puzzles])
+        start = time.perf_counter()
+        clean = Data.compact(Data.read_fixations(io.BytesIO(contents)))
+        data = Data.sort_scanpaths(Data.concat_fixations([data, clean]))
+        Data.scanpath_offsets(data['StimuliName'], data['user'])
+        sort_all = time.perf_counter() - start
+        del data
+
+        start = time.perf_counter()
+        dataset.add_fixations(contents, persist=False)
+        insert = time.perf_counter() - start
+        changed = sum(dataset.get_fingerprint(puzzle) != before[puzzle] for puzzle in puzzles)
+        print('{:>10} {:>10} {:>14.3f} {:>14.3f} {:>16}'.format(rows, upload, sort_all, insert, changed))
+
+
+def benchmark_panels(rows=1000000):
+    '''
+    Compares the response of a click on Submit when the whole 'Plots' section is sent again (the old way)
+    with sending only the changed panel. Four panels are filled one by one and then changed
+
+    :author: Yuri Maas
+    :param rows: The amount of fixations in the dataset (a puzzle has about 1/48 of them)
+    '''
+    from Templates import Graphs
+
+    dataset = synthetic_dataset(rows)
+    puzzles = [puzzle['value'] for puzzle in dataset.get_puzzlenames()]
+    clicks = [
+        (0, 'adjacency', lambda: Graphs.basic_adjacency(dataset, puzzles[0], 'puzzle', 'Bounding Box', 'def', 'no', None)),
+        (1, 'gaze plot', lambda: Graphs.get_visual_attention_map(dataset, puzzles[0], 'gaze', 'def', 20)),
+        (2, 'heatmap', lambda: Graphs.get_visual_attention_map(dataset, puzzles[0], 'attention', 'def', 20)),
+        (3, 'puzzle', lambda: Graphs.puzzle_image(puzzles[0])),
+        (3, 'heatmap', lambda: Graphs.get_visual_attention_map(dataset, puzzles[1], 'attention', 'def', 40)),
+        (1, 'gaze plot', lambda: Graphs.get_visual_attention_map(dataset, puzzles[1], 'gaze', 'def', 20)),
+        (2, 'puzzle', lambda: Graphs.puzzle_image(puzzles[1])),
+    ]
+    graphs = [None, None, None, None]
+    print('{:>6} {:>6} {:>12} {:>22} {:>22}'.format('click', 'panel', 'graph', 'all panels (bytes)', 'one panel (bytes)'))
+    for click, (panel, name, create) in enumerate(clicks):
+        graphs[panel] = create()
+        print('{:>6} {:>6} {:>12} {:>22} {:>22}'.format(
+            click + 1, panel + 1, name, figure_size(graphs)[0], figure_size(graphs[panel])[0]))
+
+
+benchmarks = {
+    'preprocessing': benchmark_preprocessing,
+    'loading': benchmark_loading,
+    'segmentation': benchmark_segmentation,
+    'bounding_box': benchmark_bounding_box,
+    'euclidean': benchmark_euclidean,
+    'jaccard': benchmark_jaccard,
+    'scanpaths': benchmark_scanpaths,
+    'workers': benchmark_workers,
+    'heatmap': benchmark_heatmap,
+    'hovertext': benchmark_hovertext,
+    'ordering': benchmark_ordering,
+    'detail': benchmark_detail,
+    'gaze': benchmark_gaze,
+    'jobs': benchmark_jobs,
+    'images': benchmark_images,
+    'panels': benchmark_panels,
+    'upload': benchmark_upload,
+    'server': benchmark_server,
+}
+
+if __name__ == '__main__':
+    # The server benchmark needs a running tool, so it only runs when asked for
+    chosen = sys.argv[1:] or [name for name in benchmarks if name != 'server']
+    for name in chosen:
+        print('### {}'.format(name))
+        benchmarks[name]()
@@ -2,20 +2,26 @@
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, MATCH
+from dash.exceptions import PreventUpdate
+import base64
 import flask
 import os
-import time
 
 # My packages
-from Storage import Data, Current_Graphs
+from Storage import Data, Matrix_Cache
 from Templates import Graphs, Layout
+from Images import Images
+from Jobs import Job_Queue
 dataset = Data()
-plots = Current_Graphs()
+matrices = Matrix_Cache()
+jobs = Job_Queue()
 
 # Constants
 imageroute = '/MetroMapsEyeTracking/stimuli/'
 defaultmap = '03_Bordeaux_S1.jpg'
+# Amount of processes used to compute an adjacency matrix (1 = in the callback itself)
+workers = int(os.environ.get('VISUALIZATION_WORKERS', 1))
 
 
 app = dash.Dash()
@@ -48,6 +54,9 @@ app.layout = html.Div([
             dcc.Dropdown(
                 id='Input-add_options-adjacency_order'
             ),
+            dcc.RadioItems(
+                id='Input-add_options-adjacency_detail'
+            ),
             dcc.RadioItems(
                 id='Input-add_options-metro_map'
             ),
@@ -57,6 +66,12 @@ app.layout = html.Div([
             dcc.Slider(
                 id='Input-add_options-heatbin'
             ),
+            dcc.Slider(
+                id='Input-add_options-gaze_duration'
+            ),
+            dcc.RadioItems(
+                id='Input-add_options-heatweight'
+            ),
             dcc.RadioItems(
                 id='Input-add_options-adjacency-type',
             ),
@@ -95,6 +110,10 @@ app.layout = html.Div([
                             html.Button('Upload File')
                         )
                     ),
+                    # Shows how many fixations of the uploaded file are added
+                    html.Div(
+                        id='Input-head-upload-status'
+                    ),
 
                     # What are we saving here????? (Note: It doesn't do anything, not implemented)
                     dcc.Upload(
@@ -113,7 +132,7 @@ app.layout = html.Div([
                     html.Hr(),
                     html.Img(
                         id= 'Company logo',
-                        src= imageroute + 'VisualEyes.jpg',
+                        src= Images.url('VisualEyes.jpg', 'thumb'),
                         title= 'Visual-Eyes\nJust let the user do it',
                         style={
                             'width': '100%'
@@ -212,7 +231,7 @@ app.layout = html.Div([
         children= html.Div(
             id='Visualization',
             style= {'display': 'inline-block'},
-            children= Layout.no_graphs(),
+            children= Layout.panels(),
         ),
     ),
 
@@ -236,6 +255,7 @@ app.layout = html.Div([
 
 
 
+
 """
 Callbacks
 
@@ -247,84 +267,187 @@ and create (real-time) graphs from those options + much more.
 Every callback can only have 1 output and 
 every 'id' (object from the layout above) can only be the output once.
 """
-# Callback to update the visualization
-@app.callback(
-    Output('Visualization', 'children'),
-    [Input('Submit', 'n_clicks')],
-    [State('Input-add_options-puzzle_dropdown', 'value'),
-     State('Input-panels-dropdown', 'value'),
-     State('Input-panels-panels', 'value'),
-     State('Input-vis_types-types', 'value'),
-     State('Input-add_options-adjacency', 'value'),
-     State('Input-add_options-adjacency_color', 'value'),
-     State('Input-add_options-adjacency_order', 'value'),
-     State('Input-add_options-adjacency-type', 'value'),
-     State('Input-select_user-dropdown', 'value'),
-     State('Input-add_options-metro_map', 'value'),
-     State('Input-add_options-gaze_color', 'value'),
-     State('Input-add_options-heatbin', 'value'),
-     ]
-)
-def update_storage(n_clicks, input_puzzle,                  # What puzzle to use
-                   amount_panels, selected_panel,           # Panel selections
-                   vis_type,                                # Type of visualization (Puzzle, Adjacency matrix, Mapping)
-                   compare_method, color_adj, ordering,     # For adjacency matrices
-                   adj_type, input_user,                    # For adjacency matrices
-                   visual_method, color_vis_att, bin_size   # For Metro Maps
-                   ):
+# Callbacks to update the visualization, one for every panel (graph1 - graph4)
+def update_panel(panel):
     '''
-    Updates the visualization based on the input parameters
+    Creates the callback of a single panel, only the selected panel is computed and sent to the browser
 
     :author: Yuri Maas
-    :param n_clicks: number of times the button has been clicked, irrelevant, only used to detect change
-    :param input_puzzle: The (raw) name of the puzzle to use
-    :param amount_panels: The amount of plots the visualization has to use
-    :param selected_panel: Which panel to modify
-    :param vis_type: The type of visualization to put ni the selected panel
-    :param compare_method: In case of adjacency matrix, the comparison method to use
-    :param color_adj: In case of adjacency matrix, the color to use
-    :param ordering: In case of adjacency matrix, the sorting algorithm use to order the matrix
-    :param adj_type: In case of adjacency matrix, the type (puzzle or user) of adjacency matrix
-    :param input_user: In case of adjacency matrix and user type, The user to visualize
-    :param visual_method: In case of visual attention, the type of visual attention map (Gaze, Heatmap)
-    :param color_vis_att: In case of visual attention and heatmap, the color for the heatmap
-    :param bin_size: In case of visual attention and heatmap, the color for the heatmap
-    :return: A layout for the visualization with a certain amount of determined plots
+    :param panel: The panel (0 - 3) the callback updates
+    :return: The callback function
     '''
-    if selected_panel is not None and input_puzzle is not None:
-        plots.reset_graph(selected_panel)
-        time.sleep(0.05)
+    def update_graph(n_clicks, amount_panels,                   # Submit button and amount of panels
+                     input_puzzle,                              # What puzzle to use
+                     selected_panel,                            # Panel selection
+                     vis_type,                                  # Type of visualization (Puzzle, Adjacency matrix, Mapping)
+                     compare_method, color_adj, ordering,       # For adjacency matrices
+                     adj_type, input_user, aggregate,           # For adjacency matrices
+                     visual_method, color_vis_att, bin_size,    # For Metro Maps
+                     heat_weight, min_duration                  # For Metro Maps
+                     ):
+        '''
+        Updates the graph of the panel based on the input parameters
+
+        :author: Yuri Maas
+        :param n_clicks: number of times the button has been clicked, irrelevant, only used to detect change
+        :param amount_panels: The amount of plots the visualization has to use, no amount removes all graphs
+        :param input_puzzle: The (raw) name of the puzzle to use
+        :param selected_panel: Which panel to modify
+        :param vis_type: The type of visualization to put ni the selected panel
+        :param compare_method: In case of adjacency matrix, the comparison method to use
+        :param color_adj: In case of adjacency matrix, the color to use
+        :param ordering: In case of adjacency matrix, the sorting algorithm use to order the matrix
+        :param adj_type: In case of adjacency matrix, the type (puzzle or user) of adjacency matrix
+        :param input_user: In case of adjacency matrix and user type, The user to visualize
+        :param aggregate: In case of a big adjacency matrix, how the blocks of the overview are made (mean, max)
+        :param visual_method: In case of visual attention, the type of visual attention map (Gaze, Heatmap)
+        :param color_vis_att: In case of visual attention and heatmap, the color for the heatmap
+        :param bin_size: In case of visual attention and heatmap, the color for the heatmap
+        :param heat_weight: In case of visual attention and heatmap, whether to count fixations or sum durations
+        :param min_duration: In case of visual attention and fast gaze plot, the shortest fixation that is shown
+        :return: The graph of the panel
+        '''
+        if amount_panels is None:
+            return None
+        triggers = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+        if 'Submit.n_clicks' not in triggers or selected_panel != panel or input_puzzle is None:
+            # Another panel is changed (or only the amount of panels), this panel stays the same
+            raise PreventUpdate
+        # Files can be uploaded to another worker process of the server
+        dataset.load_uploads()
 
-        graph = None
         if vis_type == 'puzzle':
-            graph = Graphs.puzzle_image(input_puzzle)
+            return Graphs.puzzle_image(input_puzzle)
         elif vis_type == 'mm':
-            graph = Graphs.get_visual_attention_map(dataset, input_puzzle, visual_method, color_vis_att, bin_size)
+            return Graphs.get_visual_attention_map(dataset, input_puzzle, visual_method, color_vis_att, bin_size,
+                                                   heat_weight, min_duration)
         elif vis_type == 'adj':
-            graph = Graphs.basic_adjacency(dataset, input_puzzle, adj_type,
-                                           compare_method, color_adj, ordering,
-                                           input_user)
+            return Graphs.basic_adjacency(dataset, input_puzzle, adj_type,
+                                          compare_method, color_adj, ordering,
+                                          input_user, workers, matrices, aggregate, panel, jobs)
+        return None
+    return update_graph
+
+
+for panel in range(4):
+    app.callback(
+        Output('graph{}'.format(panel + 1), 'children'),
+        [Input('Submit', 'n_clicks'),
+         Input('Input-panels-dropdown', 'value')],
+        [State('Input-add_options-puzzle_dropdown', 'value'),
+         State('Input-panels-panels', 'value'),
+         State('Input-vis_types-types', 'value'),
+         State('Input-add_options-adjacency', 'value'),
+         State('Input-add_options-adjacency_color', 'value'),
+         State('Input-add_options-adjacency_order', 'value'),
+         State('Input-add_options-adjacency-type', 'value'),
+         State('Input-select_user-dropdown', 'value'),
+         State('Input-add_options-adjacency_detail', 'value'),
+         State('Input-add_options-metro_map', 'value'),
+         State('Input-add_options-gaze_color', 'value'),
+         State('Input-add_options-heatbin', 'value'),
+         State('Input-add_options-heatweight', 'value'),
+         State('Input-add_options-gaze_duration', 'value'),
+         ]
+    )(update_panel(panel))
+
+
+# Shows the progress of an adjacency matrix that is computed in the background, and the graph once it is done
+@app.callback(
+    [Output({'type': 'adjacency-job', 'panel': MATCH}, 'children'),
+     Output({'type': 'adjacency-job-status', 'panel': MATCH}, 'children')],
+    [Input({'type': 'adjacency-job-interval', 'panel': MATCH}, 'n_intervals')],
+    [State({'type': 'adjacency-job-view', 'panel': MATCH}, 'data')]
+)
+def update_adjacency_job(n_intervals, view):
+    '''
+    Replaces the placeholder of an adjacency matrix by the graph when its job is done,
+    until then only the progress is updated (see Graphs.adjacency_job)
 
-        plots.set_graph(selected_panel,
-                        graph)
+    :author: Yuri Maas
+    :param n_intervals: number of times the interval has fired, irrelevant, only used to poll
+    :param view: The settings of the matrix, stored next to the progress
+    :return: The graph (or the error) and the progress
+    '''
+    if view is None:
+        raise PreventUpdate
+    # Files can be uploaded to another worker process of the server
+    dataset.load_uploads()
+    graph, text = Graphs.adjacency_job(dataset, view, workers, matrices, jobs)
+    if graph is not None:
+        return graph, dash.no_update
+    return dash.no_update, text
 
-    time.sleep(0.05)
-    if amount_panels == 1:
-        return Layout.single_graph(
-            plots.get_graph(0)
-        )
 
-    if amount_panels == 4:
-        return Layout.four_graphs(
-            plots.get_graph(0),
-            plots.get_graph(1),
-            plots.get_graph(2),
-            plots.get_graph(3)
-        )
+# Sends the part of a big adjacency matrix the user zoomed to
+@app.callback(
+    Output({'type': 'adjacency-detail', 'panel': MATCH}, 'figure'),
+    [Input({'type': 'adjacency-detail', 'panel': MATCH}, 'relayoutData')],
+    [State({'type': 'adjacency-detail-view', 'panel': MATCH}, 'data')]
+)
+def update_adjacency_detail(relayout, view):
+    '''
+    Replaces the figure of a big adjacency matrix by the part that is shown after zooming,
+    in full detail if it is small enough (see Graphs.adjacency_detail)
 
-    for i in range(4):
-        plots.reset_graph(i)
-    return Layout.no_graphs()
+    :author: Yuri Maas
+    :param relayout: The relayoutData of the graph (the ranges of the axes after zooming)
+    :param view: The settings of the matrix, stored next to the graph
+    :return: The figure
+    '''
+    if relayout is None or view is None:
+        raise PreventUpdate
+    figure = Graphs.adjacency_detail(dataset, view, relayout, workers, matrices)
+    if figure is None:
+        raise PreventUpdate
+    return figure
+
+
+# Callbacks to show or hide the panels when the amount of panels changes, one for every part of the 'Plots' section
+def update_layout(element):
+    '''
+    Creates the callback that styles a part of the 'Plots' section, the graphs themselves are not sent again
+
+    :author: Yuri Maas
+    :param element: The id of the part (see Layout.panel_style)
+    :return: The callback function
+    '''
+    def update_style(amount_panels):
+        return Layout.panel_style(element, amount_panels)
+    return update_style
+
+
+for element in ['Visualization-empty', 'Visualization-C1', 'Visualization-C1-bottom', 'Visualization-C2']:
+    app.callback(
+        Output(element, 'style'),
+        [Input('Input-panels-dropdown', 'value')]
+    )(update_layout(element))
+
+
+
+# Callback to add the fixations of an uploaded file to the dataset
+@app.callback(
+    Output('Input-head-upload-status', 'children'),
+    [Input('Input-head-upload', 'contents')],
+    [State('Input-head-upload', 'filename')]
+)
+def upload_fixations(contents, filename):
+    '''
+    Adds the fixations of an uploaded tab-separated file (in the format of the dataset) to the dataset,
+    rows that can't be used are rejected (see Data.add_fixations)
+
+    :author: Yuri Maas
+    :param contents: The content of the file, base64 encoded with the content type in front ('data:...;base64,...')
+    :param filename: The name of the uploaded file
+    :return: Text that says how many fixations are added
+    '''
+    if contents is None:
+        return None
+    try:
+        added, rejected = dataset.add_fixations(base64.b64decode(contents.split(',', 1)[1]))
+    except (ValueError, IndexError) as error:
+        return 'Could not read {}: {}'.format(filename, error)
+    return 'Added {} fixations from {} ({} rows rejected)'.format(added, filename, rejected)
 
 
 
@@ -359,6 +482,8 @@ def update_visualization_options(input_type):
     :param input_type: The type of visualization that's desired
     :return: Additional options
     '''
+    # Files can be uploaded to another worker process of the server
+    dataset.load_uploads()
     # adj = Adjacency Matrix
     # mm = Metro Map
     # puzzle = Puzzle
@@ -415,7 +540,7 @@ def update_map_image(input_puzzle):
     '''
     if input_puzzle is None:
         return None
-    return imageroute + input_puzzle
+    return Images.url(input_puzzle, 'thumb')
 
 
 
@@ -472,10 +597,10 @@ Similarity = {}
 # The last 3 lines of code is what run all the code. Allowing it to be used.
 # The host= '0.0.0.0' is used for the tool to be run on the local network.
 # With IP:8050 other people can access the tool if they are on the same network.
+# The size of the image is chosen with ?size= and browsers cache the images (see Images.send)
 @app.server.route('{}<image_path>.jpg'.format(imageroute))
 def serve_image(image_path):
-    image_name = '{}.jpg'.format(image_path)
-    return flask.send_from_directory(os.getcwd() + imageroute, image_name)
+    return Images.send('{}.jpg'.format(image_path), flask.request)
 
 if __name__ == '__main__':
     # Host doesn't matter, it just tells the app to be available in network
@@ -5,8 +5,8 @@ import matplotlib.pyplot as plt
 import sys, os
 from collections import namedtuple
 
-"For the Jaccard_withPackages"
-from sklearn.metrics import jaccard_similarity_score
+from Storage import Data, Scanpath
+from Similarity import Similarity
 
 pd.set_option('display.max_columns', None)
 pd.set_option('display.max_rows', 500)
@@ -20,13 +20,17 @@ Code snippet to import the dataset
 def Jaccard_withPackages(path1, path2):
     """
     Finds the amount of elements of the intersection of path1 and path2
-    (path1[i] == path2[i]) and devides it by the total unmber of elements
+    (path1[i] == path2[i]) and devides it by the total unmber of elements,
+    like sklearn.metrics.jaccard_similarity_score did for 2 lists of labels (removed from sklearn)
 
     :author: Yuri Maas
     :param path1: The integer set of values to be compared with path2
     :param path2: The integer set of values to be compared with path1
     """
-    return jaccard_similarity_score(path1, path2)
+    path1, path2 = np.asarray(path1), np.asarray(path2)
+    if len(path1) != len(path2):
+        raise ValueError("Paths have different lengths: {} and {}".format(len(path1), len(path2)))
+    return np.mean(path1 == path2)
 
 
 def Jaccard(path1, path2):
@@ -38,12 +42,8 @@ def Jaccard(path1, path2):
     :param path1: The integer set of values to be compared with path2
     :param path2: The integer set of values to be compared with path1
     """
-    intersection = 0
-    shortlenth = [len(path1) if len(path1) <= len(path2) else len(path2)]
-    for i in range(shortlenth[0]):
-        if path1[i] == path2[i]:
-            intersection += 1
-    return intersection / shortlenth[0]
+    shortlenth = min(len(path1), len(path2))
+    return np.count_nonzero(np.asarray(path1[:shortlenth]) == np.asarray(path2[:shortlenth])) / shortlenth
 
 
 def compareScanpathNumbers_Jaccard_fast(path1, path2, margin):
@@ -54,60 +54,83 @@ def compareScanpathNumbers_Jaccard_fast(path1, path2, margin):
     :author: Yuri Maas
     :param path1: The integer set of values to be compared with path2
     :param path2: The integer set of values to be compared with path1
+    :param margin: How far path1[i] and path2[i] may be apart to be the same
     """
-    similarity = 0
-    shortlenth = [len(path1) if len(path1) <= len(path2) else len(path2)]
-    for i in range(shortlenth[0]):
-        if abs(path1[i] - path2[i]) < margin:
-            similarity += 1
-    return similarity / shortlenth[0]
+    shortlenth = min(len(path1), len(path2))
+    difference = np.asarray(path1[:shortlenth], dtype=float) - np.asarray(path2[:shortlenth], dtype=float)
+    return np.count_nonzero(np.abs(difference) < margin) / shortlenth
 
 
-def compareScanpaths_Jaccard_fast(path1, path2):
-    if path1[0][2] != path2[0][2]:
-        raise ValueError("Scanpaths are not for the same puzzle")
+def compareScanpaths_Jaccard_fast(path1, path2, dataset):
+    """
+    Compares the X and the Y values of 2 scanpaths with compareScanpathNumbers_Jaccard_fast,
+    the margins are 2% of the resolution of the puzzle (see Similarity.jaccard)
 
-    similarity = 0
-    shortlenth = [len(path1) if len(path1) <= len(path2) else len(path2)]
-    currentRes = resolutions.get_values()[int(path1[0][2][:2]) - 1]
-    marginX = currentRes[1] * 0.02  # Percentage margin X-axis
-    marginY = currentRes[2] * 0.02  # Percentage margin Y-axis 1% ~= 12
+    :author: Yuri Maas
+    :param path1: The scanpath to compare to path2 (Scanpath from get_scanpaths or a DataFrame)
+    :param path2: The scanpath to compare to path1
+    :param dataset: The Data object with the resolutions of the puzzles
+    :return: A similarity value between 0 and 1
+    """
+    puzzle = get_scanpath_puzzle(path1)
+    if puzzle != get_scanpath_puzzle(path2):
+        raise ValueError("Scanpaths are not for the same puzzle")
 
     # Getting the coordinates and using Jaccard on them
     X1, Y1 = get_scanpath_coordinates(path1)
     X2, Y2 = get_scanpath_coordinates(path2)
-    similarity += compareScanpathNumbers_Jaccard_fast(X1, X2, marginX)
-    similarity += compareScanpathNumbers_Jaccard_fast(Y1, Y2, marginY)
-    return similarity / 2
+    return Similarity.jaccard(X1, Y1, X2, Y2, dataset.get_resolution_X(puzzle), dataset.get_resolution_Y(puzzle))
 
 
-def get_scanpaths(data):
+def compareScanpaths_Jaccard_matrix(paths, dataset):
     """
-    Loops over de data and returns the scanpaths from it
+    Compares all pairs of scanpaths of a puzzle at once, the same as compareScanpaths_Jaccard_fast for every pair
+
+    :author: Yuri Maas
+    :param paths: The scanpaths to compare (Scanpaths from get_scanpaths or DataFrames), all of the same puzzle
+    :param dataset: The Data object with the resolutions of the puzzles
+    :return: Symmetric matrix with the similarity of every pair of scanpaths
+    """
+    puzzles = set(get_scanpath_puzzle(path) for path in paths)
+    if len(puzzles) > 1:
+        raise ValueError("Scanpaths are not for the same puzzle")
+    if len(puzzles) == 0:
+        return np.zeros((0, 0))
+    puzzle = puzzles.pop()
+
+    coordinates = [get_scanpath_coordinates(path) for path in paths]
+    lengths = np.array([len(X) for X, Y in coordinates], dtype=int)
+    ends = np.cumsum(lengths)
+    return Similarity.jaccard_matrix(np.concatenate([X for X, Y in coordinates]),
+                                     np.concatenate([Y for X, Y in coordinates]),
+                                     ends - lengths, ends,
+                                     dataset.get_resolution_X(puzzle), dataset.get_resolution_Y(puzzle))
+
+
+def get_scanpath_offsets(data):
+    """
+    Finds where the scanpaths in the data start and end,
+    a scanpath ends where the puzzle or the user differs from the next fixation (see Data.scanpath_offsets)
 
     :author: Yuri Maas
     :param data: The data from which to get the scanpaths from
-    :note: The data has to be preprocessed by removeFixationsOutsideMap
+    :return: starts, ends (arrays with the first and one past the last row of every scanpath)
+    :note: The data has to be sorted by Data.sort_scanpaths, which Data does when loading
     """
-    # Loop over the dataset to find scanpaths
-    current_scanpath = []
-    final_scanpaths = []
-    for i in range(len(data)):
-        current_scanpath.append(data.get_values()[i])
+    return Data.scanpath_offsets(data['StimuliName'], data['user'])
+
 
-        # If the next fixation point belongs to another puzzle,
-        #  the current scanpath is over and a new one should be started
-        # Assumption: The same puzzle is never twice in a row in the data
-        try:
-            if data.get_values()[i][2] != data.get_values()[i + 1][2]:
-                final_scanpaths.append(current_scanpath)
-                current_scanpath = []
+def get_scanpaths(data):
+    """
+    Returns the scanpaths in the data as Scanpaths.
+    Only the X, Y and duration columns are converted, once, to float32 arrays (see Scanpath.split),
+    every scanpath is the slice [start:end] of them at the offsets of get_scanpath_offsets, so nothing is copied per scanpath
 
-        # If an IndexError occurs, the last element tried to read the next,
-        #  so the final scanpath is over
-        except IndexError:
-            final_scanpaths.append(current_scanpath)
-            return final_scanpaths
+    :author: Yuri Maas
+    :param data: The data from which to get the scanpaths from
+    :note: The data has to be preprocessed by removeFixationsOutsideMap and sorted by Data.sort_scanpaths
+    """
+    return Scanpath.split(data, *get_scanpath_offsets(data))
 
 
 def get_scanpath_coordinates(path):
@@ -117,9 +140,21 @@ def get_scanpath_coordinates(path):
     :author: Yuri Maas
     :param path: The scanpath to get the X and Y values from
     """
-    X = [path[i][5] for i in range(len(path))]
-    Y = [path[i][6] for i in range(len(path))]
-    return X, Y
+    if isinstance(path, pd.DataFrame):
+        path = Scanpath.from_frame(path)
+    return path.x, path.y
+
+
+def get_scanpath_puzzle(path):
+    """
+    Returns the puzzle (StimuliName) of a scanpath
+
+    :author: Yuri Maas
+    :param path: The scanpath (Scanpath from get_scanpaths or a DataFrame)
+    """
+    if isinstance(path, pd.DataFrame):
+        return path['StimuliName'].iloc[0]
+    return path.stimulus
 
 
 
@@ -128,24 +163,16 @@ def calculate_overlap(path1, path2):
        calculates the overlap between 2 bouding boxes
 
        :author: Maaike van delft
-       :param path1: a scanpath to compare
-              path2: a scanpath to compare
+       :param path1: a scanpath (Scanpath) to compare
+              path2: a scanpath (Scanpath) to compare
        """
 
     Rect = namedtuple ('Rectangle', 'xmin ymin xmax ymax')
 
-    X, Y = get_scanpath_coordinates(path1)
-    xmin_1 = min(X)
-    xmax_1 = max(X)
-    ymin_1 = min(Y)
-    ymax_1 = max(Y)
+    xmin_1, xmax_1, ymin_1, ymax_1 = path1.get_bounding_box()
     R1 = Rect(xmin_1, ymin_1, xmax_1, ymax_1)
 
-    get_scanpath_coordinates(path2)
-    xmin_2 = min(X)
-    xmax_2 = max(X)
-    ymin_2 = min(Y)
-    ymax_2 = max(Y)
+    xmin_2, xmax_2, ymin_2, ymax_2 = path2.get_bounding_box()
     R2 = Rect(xmin_2, ymin_2, xmax_2, ymax_2)
 
     dx = min(R1.xmax, R2.xmax) - max(R1.xmin, R2.xmin)
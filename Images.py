@@ -0,0 +1,168 @@
+"""
+Smaller versions of the stimuli (metro map) images,
+the originals are 0.5 - 1 MB each and the tool shows them as thumbnails, in panels and as plot backgrounds
+
+Every image gets a JPEG and a WebP variant for every tier in 'image_tiers',
+made on first access (or for all images at once with Images.prepare_all) and stored in 'imagefolder'
+
+:author: Yuri Maas
+"""
+import flask
+import hashlib
+import os
+import threading
+from PIL import Image
+
+# Constants
+stimulifolder = 'MetroMapsEyeTracking/stimuli/'
+imagefolder = 'MetroMapsEyeTracking/cache/images/'
+imageroute = '/MetroMapsEyeTracking/stimuli/'
+# The longest side of the image in pixels for every tier, None keeps the original size
+image_tiers = {
+    'thumb': 400,
+    'panel': 1200,
+    'full': None,
+}
+image_quality = 85
+# Versioned urls never change content, so browsers and proxies may keep them for a year
+cache_age = 365 * 24 * 60 * 60
+
+
+class Images:
+    '''
+    Creates and finds the variants of the stimuli images
+
+    :author: Yuri Maas
+    '''
+    # Only one thread at a time creates variants, so an image isn't made twice by the same process
+    __lock = threading.Lock()
+    # {image_name: (modification time, hash)}
+    __hashes = {}
+
+    @staticmethod
+    def url(image_name, tier= 'full'):
+        '''
+        Returns the url of an image, the route in Dash.py serves the tier that is asked for.
+        The url contains a hash of the image, so a changed image gets a new url and the old one can be cached forever
+
+        :author: Yuri Maas
+        :param image_name: The name of the image in the stimuli folder (with .jpg)
+        :param tier: Where the image is used, one of image_tiers
+        :return: The url of the image, without a hash if the image doesn't exist (the route then answers with 404)
+        '''
+        try:
+            version = Images.get_hash(image_name)
+        except OSError:
+            return '{}{}?size={}'.format(imageroute, image_name, tier)
+        return '{}{}?size={}&v={}'.format(imageroute, image_name, tier, version)
+
+    @staticmethod
+    def get_hash(image_name):
+        '''
+        Returns a hash of the original image and the settings the variants are made with,
+        the file is only read again when it has changed
+
+        :author: Yuri Maas
+        :param image_name: The name of the image in the stimuli folder (with .jpg)
+        :return: The first 12 characters of the hash
+        '''
+        source = os.path.join(stimulifolder, image_name)
+        modified = os.path.getmtime(source)
+        known = Images.__hashes.get(image_name)
+        if known is None or known[0] != modified:
+            content = hashlib.sha1('{} {}'.format(sorted(image_tiers.items(), key=str), image_quality).encode('utf-8'))
+            with open(source, 'rb') as file:
+                content.update(file.read())
+            known = (modified, content.hexdigest()[:12])
+            Images.__hashes[image_name] = known
+        return known[1]
+
+    @staticmethod
+    def send(image_name, request):
+        '''
+        Creates the response of the image route: the tier asked for with ?size=, WebP if the browser accepts it.
+        Answers with 304 Not Modified if the browser already has the image (If-None-Match / If-Modified-Since)
+        and lets versioned urls (see Images.url) be cached forever
+
+        :author: Yuri Maas
+        :param image_name: The name of the image in the stimuli folder (with .jpg)
+        :param request: The flask request
+        :return: The flask response
+        '''
+        tier = request.args.get('size', 'full')
+        if tier not in image_tiers or not os.path.isfile(os.path.join(stimulifolder, image_name)):
+            flask.abort(404)
+        webp = 'image/webp' in request.headers.get('Accept', '')
+        version = Images.get_hash(image_name)
+        response = flask.send_file(os.path.abspath(Images.get_variant(image_name, tier, webp)),
+                                   mimetype= 'image/webp' if webp else 'image/jpeg',
+                                   etag= '{}-{}-{}'.format(version, tier, 'webp' if webp else 'jpeg'),
+                                   conditional= True)
+        response.vary.add('Accept')
+        if request.args.get('v') == version:
+            response.cache_control.public = True
+            response.cache_control.max_age = cache_age
+            response.cache_control.immutable = True
+        else:
+            # Unversioned or outdated url, the browser has to check whether the image has changed
+            response.cache_control.no_cache = True
+        return response
+
+    @staticmethod
+    def get_variant(image_name, tier, webp= False):
+        '''
+        Returns the file of a variant of an image, creates it if it doesn't exist or if the original has changed
+
+        :author: Yuri Maas
+        :param image_name: The name of the image in the stimuli folder (with .jpg)
+        :param tier: One of image_tiers
+        :param webp: Whether to return the WebP variant instead of the JPEG
+        :return: Path to the variant
+        '''
+        source = os.path.join(stimulifolder, image_name)
+        path = os.path.join(imagefolder, tier, os.path.splitext(image_name)[0] + ('.webp' if webp else '.jpg'))
+        if not Images.__is_current(path, source):
+            with Images.__lock:
+                if not Images.__is_current(path, source):
+                    Images.create_variant(source, path, image_tiers[tier], webp)
+        return path
+
+    @staticmethod
+    def create_variant(source, path, size, webp= False):
+        '''
+        Writes a downscaled copy of an image,
+        through a temporary file so other processes never read a half written image
+
+        :author: Yuri Maas
+        :param source: The original image
+        :param path: Where to write the variant
+        :param size: The longest side of the variant in pixels, None for the original size
+        :param webp: Whether to write WebP instead of JPEG
+        '''
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        image = Image.open(source).convert('RGB')
+        if size is not None:
+            image.thumbnail((size, size), Image.LANCZOS)
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        if webp:
+            image.save(temporary, 'WEBP', quality=image_quality, method=6)
+        else:
+            image.save(temporary, 'JPEG', quality=image_quality, optimize=True, progressive=True)
+        os.replace(temporary, path)
+
+    @staticmethod
+    def prepare_all():
+        '''
+        Creates all the variants of all the images in the stimuli folder, so no user has to wait for them
+
+        :author: Yuri Maas
+        '''
+        for image_name in sorted(os.listdir(stimulifolder)):
+            if image_name.endswith('.jpg'):
+                for tier in image_tiers:
+                    Images.get_variant(image_name, tier)
+                    Images.get_variant(image_name, tier, webp= True)
+
+    @staticmethod
+    def __is_current(path, source):
+        return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source)
@@ -0,0 +1,213 @@
+"""
+Background jobs for the computations that can take minutes (adjacency matrices of many (sub)scanpaths),
+the callbacks of Dash.py only submit a job and poll its status, so a request never waits for the computation
+
+Jobs run on a small pool of threads in the process that got the request, the result is written to the Matrix_Cache.
+Every job has a key (the key of the matrix it computes) and a job with the same key as a running job isn't started again.
+The status of a job is also written to a file in 'jobfolder' (again every job_write_interval while it waits or runs),
+so the other processes of the server (see Server.py) can show its progress and don't start it themselves
+
+Settings (environment variables):
+    VISUALIZATION_JOB_THREADS       Amount of jobs a process runs at the same time (default: 2)
+
+:author: Yuri Maas
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Storage import cachefolder
+
+# Constants
+jobfolder = cachefolder + 'jobs/'
+job_threads = int(os.environ.get('VISUALIZATION_JOB_THREADS', 2))
+# The status files of the waiting and running jobs are written again every this many seconds (see __beat)
+job_write_interval = 1
+# A job of another process whose status file hasn't changed for this many seconds is taken as stopped
+job_timeout = 15
+# Finished jobs are forgotten after this many seconds, their results are in the Matrix_Cache
+job_keep = 600
+# Failed jobs (and their status files) are kept this many seconds, after that asking for them starts them again
+job_failed_keep = 30
+
+
+class Job_Queue:
+    '''
+    Runs jobs in the background, at most one job per key at a time, and keeps track of their progress
+
+    A status is a dictionary: {'state': 'queued', 'running', 'done' or 'failed', 'done': #, 'total': #,
+                               'description': text, 'error': text or None, 'other process': bool}
+
+    :author: Yuri Maas
+    '''
+    def __init__(self, threads= job_threads, folder= jobfolder):
+        self.__folder = folder
+        # The threads are only started by the first job, so a server that forks after loading has none to lose
+        self.__pool = ThreadPoolExecutor(max_workers= threads, thread_name_prefix= 'job')
+        self.__jobs = {}
+        self.__lock = threading.Lock()
+        # Like the pool, the heartbeat thread is only started by a job (and stops when there are none)
+        self.__heartbeat = None
+        os.makedirs(folder, exist_ok= True)
+
+    def submit(self, key, function, description= ''):
+        '''
+        Starts a job, unless a job with the same key is already waiting or running (in this or another process)
+
+        :author: Yuri Maas
+        :param key: The key of the job, the key of the matrix it computes
+        :param function: The job, is called with a progress function that takes (done, total)
+        :param description: What the job computes, shown while waiting for it
+        :return: The status of the (new or already existing) job
+        '''
+        with self.__lock:
+            self.__forget()
+            job = self.__jobs.get(key)
+            if job is not None and job['state'] in ['queued', 'running']:
+                return self.__status(job)
+            other = self.__claim(key, description)
+            if other is not None:
+                return other
+            job = {'state': 'queued', 'done': 0, 'total': 0, 'description': description, 'error': None,
+                   'time': time.time(), 'written': 0}
+            self.__jobs[key] = job
+            self.__write(key, job)
+            if self.__heartbeat is None:
+                self.__heartbeat = threading.Thread(target= self.__beat, name= 'job-heartbeat', daemon= True)
+                self.__heartbeat.start()
+        self.__pool.submit(self.__run, key, function)
+        return self.status(key)
+
+    def status(self, key):
+        '''
+        Returns the status of a job of this process, or else of another process (from its status file)
+
+        :author: Yuri Maas
+        :param key: The key of the job
+        :return: The status, None if no process has (or recently had) the job
+        '''
+        with self.__lock:
+            job = self.__jobs.get(key)
+            if job is not None:
+                return self.__status(job)
+        return self.__read(key)
+
+    def get_statistics(self):
+        '''
+        Returns the amount of jobs of this process per state
+
+        :author: Yuri Maas
+        :return: {'queued': #, 'running': #, 'done': #, 'failed': #}
+        '''
+        with self.__lock:
+            states = [job['state'] for job in self.__jobs.values()]
+        return {state: states.count(state) for state in ['queued', 'running', 'done', 'failed']}
+
+    @staticmethod
+    def __status(job):
+        status = {name: job[name] for name in ['state', 'done', 'total', 'description', 'error']}
+        status['other process'] = False
+        return status
+
+    def __run(self, key, function):
+        with self.__lock:
+            job = self.__jobs[key]
+            job['state'] = 'running'
+            self.__write(key, job)
+
+        # The heartbeat writes the progress to the status file
+        def progress(done, total):
+            with self.__lock:
+                job['done'], job['total'] = done, total
+
+        try:
+            function(progress)
+        except Exception as error:
+            with self.__lock:
+                job['state'], job['error'], job['time'] = 'failed', '{}: {}'.format(type(error).__name__, error), time.time()
+                self.__write(key, job)
+            return
+        with self.__lock:
+            job['state'], job['time'] = 'done', time.time()
+        # The result is in the Matrix_Cache now, other processes find it there
+        self.__remove(key)
+
+    def __beat(self):
+        # Writes the status files of the waiting and running jobs again and again,
+        # so the other processes don't take a job that waits or is in one long step as stopped
+        while True:
+            time.sleep(job_write_interval)
+            with self.__lock:
+                active = [(key, job) for key, job in self.__jobs.items() if job['state'] in ['queued', 'running']]
+                if not active:
+                    self.__heartbeat = None
+                    return
+                for key, job in active:
+                    if time.time() - job['written'] >= job_write_interval:
+                        self.__write(key, job)
+
+    def __claim(self, key, description):
+        # Creating the status file only succeeds for one process (O_EXCL), so two processes never both start a job.
+        # The file of a stopped process (or of a failed job that is shown long enough) is removed by __read
+        file = self.__file(key)
+        while True:
+            try:
+                os.close(os.open(file, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return None
+            except FileExistsError:
+                other = self.__read(key)
+                if other is not None:
+                    return other
+                if os.path.exists(file):
+                    # Just created by another process, which hasn't written the status yet
+                    return {'state': 'queued', 'done': 0, 'total': 0, 'description': description, 'error': None,
+                            'other process': True}
+
+    def __file(self, key):
+        return os.path.join(self.__folder, key + '.json')
+
+    def __write(self, key, job):
+        # Written through a temporary file, so other processes never read a half written status
+        job['written'] = time.time()
+        file = self.__file(key)
+        temporary = '{}.{}.{}.tmp'.format(file, os.getpid(), threading.get_ident())
+        with open(temporary, 'w') as status:
+            json.dump({name: job[name] for name in ['state', 'done', 'total', 'description', 'error']}, status)
+        os.replace(temporary, file)
+
+    def __read(self, key):
+        file = self.__file(key)
+        try:
+            age = time.time() - os.path.getmtime(file)
+            with open(file) as status:
+                job = json.load(status)
+        except OSError:
+            return None
+        except ValueError:
+            # Claimed (see __claim) but not written yet
+            job = None
+        if age > (job_failed_keep if job is not None and job['state'] == 'failed' else job_timeout):
+            # A failed job that is shown long enough or a job of a stopped process
+            self.__remove(key)
+            return None
+        if job is None:
+            return None
+        job['other process'] = True
+        return job
+
+    def __remove(self, key):
+        try:
+            os.remove(self.__file(key))
+        except OSError:
+            pass
+
+    def __forget(self):
+        now = time.time()
+        for key, job in list(self.__jobs.items()):
+            if job['state'] == 'failed' and now - job['time'] > job_failed_keep:
+                del self.__jobs[key]
+                self.__remove(key)
+            elif job['state'] == 'done' and now - job['time'] > job_keep:
+                del self.__jobs[key]
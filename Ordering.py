@@ -0,0 +1,223 @@
+"""
+Orderings (seriation) of the rows and columns of the adjacency matrix,
+every ordering returns a permutation that is applied once with fancy indexing
+
+scipy is optional: without it there is no hierarchical clustering ordering
+and the spectral ordering uses a dense eigendecomposition instead of Lanczos
+
+:author: Yuri Maas
+"""
+import numpy as np
+
+try:
+    from scipy.cluster import hierarchy
+    from scipy.sparse.linalg import eigsh
+    from scipy.spatial.distance import squareform
+except ImportError:
+    hierarchy = None
+
+# The orderings with their label in the dropdown
+orderings = {
+    'no': 'No ordering',
+    'alphabet': 'Alphabetical ordering',
+    'cluster': 'Hierarchical clustering',
+    'spectral': 'Spectral ordering',
+    'tsp': 'Shortest path (TSP)',
+}
+# The amount of times the shortest path ordering tries to improve the whole path
+tsp_passes = 3
+
+
+class Ordering:
+    '''
+    Determines the order of the rows and columns of an adjacency matrix,
+    the similarity orderings place similar paths next to each other so groups show up as blocks
+
+    :author: Yuri Maas
+    '''
+    @staticmethod
+    def options():
+        '''
+        Returns the orderings for the dropdown, without the ones that need a missing package
+
+        :author: Yuri Maas
+        :return: [{'label': label, 'value': ordering}]
+        '''
+        return [{'label': label, 'value': ordering} for ordering, label in orderings.items()
+                if ordering != 'cluster' or hierarchy is not None]
+
+    @staticmethod
+    def reorder(ordering, labels, matrix, adj_type):
+        '''
+        Reorders the rows and columns of the adjacency matrix and the labels
+
+        :author: Yuri Maas
+        :param ordering: One of orderings ('no' or unknown orderings keep the order)
+        :param labels: The labels of the axis of the matrix
+        :param matrix: The (symmetric) similarity matrix to reorder
+        :param adj_type: The type of adjacency matrix (puzzle or user)
+        :return: The reordered labels and matrix
+        '''
+        matrix = np.asarray(matrix)
+        if ordering == 'alphabet':
+            order = Ordering.alphabet(labels, adj_type)
+        elif ordering == 'cluster' and hierarchy is not None:
+            order = Ordering.cluster(matrix)
+        elif ordering == 'spectral':
+            order = Ordering.spectral(matrix)
+        elif ordering == 'tsp':
+            order = Ordering.tsp(matrix)
+        else:
+            return labels, matrix
+        return Ordering.apply(order, labels, matrix)
+
+    @staticmethod
+    def apply(order, labels, matrix):
+        '''
+        Applies a permutation to the rows and columns of a matrix and to its labels
+
+        :author: Yuri Maas
+        :param order: The permutation, order[i] is the old position of the new i-th row and column
+        :param labels: The labels of the axis of the matrix
+        :param matrix: The matrix to reorder
+        :return: The reordered labels and matrix
+        '''
+        return [labels[i] for i in order], matrix[np.ix_(order, order)]
+
+    @staticmethod
+    def alphabet(labels, adj_type):
+        '''
+        Orders the labels alphabetically, users (p#) by their number.
+        The sort is stable, so equal labels keep their order
+
+        :author: Yuri Maas
+        :param labels: The labels of the axis of the matrix
+        :param adj_type: The type of adjacency matrix (puzzle or user)
+        :return: The permutation
+        '''
+        if adj_type == 'puzzle':
+            def key(index):
+                return int(labels[index].strip('p'))
+        else:
+            def key(index):
+                return labels[index]
+        return np.array(sorted(range(len(labels)), key=key), dtype=int)
+
+    @staticmethod
+    def distances(matrix):
+        '''
+        Turns a similarity matrix (1 is the same) into a symmetric distance matrix with zeros on the diagonal
+
+        :author: Yuri Maas
+        :param matrix: The similarity matrix
+        :return: The distance matrix
+        '''
+        distance = 1 - np.asarray(matrix, dtype=float)
+        distance += distance.T
+        distance /= 2
+        np.clip(distance, 0, None, out=distance)
+        np.fill_diagonal(distance, 0)
+        return distance
+
+    @staticmethod
+    def cluster(matrix):
+        '''
+        Orders the paths like the leaves of an average linkage hierarchical clustering (needs scipy)
+
+        :author: Yuri Maas
+        :param matrix: The similarity matrix
+        :return: The permutation
+        '''
+        if len(matrix) < 3:
+            return np.arange(len(matrix))
+        condensed = squareform(Ordering.distances(matrix), checks=False)
+        return hierarchy.leaves_list(hierarchy.linkage(condensed, method='average'))
+
+    @staticmethod
+    def spectral(matrix):
+        '''
+        Orders the paths by the Fiedler vector of the similarity graph:
+        the eigenvector of the second largest eigenvalue of the normalized similarity matrix D^-1/2 W D^-1/2,
+        which is the one of the second smallest eigenvalue of the normalized Laplacian
+
+        :author: Yuri Maas
+        :param matrix: The similarity matrix
+        :return: The permutation
+        '''
+        if len(matrix) < 3:
+            return np.arange(len(matrix))
+        weights = np.clip(np.asarray(matrix, dtype=float), 0, None)
+        weights += weights.T
+        weights /= 2
+        np.fill_diagonal(weights, 0)
+        scale = 1 / np.sqrt(np.maximum(weights.sum(axis=1), np.finfo(float).tiny))
+        weights *= scale[:, None]
+        weights *= scale
+        if hierarchy is not None:
+            values, vectors = eigsh(weights, k=2, which='LA')
+        else:
+            values, vectors = np.linalg.eigh(weights)
+        # Back from the normalized matrix to the Laplacian D - W, the eigenvalues are ascending
+        fiedler = vectors[:, -2] * scale
+        return np.argsort(fiedler, kind='stable')
+
+    @staticmethod
+    def tsp(matrix, passes= tsp_passes):
+        '''
+        Orders the paths as a short path through all of them (an open travelling salesman path),
+        first greedy to the most similar unvisited path and then improved with 2-opt
+
+        :author: Yuri Maas
+        :param matrix: The similarity matrix
+        :param passes: The amount of 2-opt passes over the whole path
+        :return: The permutation
+        '''
+        distance = Ordering.distances(matrix)
+        length = len(distance)
+        if length < 3:
+            return np.arange(length)
+
+        # Start at the path that is the least similar to the others, it is likely to be an end of the path
+        order = np.empty(length, dtype=int)
+        order[0] = np.argmax(distance.sum(axis=1))
+        visited = np.zeros(length, dtype=bool)
+        visited[order[0]] = True
+        for step in range(1, length):
+            candidates = np.where(visited, np.inf, distance[order[step - 1]])
+            order[step] = np.argmin(candidates)
+            visited[order[step]] = True
+        return Ordering.two_opt(distance, order, passes)
+
+    @staticmethod
+    def two_opt(distance, order, passes= tsp_passes):
+        '''
+        Shortens an open path by reversing parts of it: reversing order[i + 1:j + 1] replaces the edges
+        (order[i], order[i + 1]) and (order[j], order[j + 1]) by (order[i], order[j]) and (order[i + 1], order[j + 1]).
+        For every i the gains of all j are computed at once and the best one is taken
+
+        :author: Yuri Maas
+        :param distance: The distance matrix
+        :param order: The path to improve
+        :param passes: The maximum amount of passes over the whole path
+        :return: The improved path
+        '''
+        order = np.array(order, dtype=int)
+        length = len(order)
+        for iteration in range(passes):
+            improved = False
+            for i in range(length - 2):
+                first, second = order[i], order[i + 1]
+                ends = order[i + 2:]
+                # The node after every end, the last end has none and loses no edge
+                after = np.append(order[i + 3:], -1)
+                removed = distance[first, second] + np.where(after >= 0, distance[ends, after], 0)
+                added = distance[first, ends] + np.where(after >= 0, distance[second, after], 0)
+                gains = removed - added
+                best = int(np.argmax(gains))
+                if gains[best] > 1e-12:
+                    j = i + 2 + best
+                    order[i + 1:j + 1] = order[i + 1:j + 1][::-1].copy()
+                    improved = True
+            if not improved:
+                break
+        return order
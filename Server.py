@@ -0,0 +1,59 @@
+"""
+Production server for the tool, runs the Dash app under gunicorn with several worker processes
+instead of the Flask development server (Dash.py), which serves one request at a time and loads the dataset twice
+
+The app (and with it the dataset) is loaded once in the master process before the workers are forked,
+the workers share the preprocessed dataset copy-on-write and the numeric columns are memory-mapped from the cache,
+so the operating system keeps only one copy of them in memory
+
+Run with: python Server.py
+Settings (environment variables):
+    VISUALIZATION_SERVER_WORKERS    Amount of worker processes (default: amount of cpu's)
+    VISUALIZATION_SERVER_THREADS    Amount of threads per worker (default: 4)
+    VISUALIZATION_SERVER_BIND       Address to listen on (default: 0.0.0.0:8050, available in the network)
+
+:author: Yuri Maas
+"""
+import multiprocessing
+import os
+from gunicorn.app.base import BaseApplication
+
+# Constants
+server_workers = int(os.environ.get('VISUALIZATION_SERVER_WORKERS', multiprocessing.cpu_count()))
+server_threads = int(os.environ.get('VISUALIZATION_SERVER_THREADS', 4))
+server_bind = os.environ.get('VISUALIZATION_SERVER_BIND', '0.0.0.0:8050')
+
+
+class Server(BaseApplication):
+    '''
+    Gunicorn application that serves the Flask server of the Dash app
+
+    :author: Yuri Maas
+    '''
+    def __init__(self, workers= server_workers, threads= server_threads, bind= server_bind):
+        self.__options = {
+            'bind': bind,
+            'workers': workers,
+            'threads': threads,
+            'worker_class': 'gthread',
+            # Load the app (and the dataset) before forking, so the workers share it
+            'preload_app': True,
+            # Adjacency matrices of subscanpaths can take a while
+            'timeout': 300,
+        }
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.__options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from Dash import app
+        from Images import Images
+        # Create the smaller images before forking, so the workers don't all make them on first access
+        Images.prepare_all()
+        return app.server
+
+
+if __name__ == '__main__':
+    Server().run()
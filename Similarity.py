@@ -0,0 +1,405 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+from Storage import Scanpath, Subscanpaths
+
+# The maximum amount of memory (in bytes) the temporary arrays of a similarity matrix computation may use
+max_memory = 256 * 2 ** 20
+# The margin of the Jaccard similarity as part of the width and height of the map, 2% ~= 38 pixels on a 1920 wide map
+jaccard_margin = 0.02
+
+
+class Similarity:
+    '''
+    Class to store the batched similarity computations,
+    these compute the similarity of all the pairs of scanpaths at once instead of pair by pair.
+    The results are the same as the compare functions in Graphs
+
+    :author: Yuri Maas
+    '''
+    @staticmethod
+    def bounding_boxes(all_paths):
+        '''
+        Determines the bounding box of every path in one pass over the coordinates.
+        For subscanpaths the boxes are the running minimum and maximum from every start fixation,
+        so the n(n+1)/2 boxes only take n passes over the scanpath
+
+        :author: Yuri Maas
+        :param all_paths: List of Scanpaths (or DataFrames) or a Subscanpaths object
+        :return: xmin, xmax, ymin, ymax (arrays with one value per path)
+        '''
+        if len(all_paths) == 0:
+            return tuple(np.zeros(0) for i in range(4))
+
+        if isinstance(all_paths, Subscanpaths):
+            x = np.asarray(all_paths.get_column('MappedFixationPointX'), dtype=float)
+            y = np.asarray(all_paths.get_column('MappedFixationPointY'), dtype=float)
+            xmin, xmax, ymin, ymax = [], [], [], []
+            for start in range(len(x)):
+                # The boxes of the subscanpaths [start:start + 1], [start:start + 2], ..., [start:n]
+                xmin.append(np.minimum.accumulate(x[start:]))
+                xmax.append(np.maximum.accumulate(x[start:]))
+                ymin.append(np.minimum.accumulate(y[start:]))
+                ymax.append(np.maximum.accumulate(y[start:]))
+            return np.concatenate(xmin), np.concatenate(xmax), np.concatenate(ymin), np.concatenate(ymax)
+
+        # Scanpaths remember their box
+        if all(isinstance(path, Scanpath) for path in all_paths):
+            return tuple(np.array(box, dtype=float) for box in zip(*[path.get_bounding_box() for path in all_paths]))
+
+        # Paths after each other, the boxes are the minimum and maximum of every segment
+        starts = np.cumsum([0] + [len(path) for path in all_paths[:-1]])
+        x = np.concatenate([np.asarray(path['MappedFixationPointX'], dtype=float) for path in all_paths])
+        y = np.concatenate([np.asarray(path['MappedFixationPointY'], dtype=float) for path in all_paths])
+        return (np.minimum.reduceat(x, starts), np.maximum.reduceat(x, starts),
+                np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts))
+
+    @staticmethod
+    def bounding_box_matrix(boxes, memory= None, progress= None):
+        '''
+        Calculates the bounding box overlap (intersection over union) of all pairs of boxes.
+        Same calculation as Graphs.adjcompare_bounding_box, but for a block of rows at once
+
+        :author: Yuri Maas
+        :param boxes: xmin, xmax, ymin, ymax (see bounding_boxes)
+        :param memory: The maximum amount of memory for the temporary arrays, max_memory if None
+        :param progress: Function that is called with (done, total) after every block, None to not report
+        :return: Matrix with the similarity of every pair of boxes
+        '''
+        xmin, xmax, ymin, ymax = boxes
+        length = len(xmin)
+        area = (xmax - xmin) * (ymax - ymin)
+        matrix = np.zeros((length, length))
+        # About 8 temporary arrays of 8 bytes per cell for every row in a block
+        rows = Similarity.block_rows(length, 64, memory)
+        for start in range(0, length, rows):
+            block = slice(start, start + rows)
+            # The box of the overlap of the boxes
+            dx = np.minimum(xmax[block, None], xmax) - np.maximum(xmin[block, None], xmin)
+            dy = np.minimum(ymax[block, None], ymax) - np.maximum(ymin[block, None], ymin)
+            overlap_area = dx * dy
+            # The total area of 2 rectangles is the area of 1 + (The area of the other - the overlapping part)
+            totalarea = area[block, None] + area - overlap_area
+            with np.errstate(divide= 'ignore', invalid= 'ignore'):
+                matrix[block] = np.where((dx >= 0) & (dy >= 0) & (totalarea != 0), overlap_area / totalarea, 0)
+            if progress is not None:
+                progress(min(start + rows, length), length)
+        return matrix
+
+    @staticmethod
+    def path_ranges(all_paths):
+        '''
+        Puts the coordinates of all the paths in shared arrays,
+        every path is a range [start:end] of those arrays.
+        For subscanpaths the shared arrays are the scanpath itself, so the ranges overlap
+
+        :author: Yuri Maas
+        :param all_paths: List of Scanpaths (or DataFrames) or a Subscanpaths object
+        :return: x, y, starts, ends
+        '''
+        if isinstance(all_paths, Subscanpaths):
+            starts, ends = all_paths.get_ranges()
+            return (np.asarray(all_paths.get_column('MappedFixationPointX'), dtype=float),
+                    np.asarray(all_paths.get_column('MappedFixationPointY'), dtype=float),
+                    starts, ends)
+
+        lengths = np.array([len(path) for path in all_paths], dtype=int)
+        ends = np.cumsum(lengths)
+        x = [np.asarray(path['MappedFixationPointX'], dtype=float) for path in all_paths]
+        y = [np.asarray(path['MappedFixationPointY'], dtype=float) for path in all_paths]
+        return np.concatenate(x + [np.zeros(0)]), np.concatenate(y + [np.zeros(0)]), ends - lengths, ends
+
+    @staticmethod
+    def euclidean_matrix(x, y, starts, ends, max_X, max_Y, memory= None, progress= None):
+        '''
+        Calculates the euclidean distance similarity (see Graphs.adjcompare_euc_dist) of all pairs of paths.
+        For every point the distance to the closest point of every path is determined,
+        summing those over the points of a path gives the total distance from one path to another.
+        The columns of the matrix are done in blocks, so the memory stays below 'memory'
+
+        :author: Annelies van de Wetering & Yuri Maas
+        :param x: The x coordinates of all the paths (see path_ranges)
+        :param y: The y coordinates of all the paths
+        :param starts: The start of every path in x and y
+        :param ends: The end of every path in x and y
+        :param max_X: The width of the map
+        :param max_Y: The height of the map
+        :param memory: The maximum amount of memory for the temporary arrays, max_memory if None
+        :param progress: Function that is called with (done, total) after every block, None to not report
+        :return: Matrix with the similarity of every pair of paths
+        '''
+        points = len(x)
+        length = len(starts)
+        totals = np.zeros((length, length))
+        # Per column: the closest distances, their cumulative sums and the distances of a row block
+        columns = Similarity.block_rows(2 * points + length, 8 * 3, memory)
+        for start in range(0, length, columns):
+            block = slice(start, start + columns)
+            closest = Similarity.closest_distances(x, y, starts[block], ends[block], memory)
+            cumulative = np.zeros((points + 1, closest.shape[1]))
+            np.cumsum(closest, axis= 0, out= cumulative[1:])
+            # totals[i, j] = the sum of the distances from the points of path i to the closest point of path j
+            totals[:, block] = cumulative[ends] - cumulative[starts]
+            if progress is not None:
+                progress(min(start + columns, length), length)
+
+        lengths = ends - starts
+        m = np.power(np.power(max_X, 2) + np.power(max_Y, 2), 0.5)  # calculate maximum possible distance!
+        return 1 - 1 / ((lengths[:, None] + lengths) * m) * (totals + totals.T)
+
+    @staticmethod
+    def closest_distances(x, y, starts, ends, memory= None):
+        '''
+        Determines for every point the distance to the closest point of every path.
+        The paths with the same start share one running minimum over the points from that start
+
+        :author: Yuri Maas
+        :param x: The x coordinates of all the points
+        :param y: The y coordinates of all the points
+        :param starts: The start of every path in x and y
+        :param ends: The end of every path in x and y
+        :param memory: The maximum amount of memory for the temporary arrays, max_memory if None
+        :return: Matrix with a row per point and a column per path
+        '''
+        closest = np.zeros((len(x), len(starts)))
+        for start in np.unique(starts):
+            paths = np.flatnonzero(starts == start)
+            end = ends[paths].max()
+            # Rows of points at once, 4 temporary arrays per distance
+            rows = Similarity.block_rows(end - start, 8 * 4, memory)
+            for row in range(0, len(x), rows):
+                block = slice(row, row + rows)
+                distx = np.power(x[block, None] - x[start:end], 2)
+                disty = np.power(y[block, None] - y[start:end], 2)
+                running = np.minimum.accumulate(np.power(distx + disty, 0.5), axis= 1)
+                closest[block, paths] = running[:, ends[paths] - 1 - start]
+        return closest
+
+    @staticmethod
+    def jaccard(x1, y1, x2, y2, max_X, max_Y):
+        '''
+        Calculates the Jaccard similarity of 2 paths: the part of the fixations (up to the length of the shortest path)
+        where the n-th fixations of both paths are less than the margin apart, for X and Y separately
+
+        :author: Yuri Maas
+        :param x1: The x coordinates of path1
+        :param y1: The y coordinates of path1
+        :param x2: The x coordinates of path2
+        :param y2: The y coordinates of path2
+        :param max_X: The width of the map, the margin of X is jaccard_margin of it
+        :param max_Y: The height of the map, the margin of Y is jaccard_margin of it
+        :return: A similarity value between 0 and 1
+        '''
+        x1, y1, x2, y2 = [np.asarray(coordinates, dtype=float) for coordinates in (x1, y1, x2, y2)]
+        shortest = min(len(x1), len(x2))
+        if shortest == 0:
+            return 0
+        matches = (np.count_nonzero(np.abs(x1[:shortest] - x2[:shortest]) < max_X * jaccard_margin) +
+                   np.count_nonzero(np.abs(y1[:shortest] - y2[:shortest]) < max_Y * jaccard_margin))
+        return matches / (2 * shortest)
+
+    @staticmethod
+    def jaccard_matrix(x, y, starts, ends, max_X, max_Y, memory= None, progress= None):
+        '''
+        Calculates the Jaccard similarity (see jaccard) of all pairs of paths
+
+        :author: Yuri Maas
+        :param x: The x coordinates of all the paths (see path_ranges)
+        :param y: The y coordinates of all the paths
+        :param starts: The start of every path in x and y
+        :param ends: The end of every path in x and y
+        :param max_X: The width of the map
+        :param max_Y: The height of the map
+        :param memory: The maximum amount of memory for the temporary arrays, max_memory if None
+        :param progress: Function that is called with (done, total) after every block, None to not report
+        :return: Matrix with the similarity of every pair of paths
+        '''
+        paths = np.arange(len(starts))
+        return Similarity.jaccard_block(x, y, starts, ends, paths, paths, max_X, max_Y, memory, progress)
+
+    @staticmethod
+    def jaccard_block(x, y, starts, ends, rows, columns, max_X, max_Y, memory= None, progress= None):
+        '''
+        Calculates the Jaccard similarity of the row paths with the column paths.
+        The matches are counted once for every pair of distinct starts and summed over the fixations,
+        the similarity of 2 paths is then the count at the length of the shortest one.
+        Subscanpaths with the same start share those counts, so the n(n+1)/2 subscanpaths only need n starts
+
+        :author: Yuri Maas
+        :param x: The x coordinates of all the paths (see path_ranges)
+        :param y: The y coordinates of all the paths
+        :param starts: The start of every path in x and y
+        :param ends: The end of every path in x and y
+        :param rows: The numbers of the row paths
+        :param columns: The numbers of the column paths
+        :param max_X: The width of the map
+        :param max_Y: The height of the map
+        :param memory: The maximum amount of memory for the temporary arrays, max_memory if None
+        :param progress: Function that is called with (done, total) after every block, None to not report
+        :return: Matrix with a row per row path and a column per column path
+        '''
+        lengths = ends - starts
+        row_starts, row_paths = np.unique(starts[rows], return_inverse= True)
+        column_starts, column_paths = np.unique(starts[columns], return_inverse= True)
+        # The coordinates from every start, NaN after the end of the longest path with that start
+        longest = int(lengths.max()) if len(lengths) else 0
+        padded = []
+        for unique, numbers in ((row_starts, rows), (column_starts, columns)):
+            reach = np.zeros(len(unique), dtype=int)
+            np.maximum.at(reach, np.searchsorted(unique, starts[numbers]), lengths[numbers])
+            offsets = np.arange(longest)
+            inside = offsets < reach[:, None]
+            index = np.where(inside, unique[:, None] + offsets, 0)
+            padded.append((np.where(inside, np.asarray(x, dtype=float)[index], np.nan),
+                           np.where(inside, np.asarray(y, dtype=float)[index], np.nan)))
+        (row_x, row_y), (column_x, column_y) = padded
+
+        matrix = np.zeros((len(rows), len(columns)))
+        shortest = np.minimum(lengths[rows, None], lengths[columns])
+        # The differences, the matches and their running sum for every start in a block
+        block_size = Similarity.block_rows(len(column_starts) * max(1, longest), 8 * 3, memory)
+        for start in range(0, len(row_starts), block_size):
+            block = slice(start, start + block_size)
+            with np.errstate(invalid= 'ignore'):
+                matches = ((np.abs(row_x[block, None] - column_x) < max_X * jaccard_margin).astype(np.int32) +
+                           (np.abs(row_y[block, None] - column_y) < max_Y * jaccard_margin))
+            counts = np.zeros(matches.shape[:2] + (longest + 1,), dtype=np.int32)
+            np.cumsum(matches, axis= 2, out= counts[:, :, 1:])
+            del matches
+            # The row paths with a start in this block
+            inside = np.flatnonzero((row_paths >= start) & (row_paths < start + block_size))
+            found = counts[row_paths[inside, None] - start, column_paths, shortest[inside]]
+            with np.errstate(divide= 'ignore', invalid= 'ignore'):
+                matrix[inside] = np.where(shortest[inside] > 0, found / (2 * shortest[inside]), 0)
+            if progress is not None:
+                progress(min(start + block_size, len(row_starts)), len(row_starts))
+        return matrix
+
+    @staticmethod
+    def tile(method, arrays, rows, columns, max_X, max_Y, memory= None):
+        '''
+        Calculates the part matrix[rows, columns] of the similarity matrix.
+        Every cell is calculated exactly like in bounding_box_matrix, euclidean_matrix and jaccard_matrix,
+        so putting the tiles together gives the same matrix, bit for bit
+
+        :author: Yuri Maas
+        :param method: 'Bounding Box', 'the Euclidean Distance' or 'the Jaccard Similarity'
+        :param arrays: The boxes (see bounding_boxes) or x, y, starts, ends (see path_ranges)
+        :param rows: slice with the rows of the tile
+        :param columns: slice with the columns of the tile
+        :param max_X: The width of the map
+        :param max_Y: The height of the map
+        :param memory: The maximum amount of memory for the temporary arrays, max_memory if None
+        :return: The tile of the matrix
+        '''
+        if method == 'Bounding Box':
+            xmin, xmax, ymin, ymax = arrays
+            area = (xmax - xmin) * (ymax - ymin)
+            dx = np.minimum(xmax[rows, None], xmax[columns]) - np.maximum(xmin[rows, None], xmin[columns])
+            dy = np.minimum(ymax[rows, None], ymax[columns]) - np.maximum(ymin[rows, None], ymin[columns])
+            overlap_area = dx * dy
+            totalarea = area[rows, None] + area[columns] - overlap_area
+            with np.errstate(divide= 'ignore', invalid= 'ignore'):
+                return np.where((dx >= 0) & (dy >= 0) & (totalarea != 0), overlap_area / totalarea, 0)
+
+        x, y, starts, ends = arrays
+        if method == 'the Jaccard Similarity':
+            paths = np.arange(len(starts))
+            return Similarity.jaccard_block(x, y, starts, ends, paths[rows], paths[columns], max_X, max_Y, memory)
+
+        # The closest distances to the row paths and the column paths
+        row_paths = np.arange(len(starts))[rows]
+        paths = np.concatenate((row_paths, np.arange(len(starts))[columns]))
+        closest = Similarity.closest_distances(x, y, starts[paths], ends[paths], memory)
+        cumulative = np.zeros((len(x) + 1, len(paths)))
+        np.cumsum(closest, axis= 0, out= cumulative[1:])
+        # The distances from the row paths to the column paths and back
+        to_columns = cumulative[ends[rows], len(row_paths):] - cumulative[starts[rows], len(row_paths):]
+        to_rows = cumulative[ends[columns], :len(row_paths)] - cumulative[starts[columns], :len(row_paths)]
+
+        lengths = ends - starts
+        m = np.power(np.power(max_X, 2) + np.power(max_Y, 2), 0.5)
+        return 1 - 1 / ((lengths[rows, None] + lengths[columns]) * m) * (to_columns + to_rows.T)
+
+    @staticmethod
+    def parallel_matrix(method, arrays, length, max_X, max_Y, workers, tile_size= None, memory= None, progress= None):
+        '''
+        Calculates the similarity matrix in tiles on a pool of processes.
+        The arrays and the matrix are put in shared memory, so the workers don't have to pickle them.
+        Only the tiles of the upper triangle are calculated, the lower triangle is the mirror image
+
+        :author: Yuri Maas
+        :param method: 'Bounding Box', 'the Euclidean Distance' or 'the Jaccard Similarity'
+        :param arrays: The boxes (see bounding_boxes) or x, y, starts, ends (see path_ranges)
+        :param length: The amount of paths
+        :param max_X: The width of the map
+        :param max_Y: The height of the map
+        :param workers: The amount of processes
+        :param tile_size: The amount of rows and columns of a tile, about 2 tiles per worker per axis if None
+        :param memory: The maximum amount of memory for the temporary arrays of a worker, max_memory if None
+        :param progress: Function that is called with (done, total) after every tile, None to not report
+        :return: Matrix with the similarity of every pair of paths
+        '''
+        if tile_size is None:
+            tile_size = max(32, -(-length // (2 * workers)))
+        blocks = [slice(start, start + tile_size) for start in range(0, length, tile_size)]
+
+        memories = []
+        try:
+            shared = []
+            for array in list(arrays) + [np.zeros((length, length))]:
+                block = shared_memory.SharedMemory(create= True, size= max(1, array.nbytes))
+                memories.append(block)
+                np.ndarray(array.shape, array.dtype, buffer= block.buf)[...] = array
+                shared.append((block.name, array.shape, array.dtype.str))
+
+            tasks = [(method, shared, rows, columns, max_X, max_Y, memory)
+                     for number, rows in enumerate(blocks) for columns in blocks[number:]]
+            with ProcessPoolExecutor(max_workers= workers) as pool:
+                # Going over the results makes sure all tiles are done and raises the errors of the workers
+                for done, _ in enumerate(pool.map(compute_tile, tasks)):
+                    if progress is not None:
+                        progress(done + 1, len(tasks))
+            name, shape, dtype = shared[-1]
+            return np.ndarray(shape, dtype, buffer= memories[-1].buf).copy()
+        finally:
+            for block in memories:
+                block.close()
+                block.unlink()
+
+    @staticmethod
+    def block_rows(length, bytes_per_cell, memory= None):
+        '''
+        Determines how many rows of a length x length matrix can be computed at once
+
+        :author: Yuri Maas
+        :param length: The amount of columns
+        :param bytes_per_cell: The amount of temporary memory a single cell needs
+        :param memory: The maximum amount of memory, max_memory if None
+        :return: The amount of rows (at least 1)
+        '''
+        memory = max_memory if memory is None else memory
+        return max(1, int(memory // max(1, length * bytes_per_cell)))
+
+
+def compute_tile(task):
+    '''
+    Worker of Similarity.parallel_matrix, calculates a tile and writes it (and its mirror image) in the shared matrix
+
+    :author: Yuri Maas
+    :param task: (method, shared memory of the arrays and the matrix, rows, columns, max_X, max_Y, memory)
+    '''
+    method, shared, rows, columns, max_X, max_Y, memory = task
+    blocks = [shared_memory.SharedMemory(name= name) for name, shape, dtype in shared]
+    try:
+        arrays = [np.ndarray(shape, dtype, buffer= block.buf) for block, (name, shape, dtype) in zip(blocks, shared)]
+        matrix = arrays.pop()
+        tile = Similarity.tile(method, arrays, rows, columns, max_X, max_Y, memory)
+        matrix[rows, columns] = tile
+        matrix[columns, rows] = tile.T
+        # The views have to be gone before the shared memory can be closed
+        del arrays, matrix
+    finally:
+        for block in blocks:
+            block.close()
@@ -1,4 +1,58 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Location of the stimuli images, the resolutions of the maps and the cache for the preprocessed data
+stimulifolder = 'MetroMapsEyeTracking/stimuli/'
+resolutionfile = stimulifolder + 'resolution.xlsx'
+cachefolder = 'MetroMapsEyeTracking/cache/'
+# Change this when the preprocessing changes, so old caches are not used anymore
+cache_version = 3
+# The amount of rows of the dataset that is read and cleaned at once
+load_chunk = 250000
+# The types the numeric columns are kept in, the text columns (stimuli names, users, ...) become categorical
+column_types = {
+    'index': np.int32,
+    'FixationIndex': np.int32,
+    'FixationDuration': np.int32,
+    'MappedFixationPointX': np.float32,
+    'MappedFixationPointY': np.float32,
+}
+# The amount of density pyramids (heatmaps) kept in memory
+density_pyramids = 8
+# Uploaded fixations are stored here and loaded together with the dataset
+uploadfolder = 'MetroMapsEyeTracking/uploads/'
+# The amount of rows of an uploaded file that is read at once
+upload_chunk = 100000
+# The columns of the dataset, an upload needs the ones in 'required_columns'
+fixation_columns = ['Timestamp', 'StimuliName', 'FixationIndex', 'FixationDuration',
+                    'MappedFixationPointX', 'MappedFixationPointY', 'user', 'description']
+numeric_columns = ['Timestamp', 'FixationIndex', 'FixationDuration', 'MappedFixationPointX', 'MappedFixationPointY']
+required_columns = numeric_columns + ['StimuliName', 'user']
+
+# Misspelled stimuli names in the dataset: (map id, puzzle ending, correct name)
+#  The first rule that matches a name is used, so the order matters
+stimuli_corrections = [
+    ('04_', '_S2.jpg', '04_Köln_S2.jpg'),
+    ('04b_', '_S1.jpg', '04b_Köln_S1.jpg'),
+    ('12_', '_S2.jpg', '12_Brüssel_S2.jpg'),
+    ('12b_', '_S1.jpg', '12b_Brüssel_S1.jpg'),
+    ('14_', '_S2.jpg', '14_Düsseldorf_S2.jpg'),
+    ('14b_', '_S1.jpg', '14b_Düsseldorf_S1.jpg'),
+    ('15_', '_S2.jpg', '15_Göteborg_S2.jpg'),
+    ('15b_', '_S1.jpg', '15b_Göteborg_S1.jpg'),
+    ('24_', '_S2.jpg', '24_Zürich_S2.jpg'),
+    ('24_', '_S1.jpg', '24_Zürich_S1.jpg'),
+    ('24b_', '_S1.jpg', '24b_Zürich_S1.jpg'),
+]
 
 class Data:
     """
@@ -7,100 +61,657 @@ class Data:
 
     :author: Yuri Maas
     """
-    def __init__(self, file= "MetroMapsEyeTracking/all_fixation_data_cleaned_up.csv"):
-        self.__data, self.__resolutions = self.load_data(file)
+    def __init__(self, file= "MetroMapsEyeTracking/all_fixation_data_cleaned_up.csv", max_pixels= 0, cache= True,
+                 uploads= uploadfolder):
+        self.__max_pixels = max_pixels
+        self.__fingerprint = None
+        # The fingerprints of the puzzles that got fixations from an upload, see get_fingerprint
+        self.__stimulus_fingerprints = {}
+        self.__upload_folder = uploads
+        self.__uploads = Data.find_uploads(uploads)
+        data, self.__resolutions = self.load_data(file, cache)
+        # The data and its index are replaced at once (see add_fixations), so they are kept in one tuple:
+        #  (data, {puzzle: (start, end)}, {puzzle: {user: (start, end)}})
+        self.__snapshot = (data,) + self.__build_index(data)
+        self.__pyramids = OrderedDict()
+        self.__pyramid_lock = threading.Lock()
+        # Reentrant, because load_uploads adds the files with add_fixations
+        self.__upload_lock = threading.RLock()
 
-    def load_data(self, file):
+    def load_data(self, file, cache= True):
         """
         Imports the necessary data
+        The files are read and cleaned in chunks of 'load_chunk' rows and only the compact
+        cleaned chunks are kept (see compact), so the memory doesn't depend on the size of the csv.
+        The preprocessed data is stored in a columnar cache (see write_cache),
+        so only the first start after the source files or cleaning parameters change has to parse the csv.
+        The uploaded fixations (see add_fixations) are added after the dataset
 
         :author: Yuri Maas
         :param file: The file location + name of file of the dataset
+        :param cache: Whether the columnar cache should be used
         """
-        data = pd.read_csv(
-            file,
-            sep='\t',
-            encoding='ISO-8859-1'
+        uploads = [os.path.join(self.__upload_folder, upload) for upload in self.__uploads]
+        self.__fingerprint = Data.cache_key(
+            [file, resolutionfile] + uploads,
+            {'max_pixels': self.__max_pixels, 'version': cache_version}
         )
+        folder = os.path.join(cachefolder, self.__fingerprint)
+        if cache and os.path.isdir(folder):
+            return Data.read_cache(folder)
+
         resolutions = pd.read_excel(
-            "MetroMapsEyeTracking/stimuli/resolution.xlsx",
+            resolutionfile,
             header=None,
             names=['Place', 'x', 'y']
         )[:24]  # Show only the first 24 rows (only rows with resolutions)
-        data = self.__preprocess_data(data, resolutions)
+        chunks = []
+        rows = 0
+        for source in [file] + uploads:
+            for chunk in pd.read_csv(
+                source,
+                sep='\t',
+                encoding='ISO-8859-1',
+                chunksize= load_chunk
+            ):
+                # The rows are numbered over all the files, as if they are one file
+                chunk.index = pd.RangeIndex(rows, rows + len(chunk))
+                rows += len(chunk)
+                chunks.append(Data.compact(Data.preprocess(chunk, resolutions, self.__max_pixels)))
+        data = self.__preprocess_data(chunks)
+        if cache:
+            Data.write_cache(folder, data, resolutions)
         return data, resolutions
 
-    def __preprocess_data(self, data, resolutions):
+    def __preprocess_data(self, chunks):
         """
-        Takes the data and prepossesses it
+        Puts the cleaned chunks of the dataset together and sorts them
 
         :author: Yuri Maas
-        :param data: The dataset to be preprocessed
-        :param resolutions: The resolutions of the maps
+        :param chunks: The chunks of the dataset, cleaned with preprocess and compact
         """
         ###### Preprocess functions ####################################
-        processed_data = self.__removeFixationsOutsideMap(data, resolutions, 0)
+        # The rows are numbered from 0 to len(data) without skipping, like a single cleaned dataframe
+        rows = 0
+        for chunk in chunks:
+            chunk.index = pd.RangeIndex(rows, rows + len(chunk))
+            rows += len(chunk)
+        # Sorted while the chunks are put together (see sort_scanpaths), so the data is never copied as a whole
+        order = Data.scanpath_order(union_categoricals([chunk['StimuliName'].values for chunk in chunks]),
+                                    union_categoricals([chunk['user'].values for chunk in chunks]))
+        processed_data = Data.concat_fixations(chunks, order)
         ################################################################
         return processed_data
 
-    def __removeFixationsOutsideMap(self, data, resolutions, max_pixels):
+    @staticmethod
+    def preprocess(data, resolutions, max_pixels=0):
+        """
+        The cleaning pipeline, first corrects the misspelled stimuli names
+        and then removes the fixations that are more than 'max_pixels' outside the map.
+        Everything is done on whole columns at once, so it scales linearly with the amount of fixations
+
+        :author: Yuri Maas
+        :param data: The dataframe with fixations to be cleaned
+        :param resolutions: The resolutions of the maps
+        :param max_pixels: The maximum amount of pixels a fixation is allowed to be outside the map
+        :return: The cleaned dataframe
+        """
+        data = Data.__correctStimuliNames(data)
+        return Data.__removeFixationsOutsideMap(data, resolutions, max_pixels)
+
+    @staticmethod
+    def __correctStimuliNames(data):
+        """
+        Corrects the misspelled stimuli names (encoding errors in the dataset)
+        Every distinct name is only checked once, after which the whole column is mapped with the lookup table
+
+        :author: Yuri Maas
+        :param data: The dataframe with the stimuli names to be corrected
+        """
+        names = data['StimuliName'].unique()
+        lookup = {name: Data.correct_stimuliname(name) for name in names}
+        data['StimuliName'] = data['StimuliName'].map(lookup)
+        return data
+
+    @staticmethod
+    def correct_stimuliname(name):
+        """
+        Returns the correct spelling of a single stimuli name
+
+        :author: Yuri Maas
+        :param name: The (possibly misspelled) stimuli name
+        :return: The correct stimuli name
+        """
+        for number, ending, correct_name in stimuli_corrections:
+            if number in name and ending in name:
+                return correct_name
+        return name
+
+    @staticmethod
+    def __removeFixationsOutsideMap(data, resolutions, max_pixels):
         """
-        Loops over all the fixations and deletes it when the fixation
-        point is 'max_pixels' outside the map
+        Deletes all the fixations where the fixation point is 'max_pixels' outside the map
 
         :author: Yuri Maas
         :param data: The dataframe with fixations to be removed
+        :param resolutions: The resolutions of the maps
         :param max_pixels: The maximum amount of pixels a fixation is allowed to be outside the map
         """
-        for i in range(len(data)):
-            # If a stimulus is misspelled, correct it
-            text= data.loc[i,('StimuliName')]
-            if '04_' in text and '_S2.jpg' in text:
-                data.at[i, 'StimuliName']= '04_Köln_S2.jpg'
+        # Join the resolutions on the map id (the first 2 digits of the stimuli name),
+        #  only the distinct names have to be parsed
+        codes, names = pd.factorize(data['StimuliName'])
+        map_ids = np.array([int(name[:2]) - 1 for name in names], dtype=int)
+        res_x = np.asarray(resolutions['x'], dtype=float)[map_ids][codes]
+        res_y = np.asarray(resolutions['y'], dtype=float)[map_ids][codes]
 
-            elif '04b_' in text and '_S1.jpg' in text:
-                data.at[i, 'StimuliName'] = '04b_Köln_S1.jpg'
+        # If a fixation is outside the mapresolution (+- max_pixels), drop the fixation
+        x = np.asarray(data['MappedFixationPointX'])
+        y = np.asarray(data['MappedFixationPointY'])
+        outside = (x > res_x + max_pixels) | (x < -max_pixels) | (y > res_y + max_pixels) | (y < -max_pixels)
 
-            elif '12_' in text and '_S2.jpg' in text:
-                data.at[i, 'StimuliName'] = '12_Brüssel_S2.jpg'
+        # Reset the index of the dataframe index so it goes from 0 to len(data) without skipping
+        clean_data = data[~outside].reset_index()
+        return clean_data
 
-            elif '12b_' in text and '_S1.jpg' in text:
-                data.at[i, 'StimuliName'] = '12b_Brüssel_S1.jpg'
+    @staticmethod
+    def compact(data):
+        """
+        Stores cleaned fixations in less memory: the text columns (stimuli names, users, ...) become categorical,
+        so every row only has a small integer code, and the numeric columns get the types of 'column_types'.
+        The categories are in order of appearance
 
-            elif '14_' in text and '_S2.jpg' in text:
-                data.at[i, 'StimuliName'] = '14_Düsseldorf_S2.jpg'
+        :author: Yuri Maas
+        :param data: The cleaned fixations
+        :return: The same fixations in compact columns
+        """
+        for column in data.columns:
+            values = data[column]
+            if column in column_types:
+                # Integer columns with missing values keep their type, integers can't be missing
+                if not (np.issubdtype(column_types[column], np.integer) and values.isna().any()):
+                    data[column] = values.astype(column_types[column])
+            elif not pd.api.types.is_numeric_dtype(values) or column in ['StimuliName', 'user']:
+                data[column] = Data.categorical(values)
+        return data
 
-            elif '14b_' in text and '_S1.jpg' in text:
-                data.at[i, 'StimuliName'] = '14b_Düsseldorf_S1.jpg'
+    @staticmethod
+    def categorical(values):
+        """
+        Makes a categorical column with text categories (in order of appearance),
+        also for a column that only has missing values
 
-            elif '15_' in text and '_S2.jpg' in text:
-                data.at[i, 'StimuliName'] = '15_Göteborg_S2.jpg'
+        :author: Yuri Maas
+        :param values: The column
+        :return: pd.Categorical
+        """
+        values = pd.Series(values, copy= False)
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return values.values
+        return pd.Categorical(values, categories= pd.Index(values.dropna().unique(), dtype= object))
 
-            elif '15b_' in text and '_S1.jpg' in text:
-                data.at[i, 'StimuliName'] = '15b_Göteborg_S1.jpg'
+    @staticmethod
+    def concat_fixations(frames, order= None):
+        """
+        Puts compact fixations (see compact) after each other and puts the rows in the order of 'order',
+        the categorical columns get the categories of all the frames together.
+        The frames in the list are replaced by their columns, which are let go as soon as they are used,
+        so the frames and the result only take the memory of one column more than the frames alone
 
-            elif '24_' in text and '_S2.jpg' in text:
-                data.at[i, 'StimuliName'] = '24_Zürich_S2.jpg'
+        :author: Yuri Maas
+        :param frames: List of DataFrames, the columns of the first one are used
+        :param order: The rows of the result, as positions in the frames after each other (None to keep the order)
+        :return: DataFrame, the index of the frames is kept
+        """
+        names = list(frames[0].columns)
+        index = np.concatenate([np.asarray(frame.index) for frame in frames])
+        for number, frame in enumerate(frames):
+            frames[number] = {name: frame[name].values if name in frame.columns else np.full(len(frame), np.nan)
+                              for name in names}
+        del frame
+        columns = {}
+        for name in names:
+            values = [frame.pop(name) for frame in frames]
+            if any(isinstance(value, pd.Categorical) for value in values):
+                column = union_categoricals([Data.categorical(value) for value in values])
+            else:
+                column = np.concatenate([np.asarray(value) for value in values])
+            del values
+            columns[name] = column if order is None else column.take(order)
+        return pd.DataFrame(columns, index= index if order is None else index[order], columns= names, copy= False)
 
-            elif '24_' in text and '_S1.jpg' in text:
-                data.at[i, 'StimuliName'] = '24_Zürich_S1.jpg'
+    @staticmethod
+    def cache_key(files, parameters):
+        """
+        Creates a key that changes whenever the content of the source files or the parameters change
 
-            elif '24b_' in text and '_S1.jpg' in text:
-                data.at[i, 'StimuliName'] = '24b_Zürich_S1.jpg'
+        :author: Yuri Maas
+        :param files: The source files the data is made from
+        :param parameters: Dictionary with the parameters used to make the data
+        :return: Hexadecimal hash
+        """
+        sha = hashlib.sha1()
+        for file in files:
+            with open(file, 'rb') as source:
+                for block in iter(lambda: source.read(1 << 20), b''):
+                    sha.update(block)
+        sha.update(json.dumps(parameters, sort_keys=True).encode('utf-8'))
+        return sha.hexdigest()
 
-            # Gets the mapresolution of the current fixation in the loop
-            currentRes = resolutions.get_values()[int(data['StimuliName'][i][:2]) - 1]
+    @staticmethod
+    def write_cache(folder, data, resolutions):
+        """
+        Writes the preprocessed data and resolutions to a columnar cache, one .npy file per column.
+        Text columns are stored as integer codes with a separate file for the distinct values.
+        The cache is written to a temporary folder first, so an interrupted write never leaves a broken cache
 
-            # If a fixation is outside the mapresolution (+- max_pixels), drop the fixation
-            if data['MappedFixationPointX'][i] > (currentRes[1] + max_pixels) or (
-                    data['MappedFixationPointX'][i] < -max_pixels) or (
-                    data['MappedFixationPointY'][i] > (currentRes[2] + max_pixels)) or (
-                    data['MappedFixationPointY'][i] < -max_pixels):
-                data = data.drop([i])
+        :author: Yuri Maas
+        :param folder: The folder of the cache
+        :param data: The preprocessed data
+        :param resolutions: The resolutions of the maps
+        """
+        temporary = '{}.{}.tmp'.format(folder, os.getpid())
+        Data.__write_columns(os.path.join(temporary, 'data'), data)
+        Data.__write_columns(os.path.join(temporary, 'resolutions'), resolutions)
+        try:
+            os.rename(temporary, folder)
+        except OSError:
+            # Another process has written the same cache in the meantime
+            shutil.rmtree(temporary, ignore_errors= True)
 
-        # Reset the index of the dataframe index so it goes from 0 to len(data) without skipping
-        clean_data = data.reset_index()
-        return clean_data
+    @staticmethod
+    def read_cache(folder):
+        """
+        Reads the data and resolutions from the columnar cache,
+        the numeric columns are memory-mapped instead of read
+
+        :author: Yuri Maas
+        :param folder: The folder of the cache
+        :return: data, resolutions
+        """
+        return (Data.__read_columns(os.path.join(folder, 'data')),
+                Data.__read_columns(os.path.join(folder, 'resolutions')))
+
+    @staticmethod
+    def __write_columns(folder, frame):
+        os.makedirs(folder)
+        columns = []
+        for number, column in enumerate(frame.columns):
+            values = frame[column].values
+            if isinstance(values, pd.Categorical):
+                np.save(os.path.join(folder, '{}.codes.npy'.format(number)), values.codes)
+                np.save(os.path.join(folder, '{}.categories.npy'.format(number)),
+                        np.asarray(values.categories, dtype=str))
+                columns.append({'name': column, 'text': True, 'categorical': True})
+            elif not pd.api.types.is_numeric_dtype(frame[column]):
+                codes, categories = pd.factorize(values)
+                np.save(os.path.join(folder, '{}.codes.npy'.format(number)), codes)
+                np.save(os.path.join(folder, '{}.categories.npy'.format(number)), np.asarray(categories, dtype=str))
+                columns.append({'name': column, 'text': True})
+            else:
+                np.save(os.path.join(folder, '{}.npy'.format(number)), np.asarray(values))
+                columns.append({'name': column, 'text': False})
+        np.save(os.path.join(folder, 'index.npy'), frame.index.values)
+        with open(os.path.join(folder, 'columns.json'), 'w') as manifest:
+            json.dump(columns, manifest)
+
+    @staticmethod
+    def __read_columns(folder):
+        with open(os.path.join(folder, 'columns.json')) as manifest:
+            columns = json.load(manifest)
+        frame = {}
+        for number, column in enumerate(columns):
+            if column['text']:
+                codes = np.load(os.path.join(folder, '{}.codes.npy'.format(number)))
+                categories = np.load(os.path.join(folder, '{}.categories.npy'.format(number))).astype(object)
+                if column.get('categorical'):
+                    frame[column['name']] = pd.Categorical.from_codes(
+                        codes, dtype= pd.CategoricalDtype(pd.Index(categories, dtype= object)))
+                else:
+                    # Code -1 means the value was missing, so it points to the appended nan
+                    frame[column['name']] = np.append(categories, np.nan)[codes]
+            else:
+                frame[column['name']] = np.load(os.path.join(folder, '{}.npy'.format(number)), mmap_mode='r')
+        index = np.load(os.path.join(folder, 'index.npy'))
+        return pd.DataFrame(frame, index= index, columns= [column['name'] for column in columns], copy= False)
+
+    @staticmethod
+    def sort_scanpaths(data):
+        """
+        Sorts the fixations on (StimuliName, user), so every puzzle and every scanpath is one contiguous block of rows.
+        The puzzles and users keep the order in which they appear in the data,
+        the fixations keep their order within a scanpath
+
+        :author: Yuri Maas
+        :param data: The dataframe with fixations to be sorted
+        :return: The sorted dataframe, the index of the rows is kept
+        """
+        return data.take(Data.scanpath_order(data['StimuliName'], data['user']))
+
+    @staticmethod
+    def scanpath_order(stimuli, users):
+        """
+        Returns the order of the rows of sort_scanpaths
+
+        :author: Yuri Maas
+        :param stimuli: The stimuli name of every fixation
+        :param users: The user of every fixation
+        :return: Array with the positions of the rows in sorted order
+        """
+        stimuli = Data.__appearance(Data.codes(stimuli)[0])
+        # A missing user has code -1, so the users are shifted by 1
+        users = Data.codes(users)[0].astype(np.int32) + 1
+        scanpaths = Data.__appearance(stimuli * (users.max(initial= 0) + 1) + users)
+        del users
+        # The scanpaths of a puzzle after each other, a stable sort keeps the order of the fixations in a scanpath
+        return np.argsort(stimuli * (scanpaths.max(initial= 0) + 1) + scanpaths, kind= 'stable')
+
+    @staticmethod
+    def __appearance(codes):
+        """
+        Numbers the distinct values of an integer array in order of appearance
+
+        :author: Yuri Maas
+        :param codes: Array of integers
+        :return: Array of the same length with the numbers
+        """
+        codes = np.asarray(codes)
+        if len(codes) == 0:
+            return np.zeros(0, dtype= np.int32)
+        lowest = int(codes.min())
+        distinct = pd.unique(codes).astype(np.int64) - lowest
+        # Only the distinct values are looked up, so the numbers are found without sorting the whole array
+        numbers = np.zeros(int(distinct.max()) + 1, dtype= np.int32)
+        numbers[distinct] = np.arange(len(distinct))
+        return numbers[codes - lowest if lowest != 0 else codes]
+
+    @staticmethod
+    def scanpath_offsets(stimuli, users):
+        """
+        Finds the scanpaths in a list of fixations,
+        a scanpath ends where the stimuli name or the user differs from the next fixation
+
+        :author: Yuri Maas
+        :param stimuli: Array with the stimuli name of every fixation
+        :param users: Array with the user of every fixation
+        :return: starts, ends (arrays with the first and one past the last row of every scanpath)
+        """
+        # Categorical columns are compared on their codes
+        stimuli = Data.codes(stimuli)[0] if isinstance(stimuli, (pd.Series, pd.Categorical)) else np.asarray(stimuli)
+        users = Data.codes(users)[0] if isinstance(users, (pd.Series, pd.Categorical)) else np.asarray(users)
+        if len(stimuli) == 0:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+        changes = np.flatnonzero((stimuli[1:] != stimuli[:-1]) | (users[1:] != users[:-1])) + 1
+        return np.concatenate(([0], changes)), np.concatenate((changes, [len(stimuli)]))
+
+    @staticmethod
+    def codes(column):
+        """
+        Returns an integer code for every value of a column and the values of the codes,
+        for a categorical column these are the codes it already has
+
+        :author: Yuri Maas
+        :param column: Series or array
+        :return: codes, values (values[codes] gives the column back, code -1 is a missing value)
+        """
+        values = column.values if isinstance(column, pd.Series) else column
+        if isinstance(values, pd.Categorical):
+            return values.codes, np.asarray(values.categories, dtype= object)
+        codes, uniques = pd.factorize(values)
+        return codes, np.asarray(uniques, dtype= object)
+
+    def __build_index(self, data, first= 0, last= None):
+        """
+        Creates the index of the (sorted) data, so a puzzle or scanpath can be taken as a slice of rows
+
+        :author: Yuri Maas
+        :param data: The data sorted by sort_scanpaths
+        :param first: The first row to index (the rows [first:last] have to be whole puzzles)
+        :param last: One past the last row to index, None for the end of the data
+        :return: {puzzle: (start, end)}, {puzzle: {user: (start, end)}}
+        """
+        stimuli, stimuli_names = Data.codes(data['StimuliName'])
+        users, user_names = Data.codes(data['user'])
+        stimuli, users = stimuli[first:last], users[first:last]
+        puzzles = {}
+        scanpaths = {}
+        for start, end in zip(*Data.scanpath_offsets(stimuli, users)):
+            puzzle = stimuli_names[stimuli[start]]
+            start, end = int(start) + first, int(end) + first
+            scanpaths.setdefault(puzzle, {})[user_names[users[start - first]]] = (start, end)
+            puzzles[puzzle] = (puzzles.get(puzzle, (start, end))[0], end)
+        return puzzles, scanpaths
+
+    @staticmethod
+    def find_uploads(folder):
+        """
+        Returns the uploaded files in a folder, in the order they were uploaded
+
+        :author: Yuri Maas
+        :param folder: The folder with uploads
+        :return: List of file names
+        """
+        if folder is None or not os.path.isdir(folder):
+            return []
+        return sorted(name for name in os.listdir(folder) if name.endswith('.csv'))
+
+    @staticmethod
+    def read_fixations(source, chunk_size= upload_chunk, stimuli= None):
+        """
+        Reads a tab-separated file with fixations (in the format of the dataset) in chunks of 'chunk_size' rows.
+        Rejects lines with too many fields, rows with a stimuli name that isn't a map or isn't one of 'stimuli',
+        rows with missing or non numeric values in the numeric columns
+        and rows without a user named like in the dataset ('p' and a number, ' P12 ' becomes 'p12')
+
+        :author: Yuri Maas
+        :param source: The file (name or file object)
+        :param chunk_size: The amount of rows to read at once
+        :param stimuli: The names of the known stimuli (after correct_stimuliname), None to accept every map
+        :return: DataFrame with the columns of 'fixation_columns' with the rows that can be used
+        :raises ValueError: If the file can't be read or misses one of the 'required_columns'
+        """
+        chunks = []
+        for chunk in pd.read_csv(source, sep='\t', encoding='ISO-8859-1', chunksize= chunk_size,
+                                 on_bad_lines='skip', dtype={'StimuliName': str, 'user': str}):
+            missing = [column for column in required_columns if column not in chunk.columns]
+            if missing:
+                raise ValueError('The file has no column {}'.format(', '.join(missing)))
+            chunk = chunk.reindex(columns= fixation_columns)
+            for column in numeric_columns:
+                chunk[column] = pd.to_numeric(chunk[column], errors='coerce')
+            # The users are sorted on their number (see Ordering.alphabet)
+            chunk['user'] = chunk['user'].str.strip().str.lower()
+            users = chunk['user'].str.fullmatch(r'p\d+').fillna(False).astype(bool)
+            # There are 24 maps, the stimuli name starts with the id of the map
+            map_ids = pd.to_numeric(chunk['StimuliName'].str[:2], errors='coerce')
+            usable = chunk[numeric_columns].notna().all(axis=1) & users & map_ids.between(1, 24)
+            if stimuli is not None:
+                # A stimulus without an image has no panels to show its fixations in
+                known = [name for name in chunk['StimuliName'].dropna().unique()
+                         if Data.correct_stimuliname(name) in stimuli]
+                usable &= chunk['StimuliName'].isin(known)
+            chunks.append(chunk[usable])
+        if not chunks:
+            return pd.DataFrame(columns= fixation_columns)
+        return pd.concat(chunks, ignore_index= True)
+
+    @staticmethod
+    def stimuli_images(folder= stimulifolder):
+        """
+        Returns the names of the stimuli that have an image
+
+        :author: Yuri Maas
+        :param folder: The folder with the stimuli images
+        :return: Set with the names of the images (with .jpg)
+        """
+        if not os.path.isdir(folder):
+            return set()
+        return {name for name in os.listdir(folder) if name.endswith('.jpg')}
+
+    def add_fixations(self, contents, persist= True):
+        """
+        Adds the fixations of an uploaded file to the data without loading the dataset again.
+        The file is read with read_fixations and cleaned like the dataset (see preprocess).
+        The new rows are inserted at the end of their scanpath, puzzle or the data (see insert_positions),
+        so the data isn't sorted again and only the index of the puzzles with new fixations is made again,
+        the other puzzles only move. The new data and its index replace the old ones at once,
+        so other callbacks keep working with the old data while the file is added.
+        Only the fingerprints of the puzzles with new fixations change (see get_fingerprint),
+        so only their adjacency matrices and heatmaps are computed again
+
+        :author: Yuri Maas
+        :param contents: The content of the tab-separated file (bytes)
+        :param persist: Whether to store the usable rows in the upload folder, so they are loaded at the next start
+        :return: (amount of fixations added, amount of rows rejected)
+        :raises ValueError: If the file can't be read or misses columns
+        """
+        fixations = Data.read_fixations(io.BytesIO(contents), stimuli= set(self.__snapshot[1]) | Data.stimuli_images())
+        rows = max(contents.count(b'\n') + (not contents.endswith(b'\n')) - 1, 0)
+
+        # Only one file is added at a time, reading the data doesn't need the lock
+        with self.__upload_lock:
+            data, puzzles, scanpaths = self.__snapshot
+            # The new rows continue the numbering of the rows of the dataset
+            first_row = int(data['index'].max()) + 1 if len(data) else 0
+            fixations.index = pd.RangeIndex(first_row, first_row + len(fixations))
+            clean = Data.compact(Data.preprocess(fixations.copy(), self.__resolutions, self.__max_pixels))
+            first_label = int(data.index.max()) + 1 if len(data) else 0
+            clean.index = pd.RangeIndex(first_label, first_label + len(clean))
+            if len(clean) > 0:
+                positions, order = Data.insert_positions(clean, puzzles, scanpaths, len(data))
+                clean = clean.take(order)
+                new_data = Data.insert_fixations(data, clean, positions)
+                changed = set(clean['StimuliName'].unique())
+
+                # Every old row moves down by the amount of new rows inserted before it
+                new_puzzles, new_scanpaths = {}, {}
+                for puzzle, (start, end) in puzzles.items():
+                    shift = int(np.searchsorted(positions, start, side= 'right'))
+                    if puzzle in changed:
+                        added = int(np.count_nonzero(clean['StimuliName'] == puzzle))
+                        index = self.__build_index(new_data, start + shift, end + shift + added)
+                        new_puzzles.update(index[0])
+                        new_scanpaths.update(index[1])
+                    else:
+                        new_puzzles[puzzle] = (start + shift, end + shift)
+                        new_scanpaths[puzzle] = {user: (first + shift, last + shift)
+                                                 for user, (first, last) in scanpaths[puzzle].items()}
+                # New puzzles are at the end of the data, after the new rows of the last puzzle
+                tail = len(new_data) - int(np.count_nonzero(~clean['StimuliName'].isin(list(puzzles))))
+                index = self.__build_index(new_data, tail)
+                new_puzzles.update(index[0])
+                new_scanpaths.update(index[1])
+
+                name = None
+                if persist and self.__upload_folder is not None:
+                    name = self.__persist_upload(fixations)
+                content = hashlib.sha1(contents).hexdigest()
+                fingerprints = dict(self.__stimulus_fingerprints)
+                for puzzle in changed:
+                    fingerprints[puzzle] = hashlib.sha1(
+                        (self.get_fingerprint(puzzle) + content).encode('utf-8')).hexdigest()
+                self.__snapshot = (new_data, new_puzzles, new_scanpaths)
+                self.__stimulus_fingerprints = fingerprints
+                if name is not None:
+                    self.__uploads.append(name)
+                with self.__pyramid_lock:
+                    for key in [key for key in self.__pyramids if key[1] in changed]:
+                        del self.__pyramids[key]
+        return len(clean), rows - len(fixations)
+
+    @staticmethod
+    def insert_positions(clean, puzzles, scanpaths, length):
+        """
+        Finds where new fixations go in the sorted data (see sort_scanpaths), as positions for np.insert:
+        after the last fixation of their scanpath, a new user after the last scanpath of the puzzle
+        and a new puzzle after the end of the data. That is where scanpath_order would put them,
+        because the old fixations appear before the new ones
+
+        :author: Yuri Maas
+        :param clean: The new fixations, cleaned and compact
+        :param puzzles: The index of the puzzles of the data
+        :param scanpaths: The index of the scanpaths of the data
+        :param length: The amount of rows of the data
+        :return: positions (ascending), order (the rows of clean in the order of the positions)
+        """
+        order = Data.scanpath_order(clean['StimuliName'], clean['user'])
+        stimuli, stimuli_names = Data.codes(clean['StimuliName'])
+        users, user_names = Data.codes(clean['user'])
+        stimuli, users = stimuli[order], users[order]
+        positions = np.full(len(clean), length, dtype= np.int64)
+        # Rows at the same position: the old scanpath first, then new users, then new puzzles
+        kinds = np.full(len(clean), 2, dtype= np.int64)
+        for start, end in zip(*Data.scanpath_offsets(stimuli, users)):
+            puzzle, user = stimuli_names[stimuli[start]], user_names[users[start]]
+            if user in scanpaths.get(puzzle, {}):
+                positions[start:end], kinds[start:end] = scanpaths[puzzle][user][1], 0
+            elif puzzle in puzzles:
+                positions[start:end], kinds[start:end] = puzzles[puzzle][1], 1
+        # Stable, so the scanpaths keep the order of scanpath_order
+        sort = np.argsort(positions * 3 + kinds, kind= 'stable')
+        return positions[sort], order[sort]
+
+    @staticmethod
+    def insert_fixations(data, clean, positions):
+        """
+        Inserts compact fixations (see compact) into the data at the positions (like np.insert),
+        the categorical columns keep the codes of the data and get the new categories after them.
+        Every column is copied once, nothing is sorted
+
+        :author: Yuri Maas
+        :param data: The data
+        :param clean: The new fixations, in the order of the positions
+        :param positions: Where every new fixation goes, as positions in the data (see insert_positions)
+        :return: DataFrame with the data and the new fixations
+        """
+        columns = {}
+        for name in data.columns:
+            old = data[name].values
+            new = clean[name].values if name in clean.columns else np.full(len(clean), np.nan)
+            if isinstance(old, pd.Categorical) or isinstance(new, pd.Categorical):
+                old, new = Data.categorical(old), Data.categorical(new)
+                categories = old.categories.append(new.categories[~new.categories.isin(old.categories)])
+                # Code -1 (missing) stays -1, the codes get a bigger type if the new categories need it
+                codes = np.append(categories.get_indexer(new.categories), -1)[new.codes]
+                dtype = np.promote_types(old.codes.dtype, np.min_scalar_type(-len(categories)))
+                columns[name] = pd.Categorical.from_codes(
+                    np.insert(old.codes.astype(dtype, copy= False), positions, codes),
+                    dtype= pd.CategoricalDtype(pd.Index(categories, dtype= object)))
+            else:
+                old = np.asarray(old)
+                columns[name] = np.insert(old.astype(np.result_type(old, np.asarray(new)), copy= False),
+                                          positions, new)
+        return pd.DataFrame(columns, index= np.insert(np.asarray(data.index), positions, np.asarray(clean.index)),
+                            columns= list(data.columns), copy= False)
+
+    def load_uploads(self):
+        """
+        Adds the files other processes (workers of Server.py) have uploaded since this process loaded the data
+
+        :author: Yuri Maas
+        """
+        with self.__upload_lock:
+            for name in Data.find_uploads(self.__upload_folder):
+                if name not in self.__uploads:
+                    with open(os.path.join(self.__upload_folder, name), 'rb') as upload:
+                        self.add_fixations(upload.read(), persist= False)
+                    self.__uploads.append(name)
+
+    def __persist_upload(self, fixations):
+        """
+        Writes the usable rows of an upload to the upload folder, named by the time of the upload and their hash
+
+        :author: Yuri Maas
+        :param fixations: The rows returned by read_fixations
+        :return: The name of the file
+        """
+        os.makedirs(self.__upload_folder, exist_ok= True)
+        content = fixations.to_csv(sep='\t', index=False).encode('ISO-8859-1', errors='replace')
+        name = '{}-{}.csv'.format(time.strftime('%Y%m%d-%H%M%S'), hashlib.sha1(content).hexdigest()[:12])
+        temporary = os.path.join(self.__upload_folder, '{}.{}.tmp'.format(name, os.getpid()))
+        with open(temporary, 'wb') as upload:
+            upload.write(content)
+        os.replace(temporary, os.path.join(self.__upload_folder, name))
+        return name
     # End of initialization ################################################################
 
     def get_puzzle_data(self, puzzle_name):
@@ -109,11 +720,117 @@ class Data:
 
         :author: Yuri Maas & Annelies vd Wetering
         :param puzzle: The puzzlename to return all the fixations from
-        :return: All the fixations of a certain puzzle
+        :return: All the fixations of a certain puzzle, one DataFrame (slice of the data) per user
+        '''
+        data, puzzles, scanpaths = self.__snapshot
+        return [data.iloc[start:end] for start, end in scanpaths.get(puzzle_name, {}).values()]
+
+    def get_puzzle_scanpaths(self, puzzle_name):
+        '''
+        Returns the scanpaths of a single puzzle as Scanpaths, with views on one copy of the columns of the puzzle
+
+        :author: Yuri Maas
+        :param puzzle_name: The puzzlename to return the scanpaths from
+        :return: List of Scanpaths, one per user in the same order as get_puzzle_users
+        '''
+        data, puzzles, scanpaths = self.__snapshot
+        start, end = puzzles.get(puzzle_name, (0, 0))
+        offsets = np.array(list(scanpaths.get(puzzle_name, {}).values()), dtype=int).reshape(-1, 2) - start
+        return Scanpath.split(data.iloc[start:end], offsets[:, 0], offsets[:, 1])
+
+    def get_user_scanpath(self, puzzle_name, user):
+        '''
+        Returns the scanpath of a single user on a single puzzle as Scanpath
+
+        :author: Yuri Maas
+        :param puzzle_name: The puzzlename of the scanpath
+        :param user: The user of the scanpath
+        :return: Scanpath
+        '''
+        return Scanpath.from_frame(self.get_user_data(puzzle_name, user), user, puzzle_name)
+
+    def get_puzzle_fixations(self, puzzle_name):
+        '''
+        Returns all the fixations of a single puzzle in one DataFrame
+
+        :author: Yuri Maas
+        :param puzzle_name: The puzzlename to return all the fixations from
+        :return: A slice of the data with all the fixations of the puzzle
         '''
-        all_fixations = pd.DataFrame(self.__data.loc[self.__data['StimuliName'] == puzzle_name])
-        paths = [pd.DataFrame(all_fixations[all_fixations['user'] == i]) for i in all_fixations['user'].unique()]
-        return paths
+        data, puzzles, scanpaths = self.__snapshot
+        start, end = puzzles.get(puzzle_name, (0, 0))
+        return data.iloc[start:end]
+
+    def get_user_data(self, puzzle_name, user):
+        '''
+        Returns the scanpath of a single user on a single puzzle
+
+        :author: Yuri Maas
+        :param puzzle_name: The puzzlename of the scanpath
+        :param user: The user of the scanpath
+        :return: A slice of the data with the fixations of the scanpath
+        '''
+        data, puzzles, scanpaths = self.__snapshot
+        start, end = scanpaths.get(puzzle_name, {}).get(user, (0, 0))
+        return data.iloc[start:end]
+
+    def get_puzzle_users(self, puzzle_name):
+        '''
+        Returns the users of a puzzle, in the same order as get_puzzle_data
+
+        :author: Yuri Maas
+        :param puzzle_name: The puzzlename to get the users from
+        :return: List of users
+        '''
+        return list(self.__snapshot[2].get(puzzle_name, {}))
+
+    def get_density(self, puzzle_name, bin_size, weighted= False):
+        '''
+        Returns the density of the fixations of a puzzle in bin_size x bin_size bins over the map, with the y-axis
+        going from down to up like in the plots. The bins are taken from the density pyramid of the puzzle,
+        which is made on the first request, so other bin sizes don't have to go over the fixations again
+
+        :author: Yuri Maas
+        :param puzzle_name: The puzzlename to get the density of
+        :param bin_size: The amount of bins on both axes
+        :param weighted: False to count the fixations, True to sum their durations
+        :return: z (a row per y bin), the centers of the x bins, the centers of the y bins
+        '''
+        # The fingerprint of a puzzle changes when fixations are added to it, so a pyramid of old data is never used
+        key = (self.get_fingerprint(puzzle_name), puzzle_name, weighted)
+        with self.__pyramid_lock:
+            pyramid = self.__pyramids.get(key)
+            if pyramid is not None:
+                self.__pyramids.move_to_end(key)
+        if pyramid is None:
+            fixations = self.get_puzzle_fixations(puzzle_name)
+            pyramid = Density_Pyramid(
+                fixations['MappedFixationPointX'].values,
+                # The plot has to be horizontally flipped since the y-axis goes from down to up
+                self.get_resolution_Y(puzzle_name) - fixations['MappedFixationPointY'].values,
+                self.get_resolution_X(puzzle_name),
+                self.get_resolution_Y(puzzle_name),
+                fixations['FixationDuration'].values if weighted else None
+            )
+            with self.__pyramid_lock:
+                self.__pyramids[key] = pyramid
+                while len(self.__pyramids) > density_pyramids:
+                    self.__pyramids.popitem(last= False)
+        return pyramid.get_bins(bin_size)
+
+    def get_fingerprint(self, puzzle_name= None):
+        """
+        Returns a hash of the source files and cleaning parameters of the data.
+        The fingerprint of a puzzle also changes when an upload adds fixations to that puzzle (see add_fixations),
+        so the cached results of the other puzzles stay valid
+
+        :author: Yuri Maas
+        :param puzzle_name: The puzzle to get the fingerprint of, None for the data as it was loaded
+        :return: Hexadecimal hash
+        """
+        if puzzle_name is None:
+            return self.__fingerprint
+        return self.__stimulus_fingerprints.get(puzzle_name, self.__fingerprint)
 
     def get_resolution_X(self, puzzle_name):
         """
@@ -144,7 +861,7 @@ class Data:
         :author: Yuri Maas
         :return: {'puzzlename_#puzzle': '#map_puzzlename_#puzzle.jpg'}
         """
-        return [{'label': i[3:-4], 'value': i} for i in self.__data['StimuliName'].unique()]
+        return [{'label': i[3:-4], 'value': i} for i in self.__snapshot[1]]
 
     def get_allUserNames_fromPuzzle(self, puzzle):
         '''
@@ -154,11 +871,7 @@ class Data:
         :param puzzle: The puzzle to get all the users from
         :return: {'label': user, 'value': user}
         '''
-        # Get the data from the puzzle
-        data = self.get_puzzle_data(puzzle)
-        # Create an array of all users
-        users = [data[i]['user'].unique()[0] for i in range(len(data))]
-        return [{'label': i, 'value': i} for i in users]
+        return [{'label': i, 'value': i} for i in self.get_puzzle_users(puzzle)]
 
     def get_subscanpaths(self, stimuliname, unique_user):
         """
@@ -166,43 +879,354 @@ class Data:
         :author Maaike van Delft & Annelies van de Wetering & Yuri Maas
         :param stimuliname = the full stimliname (string) including the 2 digits at the beginning and .jpeg at the end
         :param unique_user = a string: p1, p2 ,......... p9.
-        :returns returns 2 arrays, one with the x cooridnates and 1 with the y coordinates
+        :returns Subscanpaths object, which behaves like a list of all the subscanpaths of the user
         """
-        # Load in all data from puzzle
-        puzzle_data = self.get_puzzle_data(stimuliname)
-        # Filter all the loaded data to only 1 (input) user
-        user_data = [puzzle_data[i]
-                     for i in range(len(puzzle_data))
-                     if puzzle_data[i]['user'].unique() == unique_user][0]
+        # The scanpath of the (input) user
+        return Subscanpaths(self.get_user_scanpath(stimuliname, unique_user))
 
 
-        subscanpaths= []
-        for i in range(len(user_data)):
-            length = i + 1
-            while length <= len(user_data):
-                subscan= user_data.iloc[i:length]
-                subscanpaths.append(subscan)
-                length += 1
-        return subscanpaths
+class Scanpath:
+    '''
+    The fixations of one user on one puzzle as contiguous float32 arrays (x, y and duration),
+    with the index of every fixation in the data and the names of the user and the stimulus.
+    Slicing (scanpath[start:end]) gives a subscanpath with views on the arrays, so nothing is copied.
+    The columns can also be taken like with a DataFrame (scanpath['MappedFixationPointX'])
 
+    from_frame makes the Scanpath of a single scanpath and looks up its user and stimulus in the frame.
+    split converts the columns of a frame with many scanpaths only once (with the private __from_columns,
+    which leaves the user and the stimulus empty) and gives every scanpath a slice of them
 
-class Current_Graphs:
+    :author: Yuri Maas
     '''
-    A class to store all the current graphs,
-    Major suspect in the ongoing investigating to why the tool sometimes
-        gets stuck in a certain panel / doesn't want to update anymore (updating never stops calculating nor shows)
+    __slots__ = ['x', 'y', 'duration', 'index', 'user', 'stimulus', '__bounding_box', '__length']
+    # The columns of the data that are kept, with their attribute
+    columns = {'MappedFixationPointX': 'x', 'MappedFixationPointY': 'y', 'FixationDuration': 'duration'}
+
+    def __init__(self, x, y, duration, index, user= None, stimulus= None):
+        self.x = np.ascontiguousarray(x, dtype=np.float32)
+        self.y = np.ascontiguousarray(y, dtype=np.float32)
+        self.duration = np.ascontiguousarray(duration, dtype=np.float32)
+        self.index = np.asarray(index)
+        self.user = user
+        self.stimulus = stimulus
+        self.__bounding_box = None
+        self.__length = None
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            if item.step not in (None, 1):
+                raise ValueError('subscanpaths have to be consecutive fixations')
+            return Scanpath(self.x[item], self.y[item], self.duration[item], self.index[item],
+                            self.user, self.stimulus)
+        return getattr(self, Scanpath.columns[item])
+
+    def get_bounding_box(self):
+        '''
+        Returns the smallest box around the fixations, computed once
+
+        :author: Yuri Maas
+        :return: xmin, xmax, ymin, ymax
+        '''
+        if self.__bounding_box is None:
+            if len(self) == 0:
+                raise ValueError('an empty scanpath has no bounding box')
+            self.__bounding_box = (float(self.x.min()), float(self.x.max()), float(self.y.min()), float(self.y.max()))
+        return self.__bounding_box
+
+    def get_length(self):
+        '''
+        Returns the length of the scanpath on the map (the sum of the distances between consecutive fixations),
+        computed once. len() is the amount of fixations
+
+        :author: Yuri Maas
+        :return: The length in pixels
+        '''
+        if self.__length is None:
+            self.__length = float(np.hypot(np.diff(self.x.astype(float)), np.diff(self.y.astype(float))).sum())
+        return self.__length
+
+    @staticmethod
+    def from_frame(frame, user= None, stimulus= None):
+        '''
+        Creates a Scanpath from the fixations of one scanpath in a DataFrame
+
+        :author: Yuri Maas
+        :param frame: DataFrame with the columns of Scanpath.columns
+        :param user: The user of the scanpath, the first user in the frame if None
+        :param stimulus: The stimulus of the scanpath, the first stimulus in the frame if None
+        :return: Scanpath
+        '''
+        if user is None and 'user' in frame and len(frame):
+            user = frame['user'].iloc[0]
+        if stimulus is None and 'StimuliName' in frame and len(frame):
+            stimulus = frame['StimuliName'].iloc[0]
+        return Scanpath.__from_columns(frame, user, stimulus)
+
+    @staticmethod
+    def split(frame, starts, ends):
+        '''
+        Creates the Scanpaths of the rows [start:end] of a DataFrame with several scanpaths,
+        the columns are converted once and every Scanpath has views on them
+
+        :author: Yuri Maas
+        :param frame: DataFrame with the columns of Scanpath.columns, 'user' and 'StimuliName'
+        :param starts: The first row of every scanpath
+        :param ends: One past the last row of every scanpath
+        :return: List of Scanpaths
+        '''
+        whole = Scanpath.__from_columns(frame)
+        users, user_names = Data.codes(frame['user'])
+        stimuli, stimuli_names = Data.codes(frame['StimuliName'])
+        scanpaths = []
+        for start, end in zip(starts, ends):
+            scanpath = whole[start:end]
+            scanpath.user = user_names[users[start]]
+            scanpath.stimulus = stimuli_names[stimuli[start]]
+            scanpaths.append(scanpath)
+        return scanpaths
+
+    @staticmethod
+    def __from_columns(frame, user= None, stimulus= None):
+        # Converts every column of Scanpath.columns once, the user and the stimulus are not looked up
+        return Scanpath(*[frame[column].to_numpy(dtype=np.float32) for column in Scanpath.columns],
+                        frame.index.to_numpy(), user, stimulus)
+
+
+class Subscanpaths:
+    '''
+    All the subscanpaths of a single scanpath, without creating them.
+    Behaves like a list with the subscanpaths in the order [0:1], [0:2], ..., [0:n], [1:2], ..., [n-1:n],
+    every subscanpath is a slice of the Scanpath and is only made when it is asked for.
+    So the memory stays O(n) instead of O(n^2) for the n(n+1)/2 subscanpaths
+
+    :author: Yuri Maas
+    '''
+    def __init__(self, scanpath):
+        if not isinstance(scanpath, Scanpath):
+            scanpath = Scanpath.from_frame(scanpath)
+        self.__scanpath = scanpath
+        # The first position of the subscanpaths that start at fixation i, ending with the total amount
+        self.__offsets = np.concatenate(([0], np.cumsum(np.arange(len(scanpath), 0, -1))))
+
+    def __len__(self):
+        return int(self.__offsets[-1])
+
+    def __getitem__(self, position):
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError('subscanpath index out of range')
+        start = int(np.searchsorted(self.__offsets, position, side= 'right')) - 1
+        return self.__scanpath[start:start + 1 + position - int(self.__offsets[start])]
+
+    def __iter__(self):
+        for start in range(len(self.__offsets) - 1):
+            for end in range(start + 1, len(self.__offsets)):
+                yield self.__scanpath[start:end]
+
+    def get_column(self, column):
+        return self.__scanpath[column]
+
+    def get_ranges(self):
+        '''
+        Returns the start and end of every subscanpath in the scanpath
+
+        :author: Yuri Maas
+        :return: starts, ends (arrays in the same order as the subscanpaths)
+        '''
+        length = len(self.__offsets) - 1
+        starts = np.repeat(np.arange(length), np.arange(length, 0, -1))
+        return starts, starts + 1 + np.arange(len(self)) - self.__offsets[starts]
+
+    def get_scanpath(self):
+        return self.__scanpath
+
+
+class Density_Pyramid:
+    '''
+    The density of the fixations of a puzzle at every resolution.
+    The finest level counts the fixations per pixel and is stored as a summed-area table
+    (cumulative sums over both axes), so every coarser bin is the sum of the pixels it covers,
+    taken from the 4 corners of the bin in the table.
+    The table is the only array that is kept. It holds integers (counts or durations in whole ms),
+    int32 when the total fits in it, so a 1920 x 1200 map takes about 9 MB instead of 18 MB
+
+    :author: Yuri Maas
+    '''
+    def __init__(self, x, y, width, height, weights= None):
+        '''
+        :param x: The x coordinates of the fixations
+        :param y: The y coordinates of the fixations
+        :param width: The width of the map
+        :param height: The height of the map
+        :param weights: The weight of every fixation (for example the duration), None to count the fixations
+        '''
+        self.__width = width
+        self.__height = height
+        # Pixel i holds the fixations with i <= coordinate < i + 1, fixations outside the map are left out
+        columns = int(np.floor(width)) + 1
+        rows = int(np.floor(height)) + 1
+        x = np.asarray(x, dtype= float)
+        y = np.asarray(y, dtype= float)
+        inside = (x >= 0) & (x <= width) & (y >= 0) & (y <= height)
+        pixels = np.floor(y[inside]).astype(int) * columns + np.floor(x[inside]).astype(int)
+        weights = None if weights is None else np.asarray(weights, dtype= float)[inside]
+        counts = np.bincount(pixels, weights, minlength= rows * columns).reshape(rows, columns)
+        # The durations are whole milliseconds, other weights keep their fractions
+        if weights is None or np.array_equal(weights, np.round(weights)):
+            dtype = np.int32 if counts.sum() <= np.iinfo(np.int32).max else np.int64
+            counts = np.rint(counts).astype(dtype)
+        self.__table = np.zeros((rows + 1, columns + 1), dtype= counts.dtype)
+        np.cumsum(counts, axis= 0, out= counts)
+        np.cumsum(counts, axis= 1, out= self.__table[1:, 1:])
+
+    def get_bins(self, bin_size):
+        '''
+        Sums the pixels into bin_size x bin_size equally sized bins,
+        a pixel belongs to the bin its lower-left corner is in (like np.histogram2d for whole pixel coordinates)
+
+        :author: Yuri Maas
+        :param bin_size: The amount of bins on both axes
+        :return: z (a row per y bin), the centers of the x bins, the centers of the y bins
+        '''
+        x_edges = np.linspace(0, self.__width, bin_size + 1)
+        y_edges = np.linspace(0, self.__height, bin_size + 1)
+        # The first pixel of every bin, the last bin also gets the pixel on the edge of the map
+        x_bounds = np.ceil(x_edges).astype(int)
+        y_bounds = np.ceil(y_edges).astype(int)
+        x_bounds[-1] = self.__table.shape[1] - 1
+        y_bounds[-1] = self.__table.shape[0] - 1
+        corners = self.__table[y_bounds][:, x_bounds]
+        z = corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+        return z, (x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2
+
+
+class Matrix_Cache:
+    '''
+    Cache for computed adjacency matrices, so the same matrix is never computed twice.
+    Has 2 levels: the most recently used matrices in memory and all matrices on disk (shared by all processes).
+    Both levels remove the least recently used matrices when they get bigger than their maximum size
 
     :author: Yuri Maas
     '''
-    def __init__(self):
-        # On tool start, there shouldn't be any graphs loaded in.
-        self.__graphs = [None, None, None, None]
+    def __init__(self, folder= cachefolder + 'matrices/', memory_size= 512 * 2 ** 20, disk_size= 4 * 2 ** 30):
+        self.__folder = folder
+        self.__memory_size = memory_size
+        self.__disk_size = disk_size
+        self.__matrices = OrderedDict()
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+        self.__statistics = {'memory hits': 0, 'disk hits': 0, 'misses': 0}
+        os.makedirs(folder, exist_ok= True)
+
+    @staticmethod
+    def key(stimulus, adj_type, compare_method, user, fingerprint, ordering= None):
+        '''
+        Creates the key of a matrix
 
-    def get_graph(self, graph_id):
-        return self.__graphs[graph_id]
+        :author: Yuri Maas
+        :param stimulus: The puzzle of the matrix
+        :param adj_type: The type of adjacency matrix (puzzle or user)
+        :param compare_method: The comparison method
+        :param user: The user of a 'user' adjacency matrix (None for 'puzzle')
+        :param fingerprint: The fingerprint of the data (see Data.get_fingerprint)
+        :param ordering: The ordering of an ordered matrix (see Ordering), None for the computed (unordered) matrix
+        :return: Hexadecimal hash
+        '''
+        parts = [stimulus, adj_type, compare_method, user, fingerprint]
+        if ordering is not None:
+            parts.append(ordering)
+        return hashlib.sha1(json.dumps(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        '''
+        Returns the matrix with the key, from memory or else from disk
+
+        :author: Yuri Maas
+        :param key: The key of the matrix (see key)
+        :return: (labels, matrix), None if the matrix is not in the cache
+        '''
+        with self.__lock:
+            if key in self.__matrices:
+                self.__matrices.move_to_end(key)
+                self.__statistics['memory hits'] += 1
+                return self.__matrices[key]
+
+        file = os.path.join(self.__folder, key + '.npz')
+        try:
+            with np.load(file) as stored:
+                labels, matrix = [str(label) for label in stored['labels']], stored['matrix']
+            # The modification time is used as last time of use
+            os.utime(file)
+        except (OSError, KeyError, ValueError):
+            with self.__lock:
+                self.__statistics['misses'] += 1
+            return None
+        with self.__lock:
+            self.__statistics['disk hits'] += 1
+        self.__remember(key, labels, matrix)
+        return labels, matrix
+
+    def set(self, key, labels, matrix):
+        '''
+        Stores a matrix in memory and on disk
+
+        :author: Yuri Maas
+        :param key: The key of the matrix (see key)
+        :param labels: The labels of the rows and columns
+        :param matrix: The matrix
+        '''
+        self.__remember(key, labels, matrix)
+        file = os.path.join(self.__folder, key + '.npz')
+        temporary = '{}.{}.{}.tmp'.format(file, os.getpid(), threading.get_ident())
+        with open(temporary, 'wb') as stored:
+            np.savez(stored, labels= np.asarray(labels, dtype= str), matrix= matrix)
+        os.replace(temporary, file)
+        self.__evict_disk()
+
+    def get_statistics(self):
+        '''
+        Returns the hit and miss counters and the size of the cache
+
+        :author: Yuri Maas
+        :return: {'memory hits': #, 'disk hits': #, 'misses': #, 'matrices in memory': #, 'bytes in memory': #}
+        '''
+        with self.__lock:
+            return dict(self.__statistics, **{'matrices in memory': len(self.__matrices),
+                                              'bytes in memory': self.__bytes})
 
-    def set_graph(self, graph_id, graph):
-        self.__graphs[graph_id] = graph
+    def __remember(self, key, labels, matrix):
+        size = matrix.nbytes + sum(len(label) for label in labels)
+        with self.__lock:
+            if key in self.__matrices:
+                return
+            self.__matrices[key] = (labels, matrix)
+            self.__bytes += size
+            # Remove the least recently used matrices, but always keep the newest
+            while self.__bytes > self.__memory_size and len(self.__matrices) > 1:
+                old_labels, old_matrix = self.__matrices.popitem(last= False)[1]
+                self.__bytes -= old_matrix.nbytes + sum(len(label) for label in old_labels)
 
-    def reset_graph(self, graph_id):
-        self.__graphs[graph_id] = None
\ No newline at end of file
+    def __evict_disk(self):
+        files = []
+        for name in os.listdir(self.__folder):
+            if name.endswith('.npz'):
+                try:
+                    status = os.stat(os.path.join(self.__folder, name))
+                    files.append((status.st_mtime, status.st_size, name))
+                except OSError:
+                    # Removed by another process in the meantime
+                    continue
+        total = sum(size for time, size, name in files)
+        # Remove the least recently used files, but always keep the newest
+        for time, size, name in sorted(files)[:-1]:
+            if total <= self.__disk_size:
+                break
+            try:
+                os.remove(os.path.join(self.__folder, name))
+            except OSError:
+                pass
+            total -= size
@@ -5,7 +5,18 @@ import dash_core_components as dcc
 import dash_html_components as html
 import plotly.graph_objs as go
 
-from Storage import Data
+from Storage import Data, Matrix_Cache
+from Similarity import Similarity
+from Images import Images
+from Ordering import Ordering
+
+# Adjacency matrices with more rows than this are sent as an overview of blocks,
+# zooming in fetches the part that is shown in at most detail_cells x detail_cells cells
+detail_cells = 400
+# Up to this amount of rows the labels are shown on the axes of a part of a big adjacency matrix
+detail_labels = 40
+# How often (in ms) the browser asks for the progress of an adjacency matrix that is computed in the background
+job_poll_interval = 1000
 
 
 class Layout:
@@ -18,75 +29,53 @@ class Layout:
     @staticmethod
     def no_graphs():
         '''
-        Creates a layout for the 'Plots' section for a Dash Application without any graphs
-        This is also the default layout, showing this layout at startup.
+        Creates the text for the 'Plots' section for a Dash Application without any graphs
+        This is also the default layout, showing this text at startup.
 
         :author: Yuri Maas
         :return: Some text
         '''
         return [
-            html.H1('Plots'),
             html.H3('There are currently no plots,'),
             html.H3('choose options from the Input panel on the left')
         ]
 
     @staticmethod
-    def single_graph(graph):
+    def panels():
         '''
-        Creates a layout for the 'Plots' section for a Dash Application based on an input graph
+        Creates the layout for the 'Plots' section, with all four panels in it.
+        The panels are only hidden (see panel_style) when fewer panels are used,
+        so every panel is updated on its own (graph1 - graph4) and keeps its graph in the browser
 
         :author: Yuri Maas
-        :param graph: The graph that should be shown
         :return: The layout for the 'Plots' section of the Dash application
         '''
         return [
             html.H1('Plots'),
 
             html.Div(
-                id= 'graph1',
-                style = {
-                    'width': '98%',
-                    'display': 'inline-block'
-                },
-                children = [
-                    # The graph to be shown
-                    graph
-                ]
+                id= 'Visualization-empty',
+                children= Layout.no_graphs()
             ),
-        ]
-
-    @staticmethod
-    def four_graphs(graph1, graph2, graph3, graph4):
-        '''
-        Creates a layout for the 'Plots' section for a Dash Application based on an input graph
-        Should be called by a callback on the children of the section with id='Visualization'
-        Doesn't generate any graphs
-
-        :author: Yuri Maas
-        :param list_of_graphs: An array with graphs that should be shown in the 'Plots' section
-        :return: The layout for the 'Plots' section of the Dash application
-        '''
-        return [
-            html.H1('Plots'),
 
             ### The first column of graphs
             html.Div(
                 id= 'Visualization-C1',
-                style = {
-                    'width': '48%',
-                    'display': 'inline-block',
-                },
+                style= Layout.panel_style('Visualization-C1', None),
                 children= [
                     html.Div(
-                        id= 'graph1',
-                        children = graph1
+                        id= 'graph1'
                     ),
-                    html.Hr(),
-
                     html.Div(
-                        # Graph3 because it's bottom-left
-                        id= 'graph3',
-                        children = graph3
+                        id= 'Visualization-C1-bottom',
+                        style= Layout.panel_style('Visualization-C1-bottom', None),
+                        children= [
+                            html.Hr(),
+                            html.Div(
+                                # Graph3 because it's bottom-left
+                                id= 'graph3'
+                            ),
+                        ]
                     ),
                 ]
             ),
@@ -94,26 +83,53 @@ class Layout:
             ### The second column of graphs
             html.Div(
                 id= 'Visualization-C2',
-                style={
-                    'width': '48%',
-                    'display': 'inline-block',
-                },
+                style= Layout.panel_style('Visualization-C2', None),
                 children= [
                     html.Div(
                         # Graph 2 because it's top-right
-                        id='graph2',
-                        children = graph2
+                        id='graph2'
                     ),
                     html.Hr(),
 
                     html.Div(
-                        id='graph4',
-                        children = graph4
+                        id='graph4'
                     ),
                 ]
             )
         ]
 
+    @staticmethod
+    def panel_style(element, amount_panels):
+        '''
+        Returns the style of a part of the 'Plots' section for an amount of panels,
+        1 panel uses the top of the first column, 4 panels use both columns
+
+        :author: Yuri Maas
+        :param element: The id of the part ('Visualization-empty', 'Visualization-C1',
+                        'Visualization-C1-bottom' or 'Visualization-C2')
+        :param amount_panels: The amount of panels (1 or 4), anything else shows the text of no_graphs
+        :return: Style dictionary
+        '''
+        hidden = {'display': 'none'}
+        column = {'width': '48%', 'display': 'inline-block'}
+        styles = {
+            1: {
+                'Visualization-empty': hidden,
+                'Visualization-C1': {'width': '98%', 'display': 'inline-block'},
+                'Visualization-C1-bottom': hidden,
+                'Visualization-C2': hidden,
+            },
+            4: {
+                'Visualization-empty': hidden,
+                'Visualization-C1': column,
+                'Visualization-C1-bottom': {},
+                'Visualization-C2': column,
+            },
+        }
+        if amount_panels not in styles:
+            return {} if element == 'Visualization-empty' else hidden
+        return styles[amount_panels][element]
+
     @staticmethod
     def select_puzzle(dataset, initial_map= None):
         '''
@@ -176,13 +192,25 @@ class Layout:
                 id='Input-add_options-metro_map',
                 options=[
                     {'label': 'Gaze plot', 'value': 'gaze'},
+                    {'label': 'Fast gaze plot (WebGL)', 'value': 'gaze_fast'},
                     {'label': 'Heatmap', 'value': 'attention'}
                 ],
                 labelStyle={'display': 'inline-block',
                             'marginRight': 80}
             ),
+            # Fixations shorter than this are left out of the fast gaze plot
+            html.Label('Fast gaze plot: shortest fixation (ms)'),
+            dcc.Slider(
+                id='Input-add_options-gaze_duration',
+                included=False,
+                min=0,
+                max=500,
+                step=50,
+                value=0,
+                marks={i: '{}'.format(i) for i in range(0, 501, 100)},
+            ),
             # Dropdown menu for choosing the colors for the heatmap
-            html.Label('Heatmap Color'),
+            html.Label('Heatmap Color', style={'marginTop': 30}),
             dcc.Dropdown(
                 id='Input-add_options-gaze_color',
                 options=[
@@ -209,6 +237,18 @@ class Layout:
                 value=20,
                 marks={i: '{}'.format(i) for i in range(5, 51) if (i + 10) % 15 == 0},
             ),
+            # What the heatmap shows: the amount of fixations or the time spend looking
+            html.Label('Heatmap Density', style={'marginTop': 30}),
+            dcc.RadioItems(
+                id='Input-add_options-heatweight',
+                options=[
+                    {'label': 'Fixations', 'value': 'count'},
+                    {'label': 'Duration', 'value': 'duration'}
+                ],
+                value='count',
+                labelStyle={'display': 'inline-block',
+                            'marginRight': 80}
+            ),
 
             # Section with the dropdown menu for choosing a puzzle to visualize (including picture underneath)
             html.Hr(style={'marginTop': 20}),
@@ -245,6 +285,7 @@ class Layout:
                 options=[
                     {'label': 'Bounding box', 'value': 'Bounding Box'},
                     {'label': 'Euclidean distance', 'value': 'the Euclidean Distance'},
+                    {'label': 'Jaccard similarity', 'value': 'the Jaccard Similarity'},
                 ],
                 labelStyle={'display': 'inline-block',
                             'marginRight': 80}
@@ -272,15 +313,25 @@ class Layout:
             html.Label('Ordering'),
             dcc.Dropdown(
                 id='Input-add_options-adjacency_order',
-                options=[
-                    {'label': 'No ordering', 'value': 'no'},
-                    {'label': 'Alphabetical ordering', 'value': 'alphabet'},
-                ],
+                options= Ordering.options(),
                 searchable= False,
                 clearable= False,
                 value= 'no',
             ),
 
+            # How the blocks of the overview of a big matrix are made
+            html.Label('Overview of big matrices'),
+            dcc.RadioItems(
+                id='Input-add_options-adjacency_detail',
+                options=[
+                    {'label': 'Mean', 'value': 'mean'},
+                    {'label': 'Maximum', 'value': 'max'},
+                ],
+                value= 'mean',
+                labelStyle={'display': 'inline-block',
+                            'marginRight': 80}
+            ),
+
             # The puzzle selection (and user if choosen)
             html.Hr(),
             html.Div(
@@ -300,6 +351,18 @@ class Graphs:
 
     :author: Yuri Maas
     '''
+    # The comparison methods of the adjacency matrix (anything else is compared randomly)
+    compare_methods = ['Bounding Box', 'the Euclidean Distance', 'the Jaccard Similarity']
+    # The color scales of the adjacency matrix (Using standard colors, because they are good enough)
+    adjacency_colors = {
+        'def': 'RdBu',
+        'hot': 'Hot',
+        'green': 'Greens',
+        'vir': 'Viridis',
+        'elec': 'Electric',
+        'rainbow': 'Rainbow',
+    }
+
     @staticmethod
     def puzzle_image(puzzle):
         '''
@@ -314,14 +377,19 @@ class Graphs:
             style= {
                 'width': '100%'
             },
-            src= '/MetroMapsEyeTracking/stimuli/' + puzzle
+            src= Images.url(puzzle, 'panel')
         )
 
     ############### Start Adjacency Matrix ######################################################
     @staticmethod
-    def basic_adjacency(dataset, new_mapname, adj_type, compare_method, colortype, ordering, input_user):
+    def basic_adjacency(dataset, new_mapname, adj_type, compare_method, colortype, ordering, input_user,
+                        workers= 1, cache= None, aggregate= 'mean', panel= 0, jobs= None):
         '''
-        Creates an adjacency matrix graph for the Plots panel
+        Creates an adjacency matrix graph for the Plots panel.
+        Matrices with more than detail_cells rows are shown as an overview of blocks (see detail_graph).
+        With a Job_Queue (and a cache) a matrix with more than detail_cells rows that isn't in the cache yet
+        is computed in the background, the graph is then a placeholder that shows the progress until the matrix
+        is done (see adjacency_job). Smaller matrices and the random comparison are computed before returning
 
         :author: Yuri Maas
         :param dataset: The data to use to create the adjacency matrix
@@ -330,59 +398,79 @@ class Graphs:
         :param compare_method: Which method to use to grade 2 paths on
         :param colortype: The color the heatmap should be
         :param ordering: The reorder algorithm that should be used
+        :param workers: The amount of processes to compute the matrix with
+        :param cache: Matrix_Cache to take the matrix from or store it in, None to always compute it
+        :param aggregate: How the blocks of the overview of a big matrix are made ('mean' or 'max')
+        :param panel: The panel (0 - 3) the graph is shown in
+        :param jobs: Job_Queue to compute the matrix in, None to compute it before returning
         :return: Heatmap object which shows the adjacency matrix for all paths of a certain puzzle
         '''
-        # Get the fixation data for the puzzle
-        if adj_type == 'puzzle':
-            all_paths = dataset.get_puzzle_data(new_mapname)
-            labels = [all_paths[i]['user'].unique()[0] for i in range(len(all_paths))]
-        elif adj_type == 'user':
-            all_paths = dataset.get_subscanpaths(new_mapname, input_user)
-            labels = ['Length: {} from {}'.format(len(scan), scan.index[0]) for scan in all_paths]
+        view = {
+            'puzzle': new_mapname,
+            'adj_type': adj_type,
+            'compare_method': compare_method,
+            'user': input_user if adj_type == 'user' else None,
+            'ordering': ordering,
+            'aggregate': aggregate if aggregate in ['mean', 'max'] else 'mean',
+            'colortype': colortype,
+            'title': 'Adjacency Matrix of {} based on {}'.format(new_mapname[3:-4], compare_method),
+            'panel': panel,
+        }
+        if cache is not None and compare_method in Graphs.compare_methods:
+            # The ordered matrix is kept in the cache, so the parts can be taken from it when zooming in
+            view['key'] = Matrix_Cache.key(new_mapname, adj_type, compare_method, view['user'],
+                                           dataset.get_fingerprint(new_mapname), ordering)
+            # Small matrices take a moment to compute, only big ones are worth a job (or the cache)
+            if Graphs.adjacency_size(dataset, new_mapname, adj_type, view['user']) > detail_cells:
+                stored = cache.get(view['key'])
+                if stored is not None:
+                    return Graphs.adjacency_graph(view, *stored)
+                # Ordering a computed matrix doesn't need a job either (see adjacency_matrix)
+                computed = Matrix_Cache.key(new_mapname, adj_type, compare_method, view['user'],
+                                            dataset.get_fingerprint(new_mapname))
+                if jobs is not None and cache.get(computed) is None:
+                    return Graphs.job_placeholder(view, Graphs.submit_adjacency(dataset, view, workers, cache, jobs))
 
-        # Set-up a matrix with only zeros to fill in
-        matrix = np.zeros((len(labels), len(labels)))
+        # The random comparison is different every time, so that one gets no key and is never cached
+        labels, matrix = Graphs.adjacency_matrix(dataset, new_mapname, adj_type, compare_method, input_user,
+                                                 workers, cache)
+        # Order the matrix
+        labels, matrix = Ordering.reorder(ordering, labels, matrix, adj_type)
+        if 'key' in view and len(labels) > detail_cells:
+            cache.set(view['key'], labels, matrix)
+        return Graphs.adjacency_graph(view, labels, matrix)
 
-        for i in range(len(labels)):
-            path1 = all_paths[i]
-            for j in range(i, len(labels)):
-                path2 = all_paths[j]
-                similarity = np.round(Graphs.compare(compare_method, path1, path2), 4)
-                matrix[i, j] = similarity
-                matrix[j, i] = similarity
+    @staticmethod
+    def adjacency_size(dataset, new_mapname, adj_type, input_user):
+        '''
+        Returns the amount of rows of an adjacency matrix without computing it
+
+        :author: Yuri Maas
+        :param dataset: The data to use to create the adjacency matrix
+        :param new_mapname: The puzzle to use
+        :param adj_type: The type of adjacency matrix (Puzzle or User)
+        :param input_user: The user of a 'user' adjacency matrix
+        :return: The amount of users of the puzzle or the amount of subscanpaths of the user
+        '''
+        if adj_type == 'user':
+            return len(dataset.get_subscanpaths(new_mapname, input_user))
+        return len(dataset.get_puzzle_users(new_mapname))
+
+    @staticmethod
+    def adjacency_graph(view, labels, matrix):
+        '''
+        Creates the graph of an (ordered) adjacency matrix,
+        as an overview of blocks (see detail_graph) if it has more than detail_cells rows
+
+        :author: Yuri Maas
+        :param view: The settings of the matrix (see basic_adjacency)
+        :param labels: The labels of the (ordered) matrix
+        :param matrix: The (ordered) matrix
+        :return: The graph
+        '''
+        if len(labels) > detail_cells:
+            return Graphs.detail_graph(dict(view, length= len(labels)), labels, matrix, view['panel'])
 
-        # Order the matrix
-        if ordering == 'alphabet':
-            labels, matrix = Graphs.reorder_alphabet(labels, matrix, adj_type)
-
-        # Determine the hovertext
-        text= []
-        for x in range(len(all_paths)):
-            midterm= []
-            for y in range(len(all_paths)):
-                if adj_type == 'puzzle':
-                    midterm.append('Similarity of user {} and {} = {}'.format(
-                        labels[x],
-                        labels[y],
-                        matrix[x, y],
-                    ))
-                elif adj_type == 'user':
-                    midterm.append('Similarity of scanpath with {} and scanpath with {} = {}'.format(
-                        labels[x],
-                        labels[y],
-                        matrix[x, y],
-                    ))
-                text.append(midterm)
-
-        # Determine the color scale of the matrix (Using standard colors, because they are good enough)
-        colordict = {
-            'def': 'RdBu',
-            'hot': 'Hot',
-            'green': 'Greens',
-            'vir': 'Viridis',
-            'elec': 'Electric',
-            'rainbow': 'Rainbow',
-        }
         return dcc.Graph(
             id= 'adjacency-matrix',
             clear_on_unhover= True,
@@ -396,71 +484,418 @@ class Graphs:
                     'toggleSpikelines',
                     'sendDataToCloud'],
             },
-            figure= {
-                'data': [
-                    {
-                        'z': matrix,
-                        'x': labels,
-                        'y': labels,
-                        'type': 'heatmap',
-                        'colorscale': colordict[colortype],
-                        'colorbar': {
-                            'showticklabels': False,
-                            'title': 'Low <--- (Similarity) ---> High',
-                            'titleside': 'right',
-                        },
-                        'hoverinfo': 'text',
-                        'text': text
-                    }
-                ],
-                'layout': go.Layout(
-                    title= 'Adjacency Matrix of {} based on {}'.format(new_mapname[3:-4], compare_method),
-                    yaxis= dict(autorange= 'reversed')
-                )
-            }
+            figure= Graphs.adjacency_figure(labels, matrix, view['adj_type'], view['colortype'], view['title'])
         )
 
     @staticmethod
-    def reorder_alphabet(labels, matrix, adj_type):
+    def submit_adjacency(dataset, view, workers, cache, jobs):
         '''
-        Reorders the rows and columns of the adjacency matrix so that the labels are in alphabetical order
+        Starts the background job that computes and orders an adjacency matrix and puts it in the cache with the key
+        of the view. Asking for a matrix that is already being computed doesn't start another job (see Job_Queue)
 
         :author: Yuri Maas
-        :param labels: The labels of the axis of the matrix
-        :param matrix: The matrix to reorder
-        :return: The labels in alphabetical order with the associated matrix
+        :param dataset: The data to use to create the adjacency matrix
+        :param view: The settings of the matrix (see basic_adjacency)
+        :param workers: The amount of processes to compute the matrix with
+        :param cache: Matrix_Cache to put the matrix in
+        :param jobs: Job_Queue to compute the matrix in
+        :return: The status of the job
+        '''
+        def job(progress):
+            labels, matrix = Graphs.adjacency_matrix(dataset, view['puzzle'], view['adj_type'], view['compare_method'],
+                                                     view['user'], workers, cache, progress)
+            labels, matrix = Ordering.reorder(view['ordering'], labels, matrix, view['adj_type'])
+            cache.set(view['key'], labels, matrix)
+        return jobs.submit(view['key'], job, view['title'])
+
+    @staticmethod
+    def job_placeholder(view, status):
+        '''
+        Creates the placeholder of an adjacency matrix that is computed in the background.
+        The interval makes the browser ask for the progress (see adjacency_job) until the graph replaces the placeholder
+
+        :author: Yuri Maas
+        :param view: The settings of the matrix (see basic_adjacency)
+        :param status: The status of the job (see Job_Queue)
+        :return: Div with the progress, the interval and the view
+        '''
+        panel = view['panel']
+        return html.Div(
+            id= {'type': 'adjacency-job', 'panel': panel},
+            children= [
+                html.H3(view['title']),
+                html.P(
+                    id= {'type': 'adjacency-job-status', 'panel': panel},
+                    children= Graphs.job_text(status)
+                ),
+                dcc.Interval(
+                    id= {'type': 'adjacency-job-interval', 'panel': panel},
+                    interval= job_poll_interval
+                ),
+                dcc.Store(
+                    id= {'type': 'adjacency-job-view', 'panel': panel},
+                    data= view
+                ),
+            ]
+        )
+
+    @staticmethod
+    def adjacency_job(dataset, view, workers, cache, jobs):
+        '''
+        Checks on the background job of a placeholder (see job_placeholder).
+        The request can end up in another process of the server than the one with the job,
+        then the status comes from the status file of the job or, once it is done, the matrix from the disk cache.
+        If no process has the job anymore (and the matrix isn't in the cache) it is started again
+
+        :author: Yuri Maas
+        :param dataset: The data to use to create the adjacency matrix
+        :param view: The settings of the matrix (see basic_adjacency)
+        :param workers: The amount of processes to compute the matrix with
+        :param cache: Matrix_Cache the job puts the matrix in
+        :param jobs: Job_Queue of this process
+        :return: (graph, None) when the job is done or has failed, (None, text with the progress) otherwise
+        '''
+        # The status first, a job that finishes in between is then found in the cache
+        status = jobs.status(view['key'])
+        stored = cache.get(view['key'])
+        if stored is not None:
+            return Graphs.adjacency_graph(view, *stored), None
+        if status is None or status['state'] == 'done':
+            status = Graphs.submit_adjacency(dataset, view, workers, cache, jobs)
+        if status['state'] == 'failed':
+            return html.H3(Graphs.job_text(status)), None
+        return None, Graphs.job_text(status)
+
+    @staticmethod
+    def job_text(status):
+        '''
+        Describes the status of a background job
+
+        :author: Yuri Maas
+        :param status: The status of the job (see Job_Queue)
+        :return: Text
+        '''
+        if status['state'] == 'failed':
+            return 'Computing the matrix failed ({})'.format(status['error'])
+        if status['state'] == 'queued':
+            text = 'Waiting for a free worker to compute the matrix'
+        elif status['total'] and status['done'] >= status['total']:
+            text = 'Ordering the matrix'
+        elif status['total']:
+            text = 'Computing the matrix: {:.0%}'.format(status['done'] / status['total'])
+        else:
+            text = 'Computing the matrix'
+        if status['other process']:
+            text += ' (in another process of the server)'
+        return text
+
+    @staticmethod
+    def adjacency_figure(labels, matrix, adj_type, colortype, title):
+        '''
+        Creates the figure of an adjacency matrix.
+        The hovertext is a template the browser fills in with the labels of the axes and the value of the cell,
+        so only the labels are sent once per axis instead of a text for every cell
+
+        :author: Yuri Maas
+        :param labels: The labels of the axes of the matrix
+        :param matrix: The (ordered) adjacency matrix
+        :param adj_type: The type of adjacency matrix (Puzzle or User)
+        :param colortype: The color the heatmap should be
+        :param title: The title of the figure
+        :return: The figure of a dcc.Graph
         '''
-        # Function to go from the user name (p#) to an integer for sorting purposes if axis has user names
         if adj_type == 'puzzle':
-            def remove_p(element):
-                return int(element.strip('p'))
+            hovertemplate = 'Similarity of user %{y} and %{x} = %{z}<extra></extra>'
+        else:
+            hovertemplate = 'Similarity of scanpath with %{y} and scanpath with %{x} = %{z}<extra></extra>'
+
+        return {
+            'data': [
+                {
+                    'z': matrix,
+                    'x': labels,
+                    'y': labels,
+                    'type': 'heatmap',
+                    'colorscale': Graphs.adjacency_colors[colortype],
+                    'colorbar': {
+                        'showticklabels': False,
+                        'title': 'Low <--- (Similarity) ---> High',
+                        'titleside': 'right',
+                    },
+                    'hovertemplate': hovertemplate,
+                }
+            ],
+            'layout': go.Layout(
+                title= title,
+                yaxis= dict(autorange= 'reversed')
+            )
+        }
+
+    @staticmethod
+    def detail_graph(view, labels, matrix, panel= 0):
+        '''
+        Creates the graph of a big adjacency matrix: an overview with blocks of cells,
+        with the view (what matrix it is and how to show it) in a dcc.Store next to it.
+        When the user zooms in, the callback in Dash.py sends the part that is shown (see adjacency_detail)
+
+        :author: Yuri Maas
+        :param view: The settings of the matrix (see basic_adjacency)
+        :param labels: The labels of the (ordered) matrix
+        :param matrix: The (ordered) matrix
+        :param panel: The panel (0 - 3) the graph is shown in
+        :return: Div with the graph and the store
+        '''
+        return html.Div([
+            dcc.Graph(
+                id= {'type': 'adjacency-detail', 'panel': panel},
+                config= {
+                    'modeBarButtonsToRemove': [
+                        'autoScale2d',
+                        'hoverClosestCartesian',
+                        'hoverCompareCartesian',
+                        'toggleSpikelines',
+                        'sendDataToCloud'],
+                },
+                figure= Graphs.detail_figure(view, labels, matrix, (0, len(labels)), (0, len(labels)))
+            ),
+            dcc.Store(
+                id= {'type': 'adjacency-detail-view', 'panel': panel},
+                data= view
+            ),
+        ])
+
+    @staticmethod
+    def detail_figure(view, labels, matrix, rows, columns, zoomed= None):
+        '''
+        Creates the figure of the part matrix[rows, columns] of a big adjacency matrix.
+        If the part has more than detail_cells rows or columns, the cells are combined into blocks
+        (the mean or maximum of the block), so the figure never has more than detail_cells x detail_cells cells.
+        The axes are the numbers of the rows and columns, so the zoomed ranges are positions in the matrix
+
+        :author: Yuri Maas
+        :param view: The settings of the matrix (see basic_adjacency)
+        :param labels: The labels of the (ordered) matrix
+        :param matrix: The (ordered) matrix
+        :param rows: (start, end) of the rows of the part
+        :param columns: (start, end) of the columns of the part
+        :param zoomed: The ranges of the axes the user zoomed to ((x from, x to), (y from, y to)), None for all
+        :return: The figure of a dcc.Graph
+        '''
+        (row_start, row_end), (column_start, column_end) = rows, columns
+        block = max(1, -(-max(row_end - row_start, column_end - column_start) // detail_cells))
+        z = Graphs.aggregate_blocks(matrix[row_start:row_end, column_start:column_end], block, view['aggregate'])
+
+        if block == 1:
+            hovertemplate = 'Similarity of row %{y} and column %{x} = %{z}<extra></extra>'
+        else:
+            hovertemplate = ('{} similarity of the {} x {} block of rows and columns around %{{y:.0f}} and %{{x:.0f}}'
+                             ' = %{{z}}<extra></extra>').format(view['aggregate'].capitalize(), block, block)
+        xaxis = dict(range= list(zoomed[0]) if zoomed is not None else None, showgrid= False)
+        yaxis = dict(range= list(zoomed[1])[::-1] if zoomed is not None else None,
+                     autorange= 'reversed' if zoomed is None else False, showgrid= False)
+        # Show the labels when there are only a few rows and columns
+        if block == 1 and column_end - column_start <= detail_labels:
+            xaxis.update(tickvals= list(range(column_start, column_end)), ticktext= labels[column_start:column_end])
+        if block == 1 and row_end - row_start <= detail_labels:
+            yaxis.update(tickvals= list(range(row_start, row_end)), ticktext= labels[row_start:row_end])
+        return {
+            'data': [
+                {
+                    'z': np.round(z, 4),
+                    # The center of the first block and the distance between the blocks in rows and columns
+                    'x0': column_start + (block - 1) / 2,
+                    'dx': block,
+                    'y0': row_start + (block - 1) / 2,
+                    'dy': block,
+                    'type': 'heatmap',
+                    'colorscale': Graphs.adjacency_colors[view['colortype']],
+                    'colorbar': {
+                        'showticklabels': False,
+                        'title': 'Low <--- (Similarity) ---> High',
+                        'titleside': 'right',
+                    },
+                    'hovertemplate': hovertemplate,
+                }
+            ],
+            'layout': go.Layout(
+                title= '{} ({} x {})'.format(view['title'], view['length'], view['length']),
+                xaxis= xaxis,
+                yaxis= yaxis,
+                # Keeps the zoom of the user when the part is replaced, until another matrix is shown
+                uirevision= view.get('key', view['title']),
+            )
+        }
+
+    @staticmethod
+    def aggregate_blocks(matrix, block, aggregate= 'mean'):
+        '''
+        Combines the block x block cells of a matrix into one cell, the blocks at the end may be smaller.
+        Goes over the matrix in bands of 'block' rows, so only one band is copied at a time
+
+        :author: Yuri Maas
+        :param matrix: The matrix (or a part of it)
+        :param block: The amount of rows and columns of a block
+        :param aggregate: 'mean' or 'max'
+        :return: Matrix with a cell per block
+        '''
+        if block == 1:
+            return np.asarray(matrix, dtype=float)
+        rows, columns = matrix.shape
+        column_starts = np.arange(0, columns, block)
+        widths = np.diff(np.append(column_starts, columns))
+        blocks = np.zeros((len(range(0, rows, block)), len(column_starts)))
+        for number, row in enumerate(range(0, rows, block)):
+            band = np.asarray(matrix[row:row + block], dtype=float)
+            if aggregate == 'max':
+                blocks[number] = np.maximum.reduceat(band, column_starts, axis= 1).max(axis= 0)
+            else:
+                blocks[number] = np.add.reduceat(band, column_starts, axis= 1).sum(axis= 0) / (len(band) * widths)
+        return blocks
+
+    @staticmethod
+    def adjacency_detail(dataset, view, relayout, workers= 1, cache= None):
+        '''
+        Creates the figure of the part of a big adjacency matrix the user zoomed to.
+        The matrix is taken from the cache with the key in the view and computed again if it isn't there anymore
+
+        :author: Yuri Maas
+        :param dataset: The data to use to create the adjacency matrix
+        :param view: The settings of the matrix (see basic_adjacency)
+        :param relayout: The relayoutData of the graph
+        :param workers: The amount of processes to compute the matrix with
+        :param cache: Matrix_Cache with the ordered matrix
+        :return: The figure, None if the relayout doesn't change the shown part
+        '''
+        length = view['length']
+        ranges = [Graphs.zoomed_range(relayout, axis) for axis in ['xaxis', 'yaxis']]
+        if ranges == [None, None]:
+            return None
+
+        stored = cache.get(view['key']) if cache is not None and 'key' in view else None
+        if stored is None:
+            labels, matrix = Graphs.adjacency_matrix(dataset, view['puzzle'], view['adj_type'], view['compare_method'],
+                                                     view['user'], workers, cache)
+            labels, matrix = Ordering.reorder(view['ordering'], labels, matrix, view['adj_type'])
+            if cache is not None and 'key' in view:
+                cache.set(view['key'], labels, matrix)
+        else:
+            labels, matrix = stored
+
+        if all(axis_range == 'all' for axis_range in ranges):
+            return Graphs.detail_figure(view, labels, matrix, (0, length), (0, length))
+        # An axis that isn't in the relayout (zoomed on one axis only) shows everything
+        zoomed = [(-0.5, length - 0.5) if axis_range in (None, 'all') else axis_range for axis_range in ranges]
+        # The cells that are (partly) visible, cell i goes from i - 0.5 to i + 0.5
+        columns, rows = [(int(min(max(np.floor(start + 0.5), 0), length - 1)),
+                          int(min(max(np.floor(end + 0.5) + 1, np.floor(start + 0.5) + 1, 1), length)))
+                         for start, end in zoomed]
+        return Graphs.detail_figure(view, labels, matrix, rows, columns, zoomed)
+
+    @staticmethod
+    def zoomed_range(relayout, axis):
+        '''
+        Reads the range of an axis from the relayoutData of a graph
+
+        :author: Yuri Maas
+        :param relayout: The relayoutData
+        :param axis: 'xaxis' or 'yaxis'
+        :return: (from, to), 'all' when the axis is reset, None when the axis didn't change
+        '''
+        if relayout.get(axis + '.autorange'):
+            return 'all'
+        if axis + '.range[0]' in relayout and axis + '.range[1]' in relayout:
+            return tuple(sorted([float(relayout[axis + '.range[0]']), float(relayout[axis + '.range[1]'])]))
+        if axis + '.range' in relayout:
+            return tuple(sorted(float(value) for value in relayout[axis + '.range']))
+        return None
+
+    @staticmethod
+    def adjacency_matrix(dataset, new_mapname, adj_type, compare_method, input_user, workers= 1, cache= None,
+                         progress= None):
+        '''
+        Computes the (unordered) adjacency matrix, or takes it from the cache
+
+        :author: Yuri Maas
+        :param dataset: The data to use to create the adjacency matrix
+        :param new_mapname: The puzzle to use
+        :param adj_type: The type of adjacency matrix (Puzzle or User)
+        :param compare_method: Which method to use to grade 2 paths on
+        :param input_user: The user of a 'user' adjacency matrix
+        :param workers: The amount of processes to compute the matrix with
+        :param cache: Matrix_Cache to take the matrix from or store it in, None to always compute it
+        :param progress: Function that is called with (done, total) while comparing, None to not report
+        :return: labels, matrix
+        '''
+        # The random comparison is different every time, so that one is never cached
+        if cache is not None and compare_method in Graphs.compare_methods:
+            key = Matrix_Cache.key(new_mapname, adj_type, compare_method,
+                                   input_user if adj_type == 'user' else None, dataset.get_fingerprint(new_mapname))
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
         else:
-            def remove_p(element):
-                return element
+            key = None
 
-        # Create an alphabetically sorted list of the users
-        user_sort_index= sorted(labels, key=remove_p)
-        # Check for all users what index they have in the new sorted list and make a list of those indexes
-        sort_index= [index
-                     for user in user_sort_index
-                     for index in range(len(user_sort_index))
-                     if user == labels[index]]
-        sort_matrix= np.zeros((len(sort_index), len(sort_index)))
-        # Create an elementary matrix that can reorder the columns based on the sort_index
-        for i in range(len(sort_index)):
-            sort_matrix[sort_index[i], i]= 1
+        # Get the fixation data for the puzzle
+        if adj_type == 'puzzle':
+            all_paths = dataset.get_puzzle_scanpaths(new_mapname)
+            labels = dataset.get_puzzle_users(new_mapname)
+        elif adj_type == 'user':
+            # Subscanpaths object, the subscanpaths are views on the scanpath of the user and are not copied
+            all_paths = dataset.get_subscanpaths(new_mapname, input_user)
+            labels = ['Length: {} from {}'.format(len(scan), scan.index[0]) for scan in all_paths]
 
-        # Sort the labels according to the sort_index
-        new_labels= [labels[i] for i in sort_index]
+        # Compare all the paths with each other
+        matrix = np.round(Graphs.compare_all(compare_method, all_paths,
+                                             dataset.get_resolution_X(new_mapname),
+                                             dataset.get_resolution_Y(new_mapname),
+                                             workers, progress), 4)
+        if key is not None:
+            cache.set(key, labels, matrix)
+        return labels, matrix
 
-        # Sort the matrix (matrix[sort_index] reorder the rows of the matrix)
-        # Multiplying the row-sortedmatrix with the elementmatrix to reorder the columns will give the sorted matrix
-        new_matrix= np.matmul(matrix[sort_index], sort_matrix)
-        return new_labels, new_matrix
+    @staticmethod
+    def compare_all(method, all_paths, max_X= 1920, max_Y= 1200, workers= 1, progress= None):
+        '''
+        Determines the similarity between all pairs of paths,
+        uses the batched computation from Similarity if the method has one
 
+        :author: Yuri Maas
+        :param method: The method to determine similarity
+        :param all_paths: The paths to compare (list of Scanpaths or Subscanpaths)
+        :param max_X: The width of the map
+        :param max_Y: The height of the map
+        :param workers: The amount of processes to use for the batched computations, 1 computes it in this process
+        :param progress: Function that is called with (done, total) after every block of rows, None to not report
+        :return: Symmetric matrix with the similarity of every pair of paths
+        '''
+        if method == 'Bounding Box':
+            boxes = Similarity.bounding_boxes(all_paths)
+            if workers > 1:
+                return Similarity.parallel_matrix(method, boxes, len(all_paths), max_X, max_Y, workers, progress= progress)
+            return Similarity.bounding_box_matrix(boxes, progress= progress)
+        if method == 'the Euclidean Distance':
+            ranges = Similarity.path_ranges(all_paths)
+            if workers > 1:
+                return Similarity.parallel_matrix(method, ranges, len(all_paths), max_X, max_Y, workers, progress= progress)
+            return Similarity.euclidean_matrix(*ranges, max_X, max_Y, progress= progress)
+        if method == 'the Jaccard Similarity':
+            ranges = Similarity.path_ranges(all_paths)
+            if workers > 1:
+                return Similarity.parallel_matrix(method, ranges, len(all_paths), max_X, max_Y, workers, progress= progress)
+            return Similarity.jaccard_matrix(*ranges, max_X, max_Y, progress= progress)
+
+        # The random comparison doesn't look at the paths, so all pairs are drawn at once (like adjcompare_random)
+        amount = len(all_paths)
+        matrix = np.triu(0.5 * np.random.randint(0, 2, (amount, amount))
+                         + 0.25 * np.random.binomial(2, 0.5, (amount, amount)))
+        matrix += np.triu(matrix, 1).T
+        if progress is not None:
+            progress(amount, amount)
+        return matrix
 
     @staticmethod
-    def compare(method, path1, path2):
+    def compare(method, path1, path2, max_X= 1920, max_Y= 1200):
         '''
         Calls the method to determine the similarity between path1 and path2
 
@@ -468,12 +903,16 @@ class Graphs:
         :param method: The method to determine similarity
         :param path1: Path to compare with path2
         :param path2: Path to compare with path1
+        :param max_X: The width of the map
+        :param max_Y: The height of the map
         :return: A value that resembles the similarity between path1 and path2
         '''
         if method == 'Bounding Box':
             return Graphs.adjcompare_bounding_box(path1, path2)
         if method == 'the Euclidean Distance':
-            return Graphs.adjcompare_euc_dist(path1, path2)
+            return Graphs.adjcompare_euc_dist(path1, path2, max_X, max_Y)
+        if method == 'the Jaccard Similarity':
+            return Graphs.adjcompare_jaccard(path1, path2, max_X, max_Y)
         return Graphs.adjcompare_random()
 
     @staticmethod
@@ -494,21 +933,13 @@ class Graphs:
         Calculates the bounding box overlap between two scanpaths
 
         :author: Yuri Maas & Maaike van Delft
-        :param path1: The scanpath (in DataFrame) to compare to path2
-        :param path2: The scanpath (in DataFrame) to compare to path1
+        :param path1: The scanpath (Scanpath) to compare to path2
+        :param path2: The scanpath (Scanpath) to compare to path1
         :return: A similarity value between 0 and 1
         '''
-        # Creates a box of path1
-        xmax_1 = max(path1['MappedFixationPointX'])
-        xmin_1 = min(path1['MappedFixationPointX'])
-        ymax_1 = max(path1['MappedFixationPointY'])
-        ymin_1 = min(path1['MappedFixationPointY'])
-
-        # Creates a box of path2
-        xmax_2 = max(path2['MappedFixationPointX'])
-        xmin_2 = min(path2['MappedFixationPointX'])
-        ymax_2 = max(path2['MappedFixationPointY'])
-        ymin_2 = min(path2['MappedFixationPointY'])
+        # The boxes of path1 and path2
+        xmin_1, xmax_1, ymin_1, ymax_1 = path1.get_bounding_box()
+        xmin_2, xmax_2, ymin_2, ymax_2 = path2.get_bounding_box()
 
         # Creates a box of the overlap of the boxes from path1 and 2
         xmax_box = min(xmax_1, xmax_2)
@@ -537,8 +968,8 @@ class Graphs:
         Calculates the similarity between 2 scanpaths based on the euclidean distance between the two
 
         :author: Annelies van de Wetering
-        :param path1: The scanpath (in DataFrame) to compare to path2
-        :param path2: The scanpath (in DataFrame) to compare to path1
+        :param path1: The scanpath (Scanpath) to compare to path2
+        :param path2: The scanpath (Scanpath) to compare to path1
         :return: A similarity value between 0 and 1
         '''
         x1 = np.array(path1['MappedFixationPointX'], dtype=float)
@@ -560,14 +991,34 @@ class Graphs:
         Euc_dist_tot_norm = 1 / ((len(Euc_dist_colmin) + len(Euc_dist_rowmin)) * m) * Euc_dist_tot
 
         return 1 - Euc_dist_tot_norm
+
+    @staticmethod
+    def adjcompare_jaccard(path1, path2, max_X= 1920, max_Y= 1200):
+        '''
+        Calculates the Jaccard similarity between 2 scanpaths,
+        the part of the fixations where both paths are within a margin of each other (see Similarity.jaccard)
+
+        :author: Yuri Maas
+        :param path1: The scanpath (Scanpath) to compare to path2
+        :param path2: The scanpath (Scanpath) to compare to path1
+        :param max_X: The width of the map
+        :param max_Y: The height of the map
+        :return: A similarity value between 0 and 1
+        '''
+        return Similarity.jaccard(path1['MappedFixationPointX'], path1['MappedFixationPointY'],
+                                  path2['MappedFixationPointX'], path2['MappedFixationPointY'],
+                                  max_X, max_Y)
 ############## End of Adjacency Matrix ############################################################
 ############## Start of Visual Attention Map ######################################################
     @staticmethod
-    def get_visual_attention_map(dataset, new_mapname, visual_method, color, bin_size):
+    def get_visual_attention_map(dataset, new_mapname, visual_method, color, bin_size, heat_weight= None,
+                                 min_duration= 0):
         if visual_method == 'attention':
-            return Graphs.visual_heatmap(dataset, new_mapname, color, bin_size)
+            return Graphs.visual_heatmap(dataset, new_mapname, color, bin_size, heat_weight == 'duration')
         elif visual_method == 'gaze':
             return Graphs.visual_gaze_plot(dataset, new_mapname)
+        elif visual_method == 'gaze_fast':
+            return Graphs.visual_gaze_plot_fast(dataset, new_mapname, min_duration)
         else:
             return Graphs.puzzle_image(new_mapname) #If nothing was determined, return a picture of the puzzle
 
@@ -581,94 +1032,154 @@ class Graphs:
         :param dataset: The Class object from where to take the data
         :return: Graph object with the corresponding map in it
         '''
-        imageroute = '/MetroMapsEyeTracking/stimuli/'
-        # Load in the associated data (An array of dataframes where every dataframe is 1 user)
-        data_puzzle = dataset.get_puzzle_data(new_mapname)
-        # Split the data into the x, y, duration, users and custom hover text
-        x_coords = [data_puzzle[i]['MappedFixationPointX'] for i in range(len(data_puzzle))]
-        y_coords = [data_puzzle[i]['MappedFixationPointY'] for i in range(len(data_puzzle))]
-        duration = [data_puzzle[i]['FixationDuration'] for i in range(len(data_puzzle))]
-        users = [data_puzzle[i]['user'] for i in range(len(data_puzzle))]
+        # Load in the associated data (A list of Scanpaths where every Scanpath is 1 user)
+        scanpaths = dataset.get_puzzle_scanpaths(new_mapname)
+        width, height = dataset.get_resolution_X(new_mapname), dataset.get_resolution_Y(new_mapname)
         # Creates the gaze plot graph and returns
         return dcc.Graph(
             id='single-graph',
-            config={
-                'modeBarButtonsToRemove': [
-                    'sendDataToCloud',
-                    'zoomIn2d',
-                    'zoomOut2d',
-                    'hoverClosestCartesian',
-                    'hoverCompareCartesian',
-                    'autoScale2d',
-                    'toggleSpikelines'
-                ],
-            },
+            config= Graphs.gaze_config(),
             figure= {
-                'data': [go.Scatter(x= x_coords[i],
+                'data': [go.Scatter(x= scanpath.x,
                                     # The plot has to be horizontally flipped since the y-axis goes from down to up
-                                    y= dataset.get_resolution_Y(new_mapname) - y_coords[i],
+                                    y= height - scanpath.y,
                                     mode= 'lines+markers',
-                                    name= 'User: {}'.format(next(iter(users[i]))),
+                                    name= 'User: {}'.format(scanpath.user),
                                     marker= dict(
                                         # Size of the marker depends on duration
-                                        size= np.sqrt(duration[i]),
+                                        size= np.sqrt(scanpath.duration),
                                     ),
                                     )
-                          for i in range(len(x_coords))],
-                'layout': go.Layout(
-                    images=[
-                        dict(
-                            source=imageroute + new_mapname,
-                            xref='x',
-                            yref='y',
-                            x=0,
-                            y=0,
-                            sizex=dataset.get_resolution_X(new_mapname),
-                            sizey=dataset.get_resolution_Y(new_mapname),
-                            xanchor='left',
-                            yanchor='bottom',
-                            opacity=0.8,
-                            layer='below',
-                            sizing='stretch',
-                        )
-                    ],
-                    title= 'Gaze plot of puzzle: {}'.format(new_mapname[3:-4]),
-                    hovermode= 'closest',
-                    xaxis=dict(
-                        range=[0, dataset.get_resolution_X(new_mapname)],
-                        showline= False,
-                        showgrid= False,
-                        showticklabels= False,
-                    ),
-                    yaxis=dict(
-                        range=[0, dataset.get_resolution_Y(new_mapname)],
-                        showline= False,
-                        showgrid= False,
-                        showticklabels= False,
-                    ),
-                )
+                          for scanpath in scanpaths],
+                'layout': Graphs.gaze_layout(new_mapname, width, height, 'Gaze plot of puzzle: {}'),
             }
         )
 
     @staticmethod
-    def visual_heatmap(dataset, new_mapname, color, bin_size):
+    def visual_gaze_plot_fast(dataset, new_mapname, min_duration= 0):
+        '''
+        Creates a gazeplot that is drawn with WebGL (Scattergl) instead of SVG, for puzzles with many fixations.
+        The columns of the puzzle are converted once and every user is a slice of them,
+        fixations shorter than min_duration are left out on the server (the lines connect the remaining fixations)
+
+        :author: Yuri Maas
+        :param dataset: The Class object from where to take the data
+        :param new_mapname: The name of the puzzle to be in the graph
+        :param min_duration: The shortest fixation (in ms) that is shown, 0 shows all fixations
+        :return: Graph object with the corresponding map in it
+        '''
+        scanpaths = dataset.get_puzzle_scanpaths(new_mapname)
+        width, height = dataset.get_resolution_X(new_mapname), dataset.get_resolution_Y(new_mapname)
+        data = []
+        for scanpath in scanpaths:
+            x, y, duration = scanpath.x, scanpath.y, scanpath.duration
+            if min_duration:
+                kept = duration >= min_duration
+                x, y, duration = x[kept], y[kept], duration[kept]
+            if len(x) == 0:
+                continue
+            data.append(go.Scattergl(x= x,
+                                     # The plot has to be horizontally flipped since the y-axis goes from down to up
+                                     y= height - y,
+                                     mode= 'lines+markers',
+                                     name= 'User: {}'.format(scanpath.user),
+                                     # Size of the marker depends on duration
+                                     marker= dict(size= np.round(np.sqrt(duration), 1)),
+                                     line= dict(width= 1),
+                                     ))
+        title = 'Gaze plot of puzzle: {}'
+        if min_duration:
+            title += ' (fixations of at least {} ms)'.format(min_duration)
+        return dcc.Graph(
+            id='single-graph',
+            config= Graphs.gaze_config(),
+            figure= {
+                'data': data,
+                'layout': Graphs.gaze_layout(new_mapname, width, height, title),
+            }
+        )
+
+    @staticmethod
+    def gaze_config():
+        '''
+        Returns the config of the gaze plots, the buttons that are removed from the mode bar
+
+        :author: Yuri Maas
+        :return: The config of a dcc.Graph
+        '''
+        return {
+            'modeBarButtonsToRemove': [
+                'sendDataToCloud',
+                'zoomIn2d',
+                'zoomOut2d',
+                'hoverClosestCartesian',
+                'hoverCompareCartesian',
+                'autoScale2d',
+                'toggleSpikelines'
+            ],
+        }
+
+    @staticmethod
+    def gaze_layout(new_mapname, width, height, title):
+        '''
+        Creates the layout of the gaze plots, the puzzle map is the background
+
+        :author: Yuri Maas
+        :param new_mapname: The name of the puzzle to be in the graph
+        :param width: The width of the map
+        :param height: The height of the map
+        :param title: The title, {} is replaced by the name of the puzzle
+        :return: The layout
+        '''
+        return go.Layout(
+            images=[
+                dict(
+                    source=Images.url(new_mapname, 'panel'),
+                    xref='x',
+                    yref='y',
+                    x=0,
+                    y=0,
+                    sizex=width,
+                    sizey=height,
+                    xanchor='left',
+                    yanchor='bottom',
+                    opacity=0.8,
+                    layer='below',
+                    sizing='stretch',
+                )
+            ],
+            title= title.format(new_mapname[3:-4]),
+            hovermode= 'closest',
+            xaxis=dict(
+                range=[0, width],
+                showline= False,
+                showgrid= False,
+                showticklabels= False,
+            ),
+            yaxis=dict(
+                range=[0, height],
+                showline= False,
+                showgrid= False,
+                showticklabels= False,
+            ),
+        )
+
+    @staticmethod
+    def visual_heatmap(dataset, new_mapname, color, bin_size, weighted= False):
         '''
         Creates a heatmap showing where everyone looked a lot on the map
+        The fixations are binned here instead of in the browser, so only the bin_size x bin_size bins are sent
 
         :author: Yuri Maas
         :param dataset: The Class object to take the data from
         :param new_mapname: The name of the puzzle that the graph should be based upon
         :param color: Optional color for the heatmap
+        :param bin_size: The amount of bins on both axes
+        :param weighted: False to count the fixations, True to sum their durations
         :return: Graph object to be visualized by Dash
         '''
-        # Load data
-        imageroute = '/MetroMapsEyeTracking/stimuli/'
-        data_puzzle = dataset.get_puzzle_data(new_mapname)
-        # Transform the data into X and Y point separately so they can be used
-        x_coords= [data_puzzle[i]['MappedFixationPointX'] for i in range(len(data_puzzle))]
-        x_coords= np.concatenate([array for array in x_coords], axis= 0)
-        y_coords= [data_puzzle[i]['MappedFixationPointY'] for i in range(len(data_puzzle))]
-        y_coords= np.concatenate([array for array in y_coords], axis= 0)
+        # Load data, the density comes from the density pyramid of the puzzle (already flipped like the plot)
+        z, x_centers, y_centers = dataset.get_density(new_mapname, bin_size, weighted)
         # Determine the color
         colordict = {
             'def': 'RdBu',
@@ -682,10 +1193,10 @@ class Graphs:
         return dcc.Graph(
             id= 'Visual Heatmap',
             figure= {
-                'data': [go.Histogram2d(
-                    x= x_coords,
-                    y= dataset.get_resolution_Y(new_mapname) - y_coords,
-                    customdata= new_mapname,
+                'data': [go.Heatmap(
+                    z= z,
+                    x= x_centers,
+                    y= y_centers,
                     zsmooth= 'fast',
                     colorscale= colordict[color],
                     colorbar= dict(
@@ -693,24 +1204,15 @@ class Graphs:
                         title= 'Low <--- (Density) ---> High',
                         titleside= 'right',
                     ),
-                    xbins= dict(
-                        start= 0,
-                        end= dataset.get_resolution_X(new_mapname),
-                        size= dataset.get_resolution_X(new_mapname)/ bin_size,
-                    ),
-                    ybins= dict(
-                        start= 0,
-                        end= dataset.get_resolution_Y(new_mapname),
-                        size= dataset.get_resolution_Y(new_mapname)/ bin_size,
-                    ),
-                    zmax=200,
+                    # Summed durations are much larger than counts, so those use the full color scale
+                    zmax= None if weighted else 200,
                     opacity=0.6,
                     )
                 ],
                 'layout': go.Layout(
                     images=[
                         dict(
-                            source=imageroute + new_mapname,
+                            source=Images.url(new_mapname, 'panel'),
                             xref='x',
                             yref='y',
                             x=0,